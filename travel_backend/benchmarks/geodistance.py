@@ -0,0 +1,119 @@
+"""Distance enrichment of a large places response: per-feature loop vs travel.geodistance.
+
+Builds a synthetic Geoapify response of ``--features`` places around a centre (10k by
+default) and times, over ``--repeat`` runs:
+
+- centre -> N: the per-feature ``math`` haversine the place endpoints used to run, vs
+  ``distances_from`` + ``rounded_km`` (what ``_feature_distances_km`` does)
+- N x M: a nested loop vs ``haversine_matrix`` for ``--targets`` points of interest
+
+Both sides start from the same feature dicts, so coordinate extraction is included:
+
+    python benchmarks/geodistance.py --features 10000 --targets 20 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from travel.geodistance import distances_from, haversine_matrix, rounded_km  # noqa: E402
+from travel.poi_tiles import feature_point  # noqa: E402
+
+
+def loop_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """The scalar formula the views used per feature (imports included, as before)."""
+    from math import radians, sin, cos, atan2, sqrt
+    R = 6371.0
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return R * c
+
+
+def make_features(n: int, lat: float, lon: float, seed: int) -> list:
+    rng = random.Random(seed)
+    features = []
+    for i in range(n):
+        plat, plon = lat + rng.uniform(-0.2, 0.2), lon + rng.uniform(-0.3, 0.3)
+        if i % 500 == 499:
+            # A few features without coordinates, as in real responses
+            features.append({"type": "Feature", "properties": {"name": f"Place {i}"}, "geometry": {}})
+            continue
+        features.append({
+            "type": "Feature",
+            "properties": {"place_id": f"p{i}", "name": f"Place {i}", "lat": plat, "lon": plon,
+                           "categories": ["tourism.attraction"]},
+            "geometry": {"type": "Point", "coordinates": [plon, plat]},
+        })
+    return features
+
+
+def enrich_loop(lat: float, lon: float, features: list) -> list:
+    out = []
+    for f in features:
+        props = f.get("properties", {})
+        plat = props.get("lat") or (f.get("geometry", {}).get("coordinates", [None, None])[1])
+        plon = props.get("lon") or (f.get("geometry", {}).get("coordinates", [None, None])[0])
+        distance_km = None
+        if plat and plon:
+            distance_km = loop_km(lat, lon, float(plat), float(plon))
+        out.append(round(distance_km, 2) if distance_km is not None else None)
+    return out
+
+
+def enrich_vectorized(lat: float, lon: float, features: list) -> list:
+    return rounded_km(distances_from(lat, lon, [feature_point(f) for f in features]))
+
+
+def matrix_loop(origins: list, targets: list) -> list:
+    return [[loop_km(a[0], a[1], b[0], b[1]) for b in targets] for a in origins]
+
+
+def timed(fn, repeat: int):
+    runs = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        runs.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(runs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", type=int, default=10000)
+    parser.add_argument("--targets", type=int, default=20, help="points of interest for the N x M matrix")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    lat, lon = 48.8566, 2.3522
+    features = make_features(args.features, lat, lon, args.seed)
+
+    before, loop_ms = timed(lambda: enrich_loop(lat, lon, features), args.repeat)
+    after, vector_ms = timed(lambda: enrich_vectorized(lat, lon, features), args.repeat)
+    # Rounding can differ by one unit in the last digit between the two formulas
+    worst = max((abs(a - b) for a, b in zip(before, after) if a is not None and b is not None), default=0.0)
+    assert [a is None for a in before] == [b is None for b in after]
+    print(f"centre -> {len(features)} features: loop {loop_ms:.2f} ms, vectorized {vector_ms:.2f} ms "
+          f"({loop_ms / vector_ms:.1f}x), max difference {worst:.2f} km")
+
+    origins = [p for p in (feature_point(f) for f in features) if p is not None]
+    targets = [p for p in (feature_point(f) for f in features[:args.targets]) if p is not None]
+    nested, nested_ms = timed(lambda: matrix_loop(origins, targets), max(1, args.repeat // 2))
+    matrix, matrix_ms = timed(lambda: haversine_matrix(origins, targets), args.repeat)
+    error = float(np.max(np.abs(np.asarray(nested) - matrix))) if origins and targets else 0.0
+    print(f"{len(origins)} x {len(targets)} matrix: loop {nested_ms:.2f} ms, vectorized {matrix_ms:.2f} ms "
+          f"({nested_ms / matrix_ms:.1f}x), max difference {error:.2e} km")
+
+
+if __name__ == "__main__":
+    main()
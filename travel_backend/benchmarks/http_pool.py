@@ -0,0 +1,119 @@
+"""Per-call latency of bare ``requests.get`` vs the pooled ``travel.upstream.http_get``.
+
+Starts a local keep-alive stub server (or uses ``--url``) and issues the same GETs both
+ways, sequentially and from a thread pool, so the difference is the connection setup that
+pooling saves. Against a real HTTPS provider the gap is larger, since every bare call also
+pays a TLS handshake:
+
+    python benchmarks/http_pool.py --calls 500 --threads 8
+    python benchmarks/http_pool.py --url "https://api.geoapify.com/v1/geocode/search?text=Paris&apiKey=..." --calls 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "travel_backend.settings")
+
+
+def serve_stub(latency: float) -> int:
+    """Start a keep-alive JSON stub on a free port in a daemon thread; returns the port."""
+    body = json.dumps({"features": [{"properties": {"name": "Stub", "lat": 48.85, "lon": 2.35}}]}).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Send headers and body in one segment: separate small writes on a kept-alive
+        # connection would stall on delayed ACKs and hide the pooling gain
+        wbufsize = 64 * 1024
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def measure(get, url: str, calls: int, threads: int) -> dict:
+    latencies = []
+    lock = threading.Lock()
+
+    def one(_i: int) -> None:
+        started = time.perf_counter()
+        resp = get(url)
+        resp.raise_for_status()
+        resp.json()
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    if threads <= 1:
+        for i in range(calls):
+            one(i)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, range(calls)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "calls": calls,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000, 3),
+        "calls_per_s": round(calls / wall, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="endpoint to call instead of the local stub")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8, help="thread count for the concurrent round")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub server latency in seconds")
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from travel.upstream import http_get, pool_stats
+
+    url = args.url or f"http://127.0.0.1:{serve_stub(args.latency)}/v2/places"
+    bare = lambda u: requests.get(u, timeout=(5, 30))
+    http_get(url).json()  # open the pooled connection once, as a warm worker would have
+
+    for threads in (1, args.threads):
+        label = "sequential" if threads == 1 else f"{threads} threads"
+        before = measure(bare, url, args.calls, threads)
+        after = measure(http_get, url, args.calls, threads)
+        saved = before["mean_ms"] - after["mean_ms"]
+        print(f"{label:>12}  requests.get {before}")
+        print(f"{'':>12}  http_get     {after}")
+        print(f"{'':>12}  saved {saved:.3f} ms per call ({saved / before['mean_ms'] * 100:.0f}%)")
+    print("pools", pool_stats())
+
+
+if __name__ == "__main__":
+    main()
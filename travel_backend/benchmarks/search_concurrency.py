@@ -0,0 +1,160 @@
+"""Throughput of /api/flights/search/ under concurrent load: WSGI (gunicorn) vs ASGI (uvicorn).
+
+Upstream latency is simulated by a stub SerpAPI server, so the numbers measure how many
+searches a worker can keep in flight rather than SerpAPI itself.
+
+1. Start the stub (default 300 ms per upstream call):
+
+    python benchmarks/search_concurrency.py stub --port 8765 --latency 0.3
+
+2. Start both servers against it, with result caching and the call budget off so every
+   request goes upstream:
+
+    export SERPAPI_ENDPOINT=http://127.0.0.1:8765/search FLIGHT_CACHE_TTL=0 QUOTA_ENABLED=False
+    gunicorn travel_backend.wsgi -w 2 --threads 4 -b 127.0.0.1:8001
+    uvicorn travel_backend.asgi:application --workers 2 --port 8002
+
+   ``SERPAPI_KEY`` and ``OPENAI_API_KEY`` must be set (any value works with the stub).
+
+3. Drive both with the same load (token from /api/auth/login/):
+
+    python benchmarks/search_concurrency.py run --token <token> \\
+        --wsgi-url http://127.0.0.1:8001 --asgi-url http://127.0.0.1:8002 \\
+        --concurrency 50 --requests 400
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+
+def _stub_flights(params):
+    origin = params.get("departure_id", ["JFK"])[0]
+    destination = params.get("arrival_id", ["LHR"])[0]
+    day = params.get("outbound_date", ["2025-01-01"])[0]
+    return {
+        "search_parameters": {"departure_id": origin, "arrival_id": destination, "outbound_date": day},
+        "best_flights": [
+            {
+                "flights": [{
+                    "airline": "Stub Air",
+                    "flight_number": f"SA {100 + i}",
+                    "departure_airport": {"id": origin, "time": f"{day} 0{8 + i}:00"},
+                    "arrival_airport": {"id": destination, "time": f"{day} 1{6 + i}:30"},
+                }],
+                "layovers": [],
+                "total_duration": 510 + 15 * i,
+                "price": 450 + 37 * i,
+            }
+            for i in range(3)
+        ],
+    }
+
+
+def serve_stub(port: int, latency: float) -> None:
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, like the real API, so clients can reuse pooled connections
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps(_stub_flights(parse_qs(urlparse(self.path).query))).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        # Each staged search fans out several upstream calls; the default backlog of 5 would throttle them
+        request_queue_size = 1024
+
+    server = Server(("127.0.0.1", port), Handler)
+    print(f"Stub SerpAPI on http://127.0.0.1:{port}/search (latency {latency:.3f}s)")
+    server.serve_forever()
+
+
+def run_load(base_url: str, token: str, concurrency: int, total: int) -> dict:
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+    headers = {"Authorization": f"Token {token}"}
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        nonlocal errors
+        # Distinct dates so neither the result cache nor the empty-route memo short-circuits
+        body = {
+            "origin": "JFK",
+            "destination": "LHR",
+            "departure_date": (date.today() + timedelta(days=30 + i % 300)).isoformat(),
+            "concurrent": True,
+        }
+        started = time.perf_counter()
+        try:
+            resp = session.post(f"{base_url}/api/flights/search/", json=body, headers=headers, timeout=120)
+            ok = resp.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "req_per_s": round(total / wall, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    stub = sub.add_parser("stub", help="run the stub SerpAPI server")
+    stub.add_argument("--port", type=int, default=8765)
+    stub.add_argument("--latency", type=float, default=0.3, help="seconds per upstream call")
+
+    run = sub.add_parser("run", help="load both servers and compare")
+    run.add_argument("--token", required=True)
+    run.add_argument("--wsgi-url", default="http://127.0.0.1:8001")
+    run.add_argument("--asgi-url", default="http://127.0.0.1:8002")
+    run.add_argument("--concurrency", type=int, default=50)
+    run.add_argument("--requests", type=int, default=400)
+
+    args = parser.parse_args()
+    if args.command == "stub":
+        serve_stub(args.port, args.latency)
+        return
+
+    for label, url in (("wsgi", args.wsgi_url), ("asgi", args.asgi_url)):
+        if not url:
+            continue
+        print(label, run_load(url.rstrip("/"), args.token, args.concurrency, args.requests))
+
+
+if __name__ == "__main__":
+    main()
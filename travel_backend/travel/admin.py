@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, Trip, TripItem, TripBudget, TripItinerary, UserPreference, TripPlanningStage, LiveItineraryItem
+from .models import UserProfile, Trip, TripItem, TripBudget, TripItinerary, UserPreference, TripPlanningStage, LiveItineraryItem, PriceSnapshot, TripDestinationGeo, Place, PlaceCoverage
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -69,3 +69,28 @@ class LiveItineraryItemAdmin(admin.ModelAdmin):
     def duration_minutes(self, obj):
         return obj.duration_minutes
     duration_minutes.short_description = 'Duration (min)'
+
+@admin.register(PriceSnapshot)
+class PriceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['trip', 'item_type', 'name', 'selected_price', 'price', 'lowest_price', 'checked_at']
+    list_filter = ['item_type', 'checked_at']
+    search_fields = ['trip__title', 'name', 'item_key']
+    readonly_fields = ['id', 'checked_at']
+
+@admin.register(TripDestinationGeo)
+class TripDestinationGeoAdmin(admin.ModelAdmin):
+    list_display = ['trip', 'destination', 'city', 'country_code', 'lat', 'lon', 'resolved_at']
+    search_fields = ['trip__title', 'destination', 'city']
+    readonly_fields = ['resolved_at']
+
+@admin.register(Place)
+class PlaceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'place_id', 'lat', 'lon', 'geohash', 'updated_at']
+    search_fields = ['name', 'place_id', 'geohash']
+    readonly_fields = ['updated_at']
+
+@admin.register(PlaceCoverage)
+class PlaceCoverageAdmin(admin.ModelAdmin):
+    list_display = ['geohash', 'category', 'feature_count', 'split', 'fetched_at']
+    list_filter = ['category', 'split']
+    search_fields = ['geohash', 'category']
@@ -0,0 +1,43 @@
+"""Process-wide registry of AI agents.
+
+Agents are expensive to build (LLM client, SerpAPI tool, caches), so each one is built
+once per process and reused by every request. An agent is rebuilt only when its
+configuration fingerprint changes, e.g. when an API key is rotated in the environment.
+"""
+
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+
+class AgentRegistry:
+    """Thread-safe, lazily populated map of agent name -> (fingerprint, agent)."""
+
+    def __init__(self):
+        self._agents: Dict[str, Tuple[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(*parts: Any) -> str:
+        # Hash the config so raw keys are never used as dict keys or logged
+        raw = "\x1f".join("" if p is None else str(p) for p in parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, name: str, fingerprint: str, factory: Callable[[], Any]) -> Any:
+        entry = self._agents.get(name)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        with self._lock:
+            # Another thread may have built it while we waited for the lock
+            entry = self._agents.get(name)
+            if entry is None or entry[0] != fingerprint:
+                entry = (fingerprint, factory())
+                self._agents[name] = entry
+            return entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._agents.clear()
+
+
+registry = AgentRegistry()
@@ -0,0 +1,327 @@
+"""Airport reference data and autocomplete index.
+
+``data/airports.csv`` holds every airport with an IATA code (name, city, country,
+coordinates, metropolitan area code). It is derived from the MIT-licensed airportsdata
+project (see ``data/AIRPORTS_LICENSE``) and regenerated with
+``python manage.py build_airport_data``.
+
+The file is parsed once per process, on first use. Lookups go through:
+- exact code maps (IATA and metro codes such as ``TYO`` or ``NYC``),
+- a sorted token list searched with ``bisect`` for word-prefix matches,
+- a trigram index for typo-tolerant matches when prefixes find too little.
+"""
+
+import csv
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+DATA_PATH = Path(__file__).resolve().parent / "data" / "airports.csv"
+FIELDS = ["iata", "name", "city", "subdivision", "country", "lat", "lon", "metro", "metro_city"]
+
+# Curated major airports per country (ISO 3166 alpha-2, lowercase), busiest first. They rank
+# first in autocomplete and are the origin hubs / country fallbacks used by the flight agent.
+COUNTRY_HUBS: Dict[str, List[str]] = {
+    'us': ['JFK', 'LAX', 'SFO', 'ORD', 'MIA', 'ATL', 'DFW', 'SEA', 'DEN', 'BOS', 'EWR', 'IAD'],
+    'gb': ['LHR', 'LGW', 'MAN', 'EDI'],
+    'in': ['DEL', 'BOM', 'BLR', 'MAA', 'HYD', 'CCU'],
+    'ae': ['DXB', 'AUH'],
+    'sg': ['SIN'],
+    'jp': ['HND', 'NRT', 'KIX', 'ITM'],
+    'au': ['SYD', 'MEL', 'BNE', 'PER'],
+    'de': ['FRA', 'MUC', 'BER'],
+    'fr': ['CDG', 'ORY', 'NCE'],
+    'no': ['OSL', 'BGO', 'TRD', 'SVG'],
+    'nl': ['AMS'],
+    'hk': ['HKG'],
+    'id': ['CGK', 'DPS'],
+    'kr': ['ICN', 'GMP'],
+    'th': ['BKK', 'DMK'],
+    'vn': ['SGN', 'HAN'],
+    'my': ['KUL'],
+    'it': ['FCO', 'MXP'],
+    'es': ['MAD', 'BCN'],
+    'ch': ['ZRH', 'GVA'],
+    'at': ['VIE'],
+    'cz': ['PRG'],
+    'pt': ['LIS'],
+    'gr': ['ATH'],
+    'eg': ['CAI'],
+    'ar': ['EZE'],
+    'br': ['GRU', 'GIG'],
+    'za': ['JNB', 'CPT'],
+    'cn': ['PEK', 'PVG', 'CAN'],
+    'ca': ['YYZ', 'YVR', 'YUL'],
+    'mx': ['MEX', 'CUN'],
+    'tr': ['IST'],
+    'qa': ['DOH'],
+    'nz': ['AKL'],
+}
+
+# Non-airport facilities that should never outrank a real airport
+_MINOR_MARKERS = ("heliport", "air base", "airbase", "seaplane", "air force", "army", "naval", "station")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# One- and two-letter prefixes match thousands of airports; only this many best-ranked
+# candidates per such prefix are kept, precomputed when the index is built
+_SHORT_PREFIX_CANDIDATES = 64
+
+
+def normalize(text: Any) -> str:
+    """Lowercase, strip accents and collapse punctuation to single spaces."""
+    decomposed = unicodedata.normalize("NFKD", str(text or ""))
+    ascii_text = decomposed.encode("ascii", "ignore").decode("ascii").lower()
+    return " ".join(_TOKEN_RE.findall(ascii_text))
+
+
+# Words shared by thousands of names; indexing them would make "air" or "int" match everything
+_STOPWORDS = frozenset({
+    "airport", "airports", "international", "intl", "regional", "municipal", "domestic",
+    "airfield", "aerodrome", "field", "airstrip", "all", "the", "de", "of",
+})
+
+
+def _index_terms(*parts: Any) -> str:
+    return " ".join(t for t in normalize(" ".join(str(p or "") for p in parts)).split() if t not in _STOPWORDS)
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AirportIndex:
+    """In-memory airport catalog with ranked prefix and fuzzy search."""
+
+    def __init__(self, rows: List[Dict[str, str]]):
+        self.entries: List[Dict[str, Any]] = []
+        self._by_code: Dict[str, int] = {}
+        self._metros: Dict[str, int] = {}
+        self._by_country: Dict[str, List[int]] = defaultdict(list)
+        self._static: List[float] = []
+        self._hub_rank = {code: pos for hubs in COUNTRY_HUBS.values() for pos, code in enumerate(hubs)}
+
+        metro_members: Dict[str, List[Dict[str, str]]] = defaultdict(list)
+        for row in rows:
+            self._add_airport(row)
+            if row.get("metro"):
+                metro_members[row["metro"]].append(row)
+        for code, members in metro_members.items():
+            self._add_metro(code, members)
+
+        # (token, entry index) pairs sorted by token: prefix lookup is a bisect plus a short scan
+        pairs = []
+        grams: Dict[str, List[int]] = defaultdict(list)
+        for idx, entry in enumerate(self.entries):
+            for token in set(entry["_terms"].split()):
+                pairs.append((token, idx))
+            for gram in _trigrams(entry["_fuzzy"]):
+                grams[gram].append(idx)
+        pairs.sort()
+        self._token_keys = [token for token, _ in pairs]
+        self._token_ids = [idx for _, idx in pairs]
+        self._grams = dict(grams)
+        for ids in self._by_country.values():
+            ids.sort(key=lambda i: -self._static[i])
+
+        short: Dict[str, set] = defaultdict(set)
+        for token, idx in pairs:
+            short[token[:1]].add(idx)
+            short[token[:2]].add(idx)
+        self._short = {
+            prefix: heapq.nlargest(_SHORT_PREFIX_CANDIDATES, ids, key=lambda i, p=prefix: self._score(i, p))
+            for prefix, ids in short.items()
+        }
+        self._search_cached = lru_cache(maxsize=4096)(self._search)
+
+    def _add_airport(self, row: Dict[str, str]) -> None:
+        idx = len(self.entries)
+        name, city = row["name"], row["city"]
+        entry = {
+            "code": row["iata"],
+            "name": name,
+            "city": city,
+            "country": row["country"],
+            "lat": float(row["lat"]),
+            "lon": float(row["lon"]),
+            "metro": row.get("metro") or None,
+            "type": "airport",
+        }
+        entry["_terms"] = _index_terms(row["iata"], name, city, row.get("metro_city"))
+        entry["_fuzzy"] = _index_terms(city, name)
+        entry["_city"] = normalize(city)
+        entry["_metro_city"] = normalize(row.get("metro_city"))
+        self.entries.append(entry)
+        self._by_code[row["iata"]] = idx
+        self._by_country[row["country"].lower()].append(idx)
+
+        lowered = name.lower()
+        score = 0.0
+        if row["iata"] in self._hub_rank:
+            score += 150 - 5 * self._hub_rank[row["iata"]]
+        if row.get("metro"):
+            score += 40
+        if "international" in lowered or "intl" in lowered:
+            score += 25
+        if any(marker in lowered for marker in _MINOR_MARKERS):
+            score -= 60
+        self._static.append(score)
+
+    def _add_metro(self, code: str, members: List[Dict[str, str]]) -> None:
+        idx = len(self.entries)
+        city = members[0].get("metro_city") or members[0]["city"]
+        lat = sum(float(m["lat"]) for m in members) / len(members)
+        lon = sum(float(m["lon"]) for m in members) / len(members)
+        airports = sorted((m["iata"] for m in members), key=lambda c: -self._static[self._by_code[c]])
+        self.entries.append({
+            "code": code,
+            "name": f"{city} (All Airports)",
+            "city": city,
+            "country": members[0]["country"],
+            "lat": round(lat, 5),
+            "lon": round(lon, 5),
+            "metro": code,
+            "airports": airports,
+            "type": "metro",
+            "_terms": _index_terms(code, city),
+            "_fuzzy": _index_terms(city),
+            "_city": normalize(city),
+            "_metro_city": normalize(city),
+        })
+        self._metros[code] = idx
+        # A whole metro area is a good answer for its city name, just behind its main hub
+        self._static.append(max(self._static[self._by_code[c]] for c in airports) - 1)
+
+    @staticmethod
+    def public(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in entry.items() if not k.startswith("_")}
+
+    def get(self, code: str) -> Optional[Dict[str, Any]]:
+        """Airport or metro area by code."""
+        code = str(code or "").strip().upper()
+        idx = self._by_code.get(code, self._metros.get(code))
+        return self.public(self.entries[idx]) if idx is not None else None
+
+    def metro_airports(self, code: str) -> List[str]:
+        idx = self._metros.get(str(code or "").strip().upper())
+        return list(self.entries[idx]["airports"]) if idx is not None else []
+
+    def city_airports(self, city: str, limit: int = 4) -> List[str]:
+        """IATA codes serving ``city``, best-ranked first.
+
+        An airport serves a city when every word of the query appears in its city or
+        metro-area name ("Delhi" -> New Delhi, "Buenos Aires" -> EZE in Ezeiza).
+        """
+        key = normalize(city)
+        if not key:
+            return []
+        words = set(key.split())
+        codes = []
+        for idx in self._search_cached(key, max(limit * 4, 20)):
+            entry = self.entries[idx]
+            if entry["type"] == "airport" and (words <= set(entry["_city"].split())
+                                               or words <= set(entry["_metro_city"].split())):
+                codes.append(entry["code"])
+        return codes[:limit]
+
+    def country_hubs(self, country_code: str, limit: int = 4) -> List[str]:
+        """Curated hubs for a country code, topped up with its best-ranked airports."""
+        country = str(country_code or "").strip().lower()
+        hubs = list(COUNTRY_HUBS.get(country, []))
+        for idx in self._by_country.get(country, []):
+            if len(hubs) >= limit:
+                break
+            code = self.entries[idx]["code"]
+            if code not in hubs:
+                hubs.append(code)
+        return hubs[:limit]
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Top ``limit`` airports and metro areas for an autocomplete query."""
+        return [self.public(self.entries[i]) for i in self._search_cached(normalize(query), int(limit))]
+
+    def _score(self, idx: int, q: str) -> float:
+        """Score of an entry whose terms prefix-match every token of ``q``."""
+        entry = self.entries[idx]
+        score = 400.0 + self._static[idx]
+        if entry["_city"] == q:
+            score += 150
+        elif entry["_city"].startswith(q):
+            score += 75
+        if entry["code"].lower().startswith(q):
+            score += 100
+        return score
+
+    def _prefix_ids(self, token: str) -> set:
+        start = bisect_left(self._token_keys, token)
+        ids = set()
+        keys = self._token_keys
+        for pos in range(start, len(keys)):
+            if not keys[pos].startswith(token):
+                break
+            ids.add(self._token_ids[pos])
+        return ids
+
+    def _search(self, q: str, limit: int) -> tuple:
+        if not q:
+            top = heapq.nlargest(limit, range(len(self.entries)), key=lambda i: self._static[i])
+            return tuple(top)
+
+        scores: Dict[int, float] = {}
+        upper = q.upper().replace(" ", "")
+        if upper in self._by_code:
+            scores[self._by_code[upper]] = 1000.0
+        if upper in self._metros:
+            scores[self._metros[upper]] = 990.0
+
+        tokens = q.split()
+        matched: Optional[set] = None
+        if len(tokens) == 1 and len(q) <= 2:
+            tokens = []
+            matched = set(self._short.get(q, ()))
+        for token in tokens:
+            ids = self._prefix_ids(token)
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                break
+        for idx in matched or ():
+            scores[idx] = max(scores.get(idx, 0.0), self._score(idx, q))
+
+        # Typo tolerance: only needed when prefixes came up short
+        if len(scores) < limit and len(q) >= 3:
+            query_grams = _trigrams(q)
+            overlap: Dict[int, int] = defaultdict(int)
+            for gram in query_grams:
+                for idx in self._grams.get(gram, ()):
+                    overlap[idx] += 1
+            for idx, hits in overlap.items():
+                if idx in scores:
+                    continue
+                similarity = hits / len(query_grams)
+                if similarity >= 0.5:
+                    scores[idx] = 200.0 * similarity + self._static[idx] / 3
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return tuple(idx for idx, _ in top)
+
+
+_index: Optional[AirportIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_airport_index() -> AirportIndex:
+    """Process-wide index, built from ``DATA_PATH`` on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                with open(DATA_PATH, newline="", encoding="utf-8") as f:
+                    _index = AirportIndex(list(csv.DictReader(f)))
+    return _index
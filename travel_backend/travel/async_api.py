@@ -0,0 +1,140 @@
+"""Native async endpoints that keep DRF's authentication and request parsing.
+
+``@api_view`` views are synchronous, so under ASGI every one of them occupies a thread
+for the whole upstream call. Views decorated with ``async_api_view`` run on the event
+loop instead; only the (blocking, database-backed) authentication and body parsing are
+pushed to a thread.
+
+``stream_body`` adapts an async streaming body to the server: under WSGI, Django would
+consume an async iterator completely before sending anything.
+"""
+
+import asyncio
+import functools
+import math
+import queue
+import threading
+from typing import AsyncIterator, Iterable, Iterator, Union
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def _resolve_request(request: Request) -> None:
+    # Both properties are lazy and may hit the database (token lookup, session)
+    request.user
+    request.data
+
+
+def _exception_response(exc: exceptions.APIException) -> JsonResponse:
+    response = JsonResponse({'detail': exc.detail}, status=exc.status_code)
+    # Same headers DRF's exception handler adds (e.g. 429 from travel.quota)
+    wait = getattr(exc, 'wait', None)
+    if wait is not None:
+        response['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+
+def async_api_view(methods: Iterable[str], require_auth: bool = True):
+    """Async counterpart of ``@api_view(methods)`` + ``@permission_classes([IsAuthenticated])``.
+
+    The wrapped coroutine receives a DRF ``Request`` (``request.user`` and ``request.data``
+    already resolved) and must return a Django ``HttpResponse``, e.g. ``JsonResponse``.
+    DRF ``APIException``s raised by the view are rendered like DRF would.
+    """
+    allowed = {m.upper() for m in methods}
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            if request.method not in allowed:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+            drf_request = Request(
+                request,
+                parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+            )
+            try:
+                await sync_to_async(_resolve_request)(drf_request)
+            except exceptions.APIException as exc:
+                return _exception_response(exc)
+
+            if require_auth and not (drf_request.user and drf_request.user.is_authenticated):
+                response = JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+                authenticate_header = None
+                if drf_request.authenticators:
+                    authenticate_header = drf_request.authenticators[0].authenticate_header(drf_request)
+                if authenticate_header:
+                    response['WWW-Authenticate'] = authenticate_header
+                return response
+
+            try:
+                return await view(drf_request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return _exception_response(exc)
+
+        # CSRF for session auth is enforced by DRF's SessionAuthentication, as with @api_view
+        return csrf_exempt(wrapped)
+
+    return decorator
+
+
+def _iterate_in_thread(events: AsyncIterator[str]) -> Iterator[str]:
+    """Drive ``events`` on a private loop in a helper thread, yielding items as they arrive."""
+    items: "queue.Queue[object]" = queue.Queue()
+    done = object()
+    loop = asyncio.new_event_loop()
+
+    async def pump():
+        try:
+            async for item in events:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+        finally:
+            items.put(done)
+
+    task = loop.create_task(pump())
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=run, name='stream-body', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # The client went away (or the body raised): stop the producer
+        if not task.done():
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # The loop finished (and closed) in the meantime
+                pass
+        thread.join()
+
+
+def stream_body(request: Request, events: AsyncIterator[str]) -> Union[AsyncIterator[str], Iterator[str]]:
+    """Body for ``StreamingHttpResponse`` that is sent incrementally under ASGI and WSGI.
+
+    Under ASGI the async iterator is returned as is. Under WSGI it runs on its own loop
+    in a helper thread and a sync iterator hands each item to the server as it is produced.
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        return events
+    return _iterate_in_thread(events)
@@ -0,0 +1,282 @@
+"""TTL result caches for upstream search calls (SerpAPI, Geoapify).
+
+Each cache wraps a pluggable backend:
+- ``LocalLRUBackend``: in-process LRU, fastest but private to one worker
+- ``DjangoCacheBackend``: any alias from ``settings.CACHES`` (file-based or database),
+  so every gunicorn worker shares the same entries
+
+Entries remember when they were written. A hit younger than ``ttl`` is fresh; a hit
+inside the following ``stale_ttl`` window is served immediately while a background
+thread refreshes it (stale-while-revalidate). A ``bypass`` lookup skips the read and
+overwrites the entry with a fresh value.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRUBackend:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    # Pure in-memory: safe to call directly from async code
+    blocking = False
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = max(1, int(maxsize))
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Entries dropped to stay within maxsize (expired entries are not counted)
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at and expires_at < time.time():
+                self._data.pop(key, None)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        expires_at = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class DjangoCacheBackend:
+    """Backend over a Django cache alias (e.g. FileBasedCache or DatabaseCache)."""
+
+    # File/database I/O: async callers must hop to a thread (see run_cache_io)
+    blocking = True
+
+    def __init__(self, alias: str = "shared"):
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key: str) -> Any:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        self._cache.set(key, value, timeout=int(timeout) if timeout else None)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+
+class TTLCache:
+    """Namespaced TTL cache with a stale-while-revalidate window."""
+
+    def __init__(self, namespace: str, backend, ttl: float, stale_ttl: float = 0):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = float(ttl)
+        self.stale_ttl = float(stale_ttl or 0)
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "writes": 0, "refreshes": 0, "bypassed": 0, "errors": 0}
+
+    def make_key(self, *parts: Any) -> str:
+        """Build a backend-safe key from already-normalized parts."""
+        raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+        return f"{self.namespace}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        lookups = out["hits"] + out["stale_hits"] + out["misses"]
+        out["hit_ratio"] = round((out["hits"] + out["stale_hits"]) / lookups, 3) if lookups else 0.0
+        if hasattr(self.backend, "evictions"):
+            out["evictions"] = self.backend.evictions
+        out.update({"namespace": self.namespace, "ttl": self.ttl, "stale_ttl": self.stale_ttl})
+        return out
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return ``{'value', 'age_seconds', 'stale'}`` or None when missing/expired."""
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            logger.warning("[cache:%s] backend get failed: %s", self.namespace, e)
+            self._count("errors")
+            entry = None
+        if not isinstance(entry, dict) or "t" not in entry:
+            self._count("misses")
+            return None
+        age = max(0.0, time.time() - float(entry["t"]))
+        ttl = float(entry.get("ttl", self.ttl))
+        if age <= ttl:
+            self._count("hits")
+            return {"value": entry.get("v"), "age_seconds": round(age, 1), "stale": False}
+        if age <= ttl + self.stale_ttl:
+            self._count("stale_hits")
+            return {"value": entry.get("v"), "age_seconds": round(age, 1), "stale": True}
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else float(ttl)
+        try:
+            self.backend.set(key, {"v": value, "t": time.time(), "ttl": ttl}, ttl + self.stale_ttl)
+            self._count("writes")
+        except Exception as e:
+            logger.warning("[cache:%s] backend set failed: %s", self.namespace, e)
+            self._count("errors")
+
+    def delete(self, key: str) -> None:
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            logger.warning("[cache:%s] backend delete failed: %s", self.namespace, e)
+
+    def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Any],
+        should_cache: Callable[[Any], bool] = lambda _value: True,
+        bypass: bool = False,
+        ttl_for: Optional[Callable[[Any], Optional[float]]] = None,
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """Serve ``key`` from cache or call ``fetch``; returns ``(value, cache_meta)``.
+
+        Stale hits are returned as-is and refreshed once in a background thread. With
+        ``bypass`` the cache is not read, but the fresh value is still stored.
+        ``ttl_for(value)`` overrides the TTL per value (e.g. shorter for "not found");
+        0 means do not store. Exceptions from ``fetch`` propagate and are never cached.
+        """
+        if bypass:
+            self._count("bypassed")
+        hit = None if bypass else self.get(key)
+        if hit is not None:
+            if hit["stale"]:
+                self._refresh_in_background(key, fetch, should_cache, ttl_for)
+            return hit["value"], {"hit": True, "age_seconds": hit["age_seconds"], "stale": hit["stale"]}
+        value = fetch()
+        self._store(key, value, should_cache, ttl_for)
+        return value, {"hit": False, "age_seconds": 0, "stale": False}
+
+    async def aget_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        should_cache: Callable[[Any], bool] = lambda _value: True,
+        bypass: bool = False,
+        ttl_for: Optional[Callable[[Any], Optional[float]]] = None,
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """Async ``get_or_fetch``: ``fetch`` is a coroutine function.
+
+        Backend reads/writes go through ``run_cache_io``.
+        """
+        if bypass:
+            self._count("bypassed")
+        hit = None if bypass else await run_cache_io(self, self.get, key)
+        if hit is not None:
+            if hit["stale"]:
+                # Refresh on its own loop in a thread so it outlives this request's loop
+                self._refresh_in_background(key, lambda: asyncio.run(fetch()), should_cache, ttl_for)
+            return hit["value"], {"hit": True, "age_seconds": hit["age_seconds"], "stale": hit["stale"]}
+        value = await fetch()
+        await run_cache_io(self, self._store, key, value, should_cache, ttl_for)
+        return value, {"hit": False, "age_seconds": 0, "stale": False}
+
+    def _store(self, key: str, value: Any, should_cache: Callable[[Any], bool],
+               ttl_for: Optional[Callable[[Any], Optional[float]]]) -> None:
+        if not should_cache(value):
+            return
+        ttl = ttl_for(value) if ttl_for is not None else None
+        if ttl is None or ttl > 0:
+            self.set(key, value, ttl)
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Any], should_cache: Callable[[Any], bool],
+                               ttl_for: Optional[Callable[[Any], Optional[float]]] = None) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                value = fetch()
+                self._store(key, value, should_cache, ttl_for)
+                self._count("refreshes")
+            except Exception as e:
+                logger.warning("[cache:%s] background refresh failed: %s", self.namespace, e)
+                self._count("errors")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"cache-refresh-{self.namespace}", daemon=True).start()
+
+
+async def run_cache_io(cache: Optional[TTLCache], fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a sync cache operation from async code.
+
+    File and database backends block (and Django forbids database access on the event
+    loop), so those go through ``sync_to_async``; in-memory backends are called inline.
+    """
+    if cache is not None and not getattr(cache.backend, "blocking", True):
+        return fn(*args, **kwargs)
+    return await sync_to_async(fn)(*args, **kwargs)
+
+
+_registry: Dict[str, TTLCache] = {}
+_registry_lock = threading.Lock()
+
+
+def get_cache(namespace: str, ttl: float, stale_ttl: float = 0) -> TTLCache:
+    """Return the process-wide cache for ``namespace``, creating it on first use.
+
+    The backend comes from ``settings.SEARCH_CACHE_BACKEND``: ``'local'`` for the
+    in-process LRU, otherwise the name of a ``settings.CACHES`` alias.
+    """
+    with _registry_lock:
+        cache = _registry.get(namespace)
+        if cache is None:
+            try:
+                from django.conf import settings
+                backend_name = getattr(settings, "SEARCH_CACHE_BACKEND", "local")
+                local_size = getattr(settings, "SEARCH_CACHE_LOCAL_MAX_ENTRIES", 1024)
+            except Exception:
+                backend_name, local_size = "local", 1024
+            if backend_name == "local":
+                backend = LocalLRUBackend(maxsize=local_size)
+            else:
+                backend = DjangoCacheBackend(backend_name)
+            cache = TTLCache(namespace, backend, ttl=ttl, stale_ttl=stale_ttl)
+            _registry[namespace] = cache
+        return cache
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats for every cache created through ``get_cache``."""
+    with _registry_lock:
+        caches = list(_registry.values())
+    return {c.namespace: c.stats() for c in caches}
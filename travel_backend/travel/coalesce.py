@@ -0,0 +1,279 @@
+"""Single-flight coalescing for identical concurrent upstream calls (SerpAPI, Geoapify).
+
+Callers that ask for the same key while a call for it is in flight wait for that call
+instead of issuing their own. Thread callers (``do``) share calls across threads, and an
+event-loop caller (``ado``) also joins a call a thread is making. A call started by
+``ado`` runs as a task on the caller's loop, so it is shared only with callers on that
+same loop: under WSGI every async request gets its own loop, which asgiref tears down
+(cancelling its tasks) when the request ends.
+
+With ``settings.COALESCE_LOCK_CACHE`` set to a ``settings.CACHES`` alias, the process that
+starts a call also takes a lock in that cache. Other workers then poll for its published
+result (up to ``COALESCE_LOCK_TIMEOUT`` seconds) instead of calling upstream themselves.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class CacheLockTable:
+    """Cross-worker lock and result hand-off over a Django cache alias."""
+
+    def __init__(self, alias: str, timeout: float = 30, poll_interval: float = 0.1):
+        self.alias = alias
+        self.timeout = float(timeout)
+        self.poll_interval = float(poll_interval)
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def acquire(self, key: str) -> Optional[str]:
+        """Return a lock token, or None when another worker holds the lock."""
+        token = uuid.uuid4().hex
+        return token if self._cache.add(f"lock:{key}", token, timeout=int(self.timeout) or 1) else None
+
+    def holder(self, key: str) -> Optional[str]:
+        return self._cache.get(f"lock:{key}")
+
+    def publish(self, key: str, token: str, value: Any) -> None:
+        self._cache.set(f"result:{key}:{token}", {"v": value}, timeout=int(self.timeout) or 1)
+
+    def result(self, key: str, token: str) -> Any:
+        entry = self._cache.get(f"result:{key}:{token}")
+        return entry["v"] if isinstance(entry, dict) else _MISSING
+
+    def release(self, key: str, token: str) -> None:
+        if self._cache.get(f"lock:{key}") == token:
+            self._cache.delete(f"lock:{key}")
+
+
+class _Call:
+    __slots__ = ("future", "waiters", "task")
+
+    def __init__(self):
+        self.future: Future = Future()
+        # Running futures cannot be cancelled, so one waiter giving up never fails the others
+        self.future.set_running_or_notify_cancel()
+        self.waiters = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """Share one in-flight call among concurrent callers asking for the same key."""
+
+    def __init__(self, name: str, lock_table: Optional[CacheLockTable] = None):
+        self.name = name
+        self.lock_table = lock_table
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "leaders": 0, "coalesced": 0, "remote_coalesced": 0, "errors": 0, "cancelled": 0}
+
+    def make_key(self, *parts: Any) -> str:
+        """Build a key from already-normalized parts."""
+        raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+        return f"{self.name}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["inflight"] = len(self._calls)
+        out["coalesced_ratio"] = round((out["coalesced"] + out["remote_coalesced"]) / out["calls"], 3) if out["calls"] else 0.0
+        out.update({"name": self.name, "cross_worker": self.lock_table is not None})
+        return out
+
+    def _join(self, key: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> "tuple[_Call, bool, Any]":
+        """Join or start the call for ``key``; returns ``(call, leader, slot)``.
+
+        Calls led from an event loop live under ``(loop, key)``: their task dies with
+        that loop, so only callers on it may wait for them.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            slot: Any = key
+            call = self._calls.get(key)
+            if call is None and loop is not None:
+                slot = (loop, key)
+                call = self._calls.get(slot)
+            leader = call is None
+            if leader:
+                call = self._calls[slot] = _Call()
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+            call.waiters += 1
+            return call, leader, slot
+
+    def _leave(self, key: Any, call: _Call, cancelled: bool = False) -> None:
+        with self._lock:
+            call.waiters -= 1
+            if not (cancelled and call.waiters <= 0 and call.task is not None and not call.future.done()):
+                return
+            # Nobody is waiting any more: stop the upstream call and let the next caller start afresh
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            self._stats["cancelled"] += 1
+            task = call.task
+        task.get_loop().call_soon_threadsafe(task.cancel)
+
+    def _settle(self, key: Any, call: _Call, outcome: Any = _MISSING, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        if error is not None:
+            self._count("errors")
+            call.future.set_exception(error)
+        else:
+            call.future.set_result(outcome)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Return ``fn()``, sharing the call with concurrent callers of the same key.
+
+        Exceptions raised by the shared call propagate to every caller.
+        """
+        call, leader, _slot = self._join(key)
+        try:
+            if not leader:
+                return call.future.result()
+            try:
+                value = self._lead(key, fn)
+            except BaseException as e:
+                self._settle(key, call, error=e)
+                raise
+            self._settle(key, call, value)
+            return value
+        finally:
+            self._leave(key, call)
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async ``do``: ``fn`` is a coroutine function.
+
+        The call runs as its own task on the running loop and is shared only with callers
+        on that loop (or joins a call a thread is already making). A caller that is
+        cancelled stops waiting; the task is cancelled only once no caller is left waiting
+        for it.
+        """
+        call, leader, slot = self._join(key, asyncio.get_running_loop())
+        if leader:
+            async def lead():
+                try:
+                    value = await self._alead(key, fn)
+                except BaseException as e:
+                    self._settle(slot, call, error=e)
+                    raise
+                self._settle(slot, call, value)
+
+            call.task = asyncio.ensure_future(lead())
+            # The outcome is read through call.future; this only silences "exception never retrieved"
+            call.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        try:
+            value = await asyncio.wrap_future(call.future)
+        except asyncio.CancelledError:
+            self._leave(slot, call, cancelled=True)
+            raise
+        except BaseException:
+            self._leave(slot, call)
+            raise
+        self._leave(slot, call)
+        return value
+
+    def _lead(self, key: str, fn: Callable[[], Any]) -> Any:
+        table = self.lock_table
+        if table is None:
+            return fn()
+        try:
+            token = table.acquire(key)
+            holder = None if token else table.holder(key)
+        except Exception as e:
+            logger.warning("[coalesce:%s] lock table unavailable: %s", self.name, e)
+            return fn()
+        if token:
+            try:
+                value = fn()
+                table.publish(key, token, value)
+                return value
+            finally:
+                table.release(key, token)
+        deadline = time.monotonic() + table.timeout
+        while holder and time.monotonic() < deadline:
+            time.sleep(table.poll_interval)
+            value = table.result(key, holder)
+            if value is not _MISSING:
+                self._count("remote_coalesced")
+                return value
+            if table.holder(key) != holder:
+                break
+        return fn()
+
+    async def _alead(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        table = self.lock_table
+        if table is None:
+            return await fn()
+        try:
+            token = await sync_to_async(table.acquire)(key)
+            holder = None if token else await sync_to_async(table.holder)(key)
+        except Exception as e:
+            logger.warning("[coalesce:%s] lock table unavailable: %s", self.name, e)
+            return await fn()
+        if token:
+            try:
+                value = await fn()
+                await sync_to_async(table.publish)(key, token, value)
+                return value
+            finally:
+                await sync_to_async(table.release)(key, token)
+        deadline = time.monotonic() + table.timeout
+        while holder and time.monotonic() < deadline:
+            await asyncio.sleep(table.poll_interval)
+            value = await sync_to_async(table.result)(key, holder)
+            if value is not _MISSING:
+                self._count("remote_coalesced")
+                return value
+            if await sync_to_async(table.holder)(key) != holder:
+                break
+        return await fn()
+
+
+_registry: Dict[str, SingleFlight] = {}
+_registry_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Return the process-wide coalescer for ``name``, creating it on first use."""
+    with _registry_lock:
+        group = _registry.get(name)
+        if group is None:
+            try:
+                from django.conf import settings
+                alias = getattr(settings, "COALESCE_LOCK_CACHE", "")
+                timeout = getattr(settings, "COALESCE_LOCK_TIMEOUT", 30)
+            except Exception:
+                alias, timeout = "", 30
+            group = SingleFlight(name, CacheLockTable(alias, timeout=timeout) if alias else None)
+            _registry[name] = group
+        return group
+
+
+def coalesce_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats for every coalescer created through ``get_single_flight``."""
+    with _registry_lock:
+        groups = list(_registry.values())
+    return {g.name: g.stats() for g in groups}
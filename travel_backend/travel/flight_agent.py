@@ -1,6 +1,10 @@
 import os
 import json
-from typing import Dict, List, Optional, Any
+import asyncio
+import logging
+import threading
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain_openai import ChatOpenAI
@@ -10,8 +14,18 @@ from langchain_core.messages import HumanMessage, AIMessage
 from serpapi import GoogleSearch
 from dotenv import load_dotenv
 
+from .agent_registry import registry
+from .airports import get_airport_index
+from .cache import TTLCache, get_cache, run_cache_io
+from .coalesce import get_single_flight
+from .flight_ranking import rank_flights
+from .quota import QuotaExceeded, charge
+from .upstream import serpapi_get_json
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Load Google countries mapping once
 _GOOGLE_COUNTRIES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'google-countries.json')
 _COUNTRY_NAME_TO_CODE: dict[str, str] = {}
@@ -27,6 +41,7 @@ try:
         # Common aliases
         _COUNTRY_NAME_TO_CODE['uk'] = 'gb'
         _COUNTRY_NAME_TO_CODE['united kingdom'] = 'gb'
+        _COUNTRY_NAME_TO_CODE['usa'] = 'us'
 except Exception:
     _COUNTRY_NAME_TO_CODE = {}
 
@@ -34,8 +49,17 @@ except Exception:
 class FlightSearchTool:
     """Tool for searching flights using SerpAPI Google Flights"""
 
-    def __init__(self, serpapi_key: str):
+    def __init__(self, serpapi_key: str, cache: Optional[TTLCache] = None,
+                 memo: Optional[TTLCache] = None, gl_memo_ttl: float = 7 * 86400):
         self.serpapi_key = serpapi_key
+        # Optional result cache in front of _search_serpapi (see travel.cache)
+        self.cache = cache
+        # Optional negative memo: empty (route, date, gl) outcomes for memo.ttl seconds,
+        # plus the gl that produced results per route for gl_memo_ttl seconds
+        self.memo = memo
+        self.gl_memo_ttl = gl_memo_ttl
+        # Identical concurrent searches share one upstream call (see travel.coalesce)
+        self._coalescer = get_single_flight("serpapi-flights")
     
     def search_flights(
         self,
@@ -46,6 +70,7 @@ class FlightSearchTool:
         adults: int = 1,
         cabin_class: str = "economy",
         country: Optional[str] = None,
+        bypass_cache: bool = False,
     ) -> Dict[str, Any]:
         """
         Search for flights using SerpAPI Google Flights
@@ -57,18 +82,84 @@ class FlightSearchTool:
             return_date: Return date in YYYY-MM-DD format (optional for one-way)
             adults: Number of adult passengers
             cabin_class: Cabin class (economy, business, first)
+            country: Optional country name/code used as SerpAPI ``gl``
+            bypass_cache: Skip the cached result and overwrite it with a fresh one
 
         Returns:
-            Dictionary containing flight search results
+            Dictionary containing flight search results. When a cache is configured it
+            also carries ``cache: {hit, age_seconds, stale}``.
         """
-        return self._search_serpapi(
-            origin,
-            destination,
-            departure_date,
-            return_date,
-            adults,
-            cabin_class,
-            country,
+        parts = self._request_parts(origin, destination, departure_date, return_date, adults, cabin_class, country)
+
+        def fetch():
+            return self._coalescer.do(self._coalescer.make_key(*parts), lambda: self._search_serpapi(
+                origin,
+                destination,
+                departure_date,
+                return_date,
+                adults,
+                cabin_class,
+                country,
+            ))
+
+        if self.cache is None:
+            return fetch()
+        key = self.cache.make_key(*parts)
+        result, meta = self.cache.get_or_fetch(
+            key,
+            fetch,
+            should_cache=lambda r: isinstance(r, dict) and r.get("success") and r.get("total_results", 0) > 0,
+            bypass=bypass_cache,
+        )
+        return {**result, "cache": meta}
+
+    async def search_flights_async(
+        self,
+        origin: str,
+        destination: str,
+        departure_date: str,
+        return_date: Optional[str] = None,
+        adults: int = 1,
+        cabin_class: str = "economy",
+        country: Optional[str] = None,
+        bypass_cache: bool = False,
+    ) -> Dict[str, Any]:
+        """Async variant of search_flights using non-blocking HTTP; same arguments and result."""
+        parts = self._request_parts(origin, destination, departure_date, return_date, adults, cabin_class, country)
+
+        def fetch():
+            return self._coalescer.ado(self._coalescer.make_key(*parts), lambda: self._search_serpapi_async(
+                origin,
+                destination,
+                departure_date,
+                return_date,
+                adults,
+                cabin_class,
+                country,
+            ))
+
+        if self.cache is None:
+            return await fetch()
+        key = self.cache.make_key(*parts)
+        result, meta = await self.cache.aget_or_fetch(
+            key,
+            fetch,
+            should_cache=lambda r: isinstance(r, dict) and r.get("success") and r.get("total_results", 0) > 0,
+            bypass=bypass_cache,
+        )
+        return {**result, "cache": meta}
+
+    def _request_parts(self, origin: str, destination: str, departure_date: str, return_date: Optional[str],
+                       adults: int, cabin_class: str, country: Optional[str]) -> Tuple[Any, ...]:
+        """Normalized search arguments shared by the cache and coalescing keys"""
+        return (
+            str(origin or "").strip().upper(),
+            str(destination or "").strip().upper(),
+            str(departure_date or "").strip(),
+            str(return_date or "").strip(),
+            int(adults or 1),
+            str(cabin_class or "economy").strip().lower(),
+            self._normalize_gl(country) or "",
         )
     
     def _normalize_gl(self, country: Optional[str]) -> Optional[str]:
@@ -80,53 +171,154 @@ class FlightSearchTool:
         except Exception:
             return None
 
+    def _gl_candidates(self, origin: str, destination: str, country: Optional[str]) -> List[Optional[str]]:
+        """gl values to try in order: the gl that last worked for this route, the user's
+        country, then global fallbacks per SerpAPI docs."""
+        candidates: List[Optional[str]] = []
+        if self.memo is not None:
+            known = self.memo.get(self.memo.make_key("gl", str(origin).upper(), str(destination).upper()))
+            if known is not None:
+                candidates.append(known["value"] or None)
+        gl_primary = self._normalize_gl(country)
+        if gl_primary:
+            candidates.append(gl_primary)
+        candidates.extend([None, 'us', 'gb'])
+        unique: List[Optional[str]] = []
+        for gl in candidates:
+            if gl not in unique:
+                unique.append(gl)
+        return unique
+
+    def _negative_key(self, route: Tuple[Any, ...], gl: Optional[str]) -> Optional[str]:
+        if self.memo is None:
+            return None
+        origin, destination, departure_date, return_date, adults, cabin_class = route
+        return self.memo.make_key(
+            "empty",
+            str(origin).upper(),
+            str(destination).upper(),
+            departure_date,
+            return_date or "",
+            int(adults or 1),
+            str(cabin_class or "economy").lower(),
+            gl or "",
+        )
+
+    def _remember_gl(self, origin: str, destination: str, gl: Optional[str]) -> None:
+        if self.memo is None:
+            return
+        key = self.memo.make_key("gl", str(origin).upper(), str(destination).upper())
+        self.memo.set(key, gl or "", ttl=self.gl_memo_ttl)
+
+    def _plan_serpapi_attempts(self, origin: str, destination: str, departure_date: str,
+                               return_date: Optional[str], adults: int, cabin_class: str,
+                               country: Optional[str]) -> Tuple[List[Tuple[Optional[str], Dict[str, Any], Optional[str]]], int]:
+        """Build the ordered (gl, params, negative_key) attempts, dropping known-empty ones.
+
+        Returns the attempts and how many gl candidates the negative memo skipped.
+        """
+        base_params = {
+            "engine": "google_flights",
+            "api_key": self.serpapi_key,
+            "departure_id": origin,
+            "arrival_id": destination,
+            "outbound_date": departure_date,
+            "adults": adults,
+            "currency": "USD",
+            "hl": "en",
+        }
+        if return_date:
+            base_params["return_date"] = return_date
+        if cabin_class != "economy":
+            base_params["cabin_class"] = cabin_class
+
+        route = (origin, destination, departure_date, return_date, adults, cabin_class)
+        attempts = []
+        skipped = 0
+        for gl in self._gl_candidates(origin, destination, country):
+            negative_key = self._negative_key(route, gl)
+            if negative_key and self.memo.get(negative_key) is not None:
+                # Known to return zero flights recently; don't spend a credit on it
+                skipped += 1
+                continue
+            params = dict(base_params)
+            if gl:
+                params['gl'] = gl
+            attempts.append((gl, params, negative_key))
+        return attempts, skipped
+
+    def _record_attempt(self, origin: str, destination: str, gl: Optional[str],
+                        negative_key: Optional[str], processed: Dict[str, Any]) -> bool:
+        """Update the memo with one attempt's outcome; True when it produced flights."""
+        if processed.get('success') and processed.get('total_results', 0) > 0:
+            self._remember_gl(origin, destination, gl)
+            return True
+        if negative_key and processed.get('success'):
+            self.memo.set(negative_key, True)
+        return False
+
+    @staticmethod
+    def _empty_serpapi_result(skipped: int) -> Dict[str, Any]:
+        processed: Dict[str, Any] = {
+            "success": True,
+            "flights": [],
+            "total_results": 0,
+            "data_source": "serpapi",
+            "search_info": {},
+        }
+        if skipped:
+            processed["negative_cache_skips"] = skipped
+        return processed
+
     def _search_serpapi(self, origin: str, destination: str, departure_date: str,
                         return_date: Optional[str] = None, adults: int = 1, cabin_class: str = "economy",
                         country: Optional[str] = None) -> Dict[str, Any]:
         """Search flights using SerpAPI Google Flights as fallback"""
         try:
-            base_params = {
-                "engine": "google_flights",
-                "api_key": self.serpapi_key,
-                "departure_id": origin,
-                "arrival_id": destination,
-                "outbound_date": departure_date,
-                "adults": adults,
-                "currency": "USD",
-                "hl": "en",
-            }
-            if return_date:
-                base_params["return_date"] = return_date
-            if cabin_class != "economy":
-                base_params["cabin_class"] = cabin_class
-
-            gl_primary = self._normalize_gl(country)
-            gl_candidates = []
-            if gl_primary:
-                gl_candidates.append(gl_primary)
-            # Fallbacks per SerpAPI docs and global coverage
-            gl_candidates.extend([None, 'us', 'gb'])
-
-            for gl in gl_candidates:
-                params = dict(base_params)
-                if gl:
-                    params['gl'] = gl
-                elif 'gl' in params:
-                    params.pop('gl', None)
-                try:
-                    # Debug attempt
-                    print(f"[serpapi] attempt gl={gl} dep={origin} arr={destination} date={departure_date}")
-                except Exception:
-                    pass
+            attempts, skipped = self._plan_serpapi_attempts(
+                origin, destination, departure_date, return_date, adults, cabin_class, country
+            )
+            processed = self._empty_serpapi_result(skipped)
+            for gl, params, negative_key in attempts:
+                logger.debug("[serpapi] attempt gl=%s dep=%s arr=%s date=%s", gl, origin, destination, departure_date)
+                charge("serpapi")
                 search = GoogleSearch(params)
                 results = search.get_dict()
                 processed = self._process_serpapi_results(results)
-                if processed.get('success') and processed.get('total_results', 0) > 0:
+                if self._record_attempt(origin, destination, gl, negative_key, processed):
                     return processed
 
             # If all attempts empty, return last processed
             return processed
             
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"SerpAPI search failed: {str(e)}",
+                "flights": []
+            }
+
+    async def _search_serpapi_async(self, origin: str, destination: str, departure_date: str,
+                                    return_date: Optional[str] = None, adults: int = 1, cabin_class: str = "economy",
+                                    country: Optional[str] = None) -> Dict[str, Any]:
+        """Non-blocking twin of _search_serpapi (same gl ladder and memo, httpx transport)"""
+        try:
+            attempts, skipped = await run_cache_io(
+                self.memo, self._plan_serpapi_attempts,
+                origin, destination, departure_date, return_date, adults, cabin_class, country,
+            )
+            processed = self._empty_serpapi_result(skipped)
+            for gl, params, negative_key in attempts:
+                logger.debug("[serpapi] attempt gl=%s dep=%s arr=%s date=%s", gl, origin, destination, departure_date)
+                results = await serpapi_get_json(params)
+                processed = self._process_serpapi_results(results)
+                if await run_cache_io(self.memo, self._record_attempt, origin, destination, gl, negative_key, processed):
+                    return processed
+            return processed
+        except (asyncio.CancelledError, QuotaExceeded):
+            raise
         except Exception as e:
             return {
                 "success": False,
@@ -180,7 +372,7 @@ class FlightSearchTool:
             first_flight = flights[0]
             last_flight = flights[-1]
             
-            total_duration = flight_option.get("total_duration", 0)
+            total_duration = flight_option.get("total_duration") or 0
             duration_hours = total_duration // 60
             duration_minutes = total_duration % 60
             
@@ -188,7 +380,9 @@ class FlightSearchTool:
             stops = len(layovers)
             
             airline = first_flight.get("airline", "Unknown")
-            price = flight_option.get("price", 0)
+            price = flight_option.get("price")
+            if not isinstance(price, (int, float)):
+                price = 0
             
             departure_info = first_flight.get("departure_airport", {})
             arrival_info = last_flight.get("arrival_airport", {})
@@ -219,9 +413,11 @@ class FlightSearchTool:
                 "departure": dep_code,
                 "arrival": arr_code,
                 "duration": f"{duration_hours}h {duration_minutes}m",
+                "durationMinutes": total_duration or None,
                 "stops": stops,
                 "departureTime": departure_time,
                 "arrivalTime": arrival_time,
+                "flightNumber": first_flight.get("flight_number"),
                 "type": flight_option.get("type", "Round-trip"),
                 "layovers": layovers,
                 "bookingUrl": booking_url,
@@ -229,7 +425,7 @@ class FlightSearchTool:
             }
             
         except Exception as e:
-            print(f"Error extracting SerpAPI flight data: {e}")
+            logger.warning("Error extracting SerpAPI flight data: %s", e)
             return None
     
     def _calculate_duration(self, dep_time: str, arr_time: str) -> str:
@@ -268,17 +464,39 @@ class FlightSearchTool:
 class FlightAIAgent:
     """AI Agent for intelligent flight search and recommendations using hybrid API approach"""
     
-    def __init__(self, openai_api_key: str, serpapi_key: str):
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.1,
-            api_key=openai_api_key
-        )
-        self.flight_search = FlightSearchTool(serpapi_key)
-        # Prepare agent executor (not used in normal flow to keep responses fast)
-        self.agent_executor = self._create_agent()
-    
-    def _create_agent(self) -> AgentExecutor:
+    def __init__(self, openai_api_key: str, serpapi_key: str, max_workers: int = 6,
+                 cache: Optional[TTLCache] = None, memo: Optional[TTLCache] = None):
+        self._openai_api_key = openai_api_key
+        self._llm: Optional[ChatOpenAI] = None
+        self._agent_executor: Optional[AgentExecutor] = None
+        self._init_lock = threading.Lock()
+        self.flight_search = FlightSearchTool(serpapi_key, cache=cache, memo=memo)
+        # Upper bound on concurrent SerpAPI requests per staged search (1 = sequential)
+        self.max_workers = max(1, int(max_workers or 1))
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        if self._llm is None:
+            with self._init_lock:
+                if self._llm is None:
+                    self._llm = ChatOpenAI(
+                        model="gpt-4o-mini",
+                        temperature=0.1,
+                        api_key=self._openai_api_key
+                    )
+        return self._llm
+
+    @property
+    def agent_executor(self) -> AgentExecutor:
+        """LangChain tool-calling executor, built on first use (not used in normal flow to keep responses fast)"""
+        if self._agent_executor is None:
+            llm = self.llm
+            with self._init_lock:
+                if self._agent_executor is None:
+                    self._agent_executor = self._create_agent(llm)
+        return self._agent_executor
+
+    def _create_agent(self, llm: ChatOpenAI) -> AgentExecutor:
         """Create the LangChain agent with flight search tools"""
         
         @tool
@@ -307,25 +525,8 @@ class FlightAIAgent:
                 if not flight_list:
                     return "No flights found for the given criteria."
                 
-                # Sort flights by different criteria
-                by_price = sorted(flight_list, key=lambda x: x.get("price", float('inf')))
-                by_duration = sorted(flight_list, key=lambda x: self._parse_duration(x.get("duration", "0h 0m")))
-                by_stops = sorted(flight_list, key=lambda x: x.get("stops", 0))
-                
-                analysis = {
-                    "total_flights": len(flight_list),
-                    "data_source": flights.get("data_source", "unknown"),
-                    "price_range": {
-                        "lowest": by_price[0]["price"] if by_price else 0,
-                        "highest": by_price[-1]["price"] if by_price else 0
-                    },
-                    "recommendations": {
-                        "best_value": by_price[0] if by_price else None,
-                        "fastest": by_duration[0] if by_duration else None,
-                        "most_convenient": by_stops[0] if by_stops else None
-                    },
-                    "summary": f"Found {len(flight_list)} flights using {flights.get('data_source', 'unknown')} data. Price range: ${by_price[0]['price'] if by_price else 0} - ${by_price[-1]['price'] if by_price else 0}"
-                }
+                analysis = self._analyze_flights_simple(flight_list)
+                analysis["data_source"] = flights.get("data_source", "unknown")
                 
                 return json.dumps(analysis, indent=2)
                 
@@ -350,7 +551,7 @@ Always return your responses in a structured JSON format that can be easily pars
         ])
         
         # Create the agent
-        agent = create_openai_tools_agent(self.llm, [search_flights, analyze_flight_options], prompt)
+        agent = create_openai_tools_agent(llm, [search_flights, analyze_flight_options], prompt)
         # Keep verbose disabled to avoid noisy logs
         return AgentExecutor(agent=agent, tools=[search_flights, analyze_flight_options], verbose=False)
 
@@ -368,31 +569,15 @@ Always return your responses in a structured JSON format that can be easily pars
         if len(up) in (3, 4) and up.isalpha():
             candidates.append(up)
 
-        # Use first token (city hint)
-        city_token = raw.split(',')[0].strip().lower()
-        city_to_iata = {
-            # Common cities
-            'oslo': 'OSL', 'bergen': 'BGO', 'trondheim': 'TRD', 'stavanger': 'SVG',
-            'sydney': 'SYD', 'melbourne': 'MEL', 'brisbane': 'BNE', 'perth': 'PER',
-            'london': 'LHR', 'paris': 'CDG', 'frankfurt': 'FRA', 'amsterdam': 'AMS',
-            'tokyo': 'TYO', 'singapore': 'SIN', 'hong kong': 'HKG', 'new york': 'JFK',
-            'delhi': 'DEL', 'mumbai': 'BOM', 'bangkok': 'BKK', 'dubai': 'DXB',
-        }
-        if city_token in city_to_iata:
-            candidates.append(city_to_iata[city_token])
-
-        # Country-level fallbacks: try major airports
-        country_token = raw.lower().strip()
-        country_to_iatas = {
-            'norway': ['OSL', 'BGO', 'TRD', 'SVG'],
-            'australia': ['SYD', 'MEL', 'BNE', 'PER'],
-            'united kingdom': ['LHR', 'LGW', 'MAN', 'EDI'], 'uk': ['LHR', 'LGW', 'MAN', 'EDI'],
-            'united states': ['JFK', 'LAX', 'ORD', 'SFO', 'MIA'], 'usa': ['JFK', 'LAX', 'ORD', 'SFO', 'MIA'],
-            'japan': ['TYO', 'HND', 'NRT', 'KIX'],
-            'india': ['DEL', 'BOM', 'BLR'],
-        }
-        if country_token in country_to_iatas:
-            candidates.extend(country_to_iatas[country_token])
+        airports = get_airport_index()
+        country_code = _COUNTRY_NAME_TO_CODE.get(raw.lower().strip())
+        if country_code:
+            # Country-level fallbacks: try major airports
+            candidates.extend(airports.country_hubs(country_code, limit=4))
+        else:
+            # Use first token (city hint): that city's best-ranked airports
+            city_token = raw.split(',')[0].strip().lower()
+            candidates.extend(airports.city_airports(city_token, limit=2))
 
         # Deduplicate while preserving order
         seen = set()
@@ -403,42 +588,20 @@ Always return your responses in a structured JSON format that can be easily pars
                 unique.append(c)
         return unique
     
-    def _parse_duration(self, duration_str: str) -> int:
-        """Parse duration string to total minutes"""
-        try:
-            parts = duration_str.split()
-            hours = int(parts[0].replace('h', ''))
-            minutes = int(parts[1].replace('m', '')) if len(parts) > 1 else 0
-            return hours * 60 + minutes
-        except:
-            return 0
-    
     def _analyze_flights_simple(self, flight_list: List[Dict[str, Any]]) -> Dict[str, Any]:
         try:
-            by_price = sorted(flight_list, key=lambda x: x.get("price", float('inf')))
-            # parse duration like "31h 55m" to minutes
-            def dur_to_min(d: str) -> int:
-                try:
-                    parts = d.split()
-                    hours = int(parts[0].replace('h', '')) if parts else 0
-                    minutes = int(parts[1].replace('m', '')) if len(parts) > 1 else 0
-                    return hours * 60 + minutes
-                except:
-                    return 1_000_000
-            by_duration = sorted(flight_list, key=lambda x: dur_to_min(x.get("duration", "")))
-            by_stops = sorted(flight_list, key=lambda x: x.get("stops", 0))
-            summary = f"Found {len(flight_list)} flights. Price range: ${by_price[0]['price'] if by_price else 0} - ${by_price[-1]['price'] if by_price else 0}"
+            ranking = rank_flights(flight_list)
+            price_range = ranking["price_range"]
+            summary = f"Found {len(flight_list)} flights. Price range: ${price_range['lowest']} - ${price_range['highest']}"
             return {
                 "total_flights": len(flight_list),
-                "price_range": {
-                    "lowest": by_price[0]["price"] if by_price else 0,
-                    "highest": by_price[-1]["price"] if by_price else 0,
-                },
+                "price_range": price_range,
                 "recommendations": {
-                    "best_value": by_price[0] if by_price else None,
-                    "fastest": by_duration[0] if by_duration else None,
-                    "most_convenient": by_stops[0] if by_stops else None,
+                    "best_value": ranking["best_value"],
+                    "fastest": ranking["fastest"],
+                    "most_convenient": ranking["most_convenient"],
                 },
+                "pareto_front": ranking["pareto_front"],
                 "summary": summary,
             }
         except Exception as e:
@@ -446,10 +609,259 @@ Always return your responses in a structured JSON format that can be easily pars
                 "total_flights": len(flight_list),
                 "price_range": {"lowest": 0, "highest": 0},
                 "recommendations": {"best_value": None, "fastest": None, "most_convenient": None},
+                "pareto_front": [],
                 "summary": f"Found {len(flight_list)} flights.",
                 "error": f"Analysis error: {str(e)}",
             }
 
+    def _build_search_response(self, direct_results: Dict[str, Any]) -> Dict[str, Any]:
+        flights = direct_results.get("flights", [])
+        analysis = self._analyze_flights_simple(flights)
+        return {
+            "success": True,
+            "data": {
+                "flights": flights,
+                "recommendations": analysis.get("recommendations"),
+                "total_flights": analysis.get("total_flights"),
+                "price_range": analysis.get("price_range"),
+                "pareto_front": analysis.get("pareto_front"),
+                "summary": analysis.get("summary"),
+                "data_source": direct_results.get("data_source", "serpapi"),
+                "cache": direct_results.get("cache"),
+            },
+            "raw_response": None,
+        }
+
+    async def _iter_stage(self, combos: List[Tuple[str, str, str]], search_kwargs: Dict[str, Any],
+                          concurrent: bool, shared: Optional[Dict[Any, "asyncio.Future"]] = None,
+                          ) -> AsyncIterator[Tuple[Tuple[str, str, str], Dict[str, Any], bool]]:
+        """Yield ``(combo, result, is_winner)`` as a stage's searches complete.
+
+        The winner is the first combination, in priority order, whose result has flights.
+        Sequentially, combinations are searched one at a time and iteration stops at the winner.
+        Concurrently (at most max_workers in flight), results are yielded in completion order with
+        ``is_winner=False``; once every higher-priority combination came back empty the winner is
+        yielded again with ``is_winner=True`` and the remaining searches are cancelled, which also
+        aborts their in-flight HTTP requests.
+
+        ``shared`` (see search_batch) maps search arguments to in-flight tasks so identical searches
+        from several staged searches run once. Shared tasks are shielded from this stage's
+        cancellation; their owner cancels whatever is left.
+        """
+        async def search(o: str, d: str, dep: str) -> Dict[str, Any]:
+            if shared is None:
+                return await self.flight_search.search_flights_async(
+                    origin=o, destination=d, departure_date=dep, **search_kwargs
+                )
+            key = (o.strip().upper(), d.strip().upper(), dep, tuple(sorted(search_kwargs.items())))
+            task = shared.get(key)
+            if task is None:
+                task = shared[key] = asyncio.ensure_future(self.flight_search.search_flights_async(
+                    origin=o, destination=d, departure_date=dep, **search_kwargs
+                ))
+            return await asyncio.shield(task)
+
+        async def run(combo: Tuple[str, str, str]) -> Dict[str, Any]:
+            o, d, dep = combo
+            try:
+                return await search(o, d, dep)
+            except (asyncio.CancelledError, QuotaExceeded):
+                raise
+            except Exception as e:
+                return {"success": False, "error": f"SerpAPI search failed: {str(e)}", "flights": []}
+
+        def has_flights(result: Dict[str, Any]) -> bool:
+            return bool(result.get("flights")) if isinstance(result, dict) else False
+
+        if not concurrent:
+            for combo in combos:
+                result = await run(combo)
+                yield combo, result, has_flights(result)
+                if has_flights(result):
+                    return
+            return
+
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def bounded(index: int) -> Tuple[int, Dict[str, Any]]:
+            async with semaphore:
+                return index, await run(combos[index])
+
+        tasks = [asyncio.ensure_future(bounded(i)) for i in range(len(combos))]
+        results: Dict[int, Dict[str, Any]] = {}
+        next_index = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, result = await next_done
+                results[index] = result
+                yield combos[index], result, False
+                # Advance past higher-priority combinations that came back empty
+                while next_index in results:
+                    if has_flights(results[next_index]):
+                        yield combos[next_index], results[next_index], True
+                        return
+                    next_index += 1
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def fare_calendar(self,
+                            origin: str,
+                            destination: str,
+                            start_date: str,
+                            days: int = 7,
+                            trip_length: Optional[int] = None,
+                            adults: int = 1,
+                            cabin_class: str = "economy",
+                            country: Optional[str] = None) -> Dict[str, Any]:
+        """Lowest fare per departure date for ``days`` consecutive dates from ``start_date``.
+
+        Dates are searched concurrently (at most max_workers in flight) through
+        ``search_flights_async``, so dates already fetched by a staged search or an earlier
+        calendar come from the result cache. With ``trip_length`` each date is priced as a
+        round trip returning that many days later.
+        """
+        try:
+            base_dt = datetime.strptime(start_date, "%Y-%m-%d")
+        except (TypeError, ValueError):
+            return {"success": False, "error": "start_date must be YYYY-MM-DD", "data": None}
+
+        dates = [(base_dt + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(max(1, int(days)))]
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def price_date(dep: str) -> Dict[str, Any]:
+            ret = None
+            if trip_length:
+                ret = (datetime.strptime(dep, "%Y-%m-%d") + timedelta(days=int(trip_length))).strftime("%Y-%m-%d")
+            async with semaphore:
+                result = await self.flight_search.search_flights_async(
+                    origin=origin,
+                    destination=destination,
+                    departure_date=dep,
+                    return_date=ret,
+                    adults=adults,
+                    cabin_class=cabin_class,
+                    country=country,
+                )
+            flights = result.get("flights", []) if isinstance(result, dict) else []
+            priced = [f for f in flights if isinstance(f.get("price"), (int, float)) and f["price"] > 0]
+            cheapest = min(priced, key=lambda f: f["price"]) if priced else None
+            return {
+                "date": dep,
+                "return_date": ret,
+                "lowest_price": cheapest["price"] if cheapest else None,
+                "airline": cheapest.get("airline") if cheapest else None,
+                "stops": cheapest.get("stops") if cheapest else None,
+                "total_flights": len(flights),
+                "cached": bool((result.get("cache") or {}).get("hit")) if isinstance(result, dict) else False,
+                "error": None if result.get("success") else result.get("error"),
+            }
+
+        calendar = await asyncio.gather(*(price_date(d) for d in dates))
+        priced_days = [d for d in calendar if d["lowest_price"] is not None]
+        cheapest_day = min(priced_days, key=lambda d: d["lowest_price"]) if priced_days else None
+        return {
+            "success": True,
+            "data": {
+                "origin": origin,
+                "destination": destination,
+                "currency": "USD",
+                "calendar": calendar,
+                "cheapest_date": cheapest_day["date"] if cheapest_day else None,
+                "cheapest_price": cheapest_day["lowest_price"] if cheapest_day else None,
+                "cached_dates": sum(1 for d in calendar if d["cached"]),
+            },
+        }
+
+    async def search_batch(self, legs: List[Dict[str, Any]], concurrent: Optional[bool] = None) -> Dict[str, Any]:
+        """Run the staged search for several legs/routes at once.
+
+        Each leg is a dict of search_and_recommend_flights arguments (origin, destination,
+        departure_date, optional return_date, adults, cabin_class, preferences, country).
+        Identical legs are searched once (``duplicate_of`` points at the first), the remaining
+        legs run concurrently, and route/date searches repeated across their fallback stages
+        share one in-flight upstream call. ``cheapest_combination`` takes the cheapest priced
+        flight of every leg.
+        """
+        def leg_key(leg: Dict[str, Any]) -> Tuple[Any, ...]:
+            return (
+                str(leg.get("origin") or "").strip().upper(),
+                str(leg.get("destination") or "").strip().upper(),
+                str(leg.get("departure_date") or "").strip(),
+                str(leg.get("return_date") or "").strip(),
+                int(leg.get("adults") or 1),
+                str(leg.get("cabin_class") or "economy").strip().lower(),
+                self.flight_search._normalize_gl(leg.get("country")) or "",
+                json.dumps(leg.get("preferences") or {}, sort_keys=True, default=str),
+            )
+
+        first_index: Dict[Tuple[Any, ...], int] = {}
+        duplicate_of: List[Optional[int]] = []
+        for i, leg in enumerate(legs):
+            key = leg_key(leg)
+            duplicate_of.append(first_index.get(key))
+            first_index.setdefault(key, i)
+
+        shared: Dict[Any, asyncio.Future] = {}
+
+        async def search_leg(leg: Dict[str, Any]) -> Dict[str, Any]:
+            return await self.search_and_recommend_flights(
+                origin=leg["origin"],
+                destination=leg["destination"],
+                departure_date=leg["departure_date"],
+                return_date=leg.get("return_date"),
+                adults=leg.get("adults", 1),
+                cabin_class=leg.get("cabin_class", "economy"),
+                preferences=leg.get("preferences"),
+                country=leg.get("country"),
+                concurrent=concurrent,
+                shared=shared,
+            )
+
+        unique = sorted(first_index.values())
+        try:
+            results = dict(zip(unique, await asyncio.gather(*(search_leg(legs[i]) for i in unique))))
+        finally:
+            # Searches that lost to a winner in every stage sharing them are still running
+            for task in shared.values():
+                task.cancel()
+
+        out_legs = []
+        cheapest_flights = []
+        missing = []
+        for i, leg in enumerate(legs):
+            result = results[i if duplicate_of[i] is None else duplicate_of[i]]
+            flights = (result.get("data") or {}).get("flights") or [] if isinstance(result, dict) else []
+            priced = [f for f in flights if isinstance(f.get("price"), (int, float)) and f["price"] > 0]
+            cheapest = min(priced, key=lambda f: f["price"]) if priced else None
+            if cheapest is None:
+                missing.append(i)
+            cheapest_flights.append(cheapest)
+            out_legs.append({
+                "index": i,
+                "origin": leg["origin"],
+                "destination": leg["destination"],
+                "departure_date": leg["departure_date"],
+                "return_date": leg.get("return_date"),
+                "duplicate_of": duplicate_of[i],
+                "result": result,
+            })
+
+        return {
+            "success": True,
+            "data": {
+                "legs": out_legs,
+                "cheapest_combination": {
+                    "complete": not missing,
+                    "total_price": sum(f["price"] for f in cheapest_flights if f) if not missing else None,
+                    "flights": cheapest_flights,
+                    "missing_legs": missing,
+                },
+                "unique_legs": len(unique),
+                "upstream_searches": len(shared),
+            },
+        }
+
     async def search_and_recommend_flights(self, 
                                          origin: str, 
                                          destination: str, 
@@ -458,7 +870,9 @@ Always return your responses in a structured JSON format that can be easily pars
                                          adults: int = 1,
                                          cabin_class: str = "economy",
                                           preferences: Optional[Dict[str, Any]] = None,
-                                          country: Optional[str] = None) -> Dict[str, Any]:
+                                          country: Optional[str] = None,
+                                          concurrent: Optional[bool] = None,
+                                          shared: Optional[Dict[Any, "asyncio.Future"]] = None) -> Dict[str, Any]:
         """
         Search for flights and provide AI-powered recommendations using hybrid API approach
         
@@ -470,10 +884,51 @@ Always return your responses in a structured JSON format that can be easily pars
             adults: Number of passengers
             cabin_class: Preferred cabin class
             preferences: User preferences (budget, max_stops, etc.)
+            country: Optional user country used for gl localisation and origin hubs
+            concurrent: Run each stage's combinations concurrently (at most max_workers in flight)
+                (defaults to True when the agent has more than one worker)
+            shared: In-flight searches shared with other staged searches (see search_batch)
         
         Returns:
             Dictionary with flight search results and AI recommendations
         """
+        result: Dict[str, Any] = {"success": False, "error": "Flight search produced no result", "data": None}
+        async with aclosing(self.stream_search_and_recommend_flights(
+            origin, destination, departure_date,
+            return_date=return_date,
+            adults=adults,
+            cabin_class=cabin_class,
+            preferences=preferences,
+            country=country,
+            concurrent=concurrent,
+            shared=shared,
+        )) as events:
+            async for event in events:
+                if event["event"] == "result":
+                    result = event["result"]
+        return result
+
+    async def stream_search_and_recommend_flights(self,
+                                                  origin: str,
+                                                  destination: str,
+                                                  departure_date: str,
+                                                  return_date: Optional[str] = None,
+                                                  adults: int = 1,
+                                                  cabin_class: str = "economy",
+                                                  preferences: Optional[Dict[str, Any]] = None,
+                                                  country: Optional[str] = None,
+                                                  concurrent: Optional[bool] = None,
+                                                  shared: Optional[Dict[Any, "asyncio.Future"]] = None,
+                                                  ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming form of search_and_recommend_flights: yields events as the staged search progresses.
+
+        Events:
+            {"event": "stage", "stage", "combinations"} when a fallback stage starts
+            {"event": "flights", "stage", "origin", "destination", "departure_date", "flights",
+             "total_results", "cache"} for each search that returned flights, as it completes
+            {"event": "result", "result"} last; ``result`` is what search_and_recommend_flights returns
+        """
         try:
             # Create the search query for the agent
             query = f"""Search for flights from {origin} to {destination} on {departure_date}"""
@@ -506,137 +961,104 @@ Always return your responses in a structured JSON format that can be easily pars
             dest_candidates = unique(dest_candidates)[:8]
 
             # Origin candidates based on user country hubs
-            country_hubs = {
-                'us': ['JFK', 'LAX', 'SFO', 'ORD'],
-                'in': ['DEL', 'BOM', 'BLR'],
-                'gb': ['LHR', 'LGW'], 'uk': ['LHR', 'LGW'],
-                'ae': ['DXB', 'AUH'],
-                'sg': ['SIN'],
-                'jp': ['HND', 'NRT'],
-                'au': ['SYD', 'MEL'],
-                'de': ['FRA', 'MUC'],
-                'fr': ['CDG', 'ORY'],
-            }
             origin_candidates = [origin]
-            if country:
-                hubs = country_hubs.get(str(country).lower())
-                if hubs:
-                    origin_candidates.extend(hubs)
+            country_code = self.flight_search._normalize_gl(country)
+            if country_code:
+                origin_candidates.extend(get_airport_index().country_hubs(country_code, limit=4))
             origin_candidates = unique(origin_candidates)[:6]
 
             # Try combinations in a staged manner to stop as soon as we get success
             last_result: Dict[str, Any] = {}
-            from datetime import datetime, timedelta
             try:
                 base_dt = datetime.strptime(departure_date, "%Y-%m-%d")
             except Exception:
                 base_dt = datetime.utcnow() + timedelta(days=14)
             date_offsets = [0, 1, -1, 2, -2]
+            if concurrent is None:
+                concurrent = self.max_workers > 1
 
-            def _try_search(origins: List[str], destinations: List[str], offsets: List[int]) -> Optional[Dict[str, Any]]:
-                nonlocal last_result
+            alt_origins = [o for o in origin_candidates if o != origin]
+            top_dest_candidates = dest_candidates[:4] if len(dest_candidates) > 4 else dest_candidates
+            stages = [
+                # Stage 1: exact provided origin and destination only
+                ([origin], [destination], date_offsets),
+                # Stage 2: provided origin with destination candidates
+                ([origin], dest_candidates, date_offsets),
+                # Stage 3: alternate origin hubs (excluding the original), with top destination candidates
+                (alt_origins, top_dest_candidates, date_offsets),
+                # Stage 4: arrival_id candidates derived from destination string on the requested date
+                ([origin], self._destination_candidates(destination)[:6], [0]),
+            ]
+
+            # Combinations already searched by an earlier stage are not repeated
+            tried = set()
+            emitted = set()
+            for stage_no, (origins, destinations, offsets) in enumerate(stages, start=1):
+                combos = []
                 for o in origins:
                     for d in destinations:
                         for off in offsets:
                             dep_try = (base_dt + timedelta(days=off)).strftime("%Y-%m-%d")
-                            direct_results = self.flight_search.search_flights(
-                                origin=o,
-                                destination=d,
-                                departure_date=dep_try,
-                                return_date=return_date,
-                                adults=adults,
-                                cabin_class=cabin_class,
-                                country=country,
-                            )
-                            last_result = direct_results
-                            flights = direct_results.get("flights", []) if isinstance(direct_results, dict) else []
-                            if flights:
-                                analysis = self._analyze_flights_simple(flights)
-                                return {
-                                    "success": True,
-                                    "data": {
-                                        "flights": flights,
-                                        "recommendations": analysis.get("recommendations"),
-                                        "total_flights": analysis.get("total_flights"),
-                                        "price_range": analysis.get("price_range"),
-                                        "summary": analysis.get("summary"),
-                                        "data_source": direct_results.get("data_source", "serpapi"),
-                                    },
-                                    "raw_response": None,
-                                }
-                return None
-
-            # Stage 1: exact provided origin and destination only
-            result_stage1 = _try_search([origin], [destination], date_offsets)
-            if result_stage1:
-                return result_stage1
-
-            # Stage 2: provided origin with destination candidates
-            result_stage2 = _try_search([origin], dest_candidates, date_offsets)
-            if result_stage2:
-                return result_stage2
-
-            # Stage 3: alternate origin hubs (excluding the original), with top destination candidates
-            alt_origins = [o for o in origin_candidates if o != origin]
-            top_dest_candidates = dest_candidates[:4] if len(dest_candidates) > 4 else dest_candidates
-            result_stage3 = _try_search(alt_origins, top_dest_candidates, date_offsets)
-            if result_stage3:
-                return result_stage3
-
-            # Retry deterministically with arrival_id candidates derived from destination string
-            for cand in self._destination_candidates(destination)[:6]:
-                if not cand:
+                            if not o or not d or (o, d, dep_try) in tried:
+                                continue
+                            tried.add((o, d, dep_try))
+                            combos.append((o, d, dep_try))
+                if not combos:
                     continue
-                retry_results = self.flight_search.search_flights(
-                    origin=origin,
-                    destination=cand,
-                    departure_date=departure_date,
-                    return_date=return_date,
-                    adults=adults,
-                    cabin_class=cabin_class,
-                    country=country,
-                )
-                cand_flights = retry_results.get("flights", []) if isinstance(retry_results, dict) else []
-                if cand_flights:
-                    analysis = self._analyze_flights_simple(cand_flights)
-                    return {
-                        "success": True,
-                        "data": {
-                            "flights": cand_flights,
-                            "recommendations": analysis.get("recommendations"),
-                            "total_flights": analysis.get("total_flights"),
-                            "price_range": analysis.get("price_range"),
-                            "summary": analysis.get("summary"),
-                            "data_source": retry_results.get("data_source", "serpapi"),
-                        },
-                        "raw_response": None,
-                    }
+                search_kwargs = {
+                    "return_date": return_date,
+                    "adults": adults,
+                    "cabin_class": cabin_class,
+                    "country": country,
+                }
+                yield {"event": "stage", "stage": stage_no, "combinations": len(combos)}
+                async with aclosing(self._iter_stage(combos, search_kwargs, concurrent, shared)) as stage_results:
+                    async for (o, d, dep), result, is_winner in stage_results:
+                        last_result = result
+                        if (o, d, dep) not in emitted and result.get("flights"):
+                            emitted.add((o, d, dep))
+                            yield {
+                                "event": "flights",
+                                "stage": stage_no,
+                                "origin": o,
+                                "destination": d,
+                                "departure_date": dep,
+                                "flights": result.get("flights", []),
+                                "total_results": result.get("total_results", 0),
+                                "cache": result.get("cache"),
+                            }
+                        if is_winner:
+                            yield {"event": "result", "result": self._build_search_response(result)}
+                            return
 
             # If no flights found, return a quick, helpful response without invoking LLM agent
-            return {
+            yield {"event": "result", "result": {
                 "success": True,
                 "data": {
                     "flights": [],
                     "recommendations": None,
                     "total_flights": 0,
                     "price_range": {"lowest": 0, "highest": 0},
+                    "pareto_front": [],
                     "summary": "No flights found for the given criteria.",
                     "data_source": (last_result.get("data_source", "serpapi") if isinstance(last_result, dict) else "serpapi"),
                 },
                 "raw_response": None,
-            }
-                
+            }}
+
+        except QuotaExceeded:
+            raise
         except Exception as e:
-            return {
+            yield {"event": "result", "result": {
                 "success": False,
                 "error": f"Failed to search flights: {str(e)}",
                 "data": None
-            }
+            }}
 
 
 # Initialize the flight agent with API keys
 def get_flight_agent() -> FlightAIAgent:
-    """Get initialized flight AI agent using hybrid API approach"""
+    """Get the process-wide flight AI agent, rebuilt only when its API keys or settings change"""
     openai_api_key = os.getenv("OPENAI_API_KEY")
     serpapi_key = os.getenv("SERPAPI_KEY")
     
@@ -645,4 +1067,33 @@ def get_flight_agent() -> FlightAIAgent:
     if not serpapi_key:
         raise ValueError("SERPAPI_KEY environment variable is required")
     
-    return FlightAIAgent(openai_api_key, serpapi_key)
+    max_workers = int(os.getenv("FLIGHT_SEARCH_MAX_WORKERS", "6") or 1)
+    return registry.get(
+        "flight",
+        registry.fingerprint(openai_api_key, serpapi_key, max_workers),
+        lambda: FlightAIAgent(
+            openai_api_key,
+            serpapi_key,
+            max_workers=max_workers,
+            cache=get_flight_cache(),
+            memo=get_flight_memo(),
+        ),
+    )
+
+
+def get_flight_cache() -> Optional[TTLCache]:
+    """Shared flight result cache, or None when FLIGHT_CACHE_TTL is 0."""
+    from django.conf import settings
+    ttl = getattr(settings, "FLIGHT_CACHE_TTL", 900)
+    if not ttl:
+        return None
+    return get_cache("flights", ttl=ttl, stale_ttl=getattr(settings, "FLIGHT_CACHE_STALE_TTL", 0))
+
+
+def get_flight_memo() -> Optional[TTLCache]:
+    """Shared negative-result/gl memo, or None when FLIGHT_NEGATIVE_TTL is 0."""
+    from django.conf import settings
+    ttl = getattr(settings, "FLIGHT_NEGATIVE_TTL", 600)
+    if not ttl:
+        return None
+    return get_cache("flights-memo", ttl=ttl)
@@ -0,0 +1,102 @@
+"""Ranking for merged flight result lists.
+
+Flights from ``FlightSearchTool`` carry numeric ``price``, ``durationMinutes`` and
+``stops``. Older entries (e.g. still in the result cache) only have the formatted
+``duration`` string, which is parsed as a fallback.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+_UNKNOWN = float("inf")
+
+
+def duration_minutes(flight: Dict[str, Any]) -> float:
+    """Total minutes, or ``inf`` when unknown."""
+    minutes = flight.get("durationMinutes")
+    if isinstance(minutes, (int, float)) and minutes > 0:
+        return minutes
+    try:
+        # "31h 55m" as produced by _extract_serpapi_flight_data
+        parts = str(flight.get("duration") or "").split()
+        total = int(parts[0].rstrip("h")) * 60 + (int(parts[1].rstrip("m")) if len(parts) > 1 else 0)
+        return total if total > 0 else _UNKNOWN
+    except (ValueError, IndexError):
+        return _UNKNOWN
+
+
+def _metrics(flight: Dict[str, Any]) -> Tuple[float, float, float]:
+    price = flight.get("price")
+    price = price if isinstance(price, (int, float)) and price > 0 else _UNKNOWN
+    stops = flight.get("stops")
+    stops = stops if isinstance(stops, int) and stops >= 0 else _UNKNOWN
+    return price, duration_minutes(flight), stops
+
+
+def rank_flights(flights: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Pick the best-value, fastest and fewest-stops flights and the Pareto front.
+
+    The picks come from one pass over the list. Ties break on the other two criteria
+    (e.g. fastest = shortest, then cheapest, then fewest stops), so every pick is itself
+    Pareto-optimal. Unknown prices/durations rank last.
+
+    ``pareto_front`` holds the flights that no other flight beats or matches on all of
+    price, duration and stops, cheapest first. Of flights identical on all three, only the
+    first listed is kept. It takes one sort plus a sweep that keeps the shortest duration
+    seen per stop count: O(n log n) for n flights.
+    """
+    best_value = fastest = most_convenient = None
+    best_value_key = fastest_key = convenient_key = None
+    lowest = highest = None
+    keyed = []
+
+    for flight in flights:
+        price, minutes, stops = _metrics(flight)
+        keyed.append((price, minutes, stops, flight))
+
+        value_key = (price, minutes, stops)
+        if best_value_key is None or value_key < best_value_key:
+            best_value, best_value_key = flight, value_key
+        speed_key = (minutes, price, stops)
+        if fastest_key is None or speed_key < fastest_key:
+            fastest, fastest_key = flight, speed_key
+        stops_key = (stops, price, minutes)
+        if convenient_key is None or stops_key < convenient_key:
+            most_convenient, convenient_key = flight, stops_key
+
+        if price != _UNKNOWN:
+            lowest = price if lowest is None or price < lowest else lowest
+            highest = price if highest is None or price > highest else highest
+
+    return {
+        "best_value": best_value,
+        "fastest": fastest,
+        "most_convenient": most_convenient,
+        "price_range": {"lowest": lowest or 0, "highest": highest or 0},
+        "pareto_front": _pareto_front(keyed),
+    }
+
+
+def _pareto_front(keyed: List[Tuple[float, float, float, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    comparable = [k for k in keyed if _UNKNOWN not in k[:3]]
+    # Cheapest first, so every potential dominator of a flight is seen before it (the
+    # sort is stable, so the first listed of identical flights comes first)
+    comparable.sort(key=lambda k: k[:3])
+
+    # stop count -> (shortest duration so far, cheapest price at that duration)
+    best: Dict[float, Tuple[float, float]] = {}
+    front: List[Dict[str, Any]] = []
+    for price, minutes, stops, flight in comparable:
+        dominated = False
+        for s, (best_minutes, best_price) in best.items():
+            if s < stops and best_minutes <= minutes:
+                dominated = True
+            elif s == stops and (best_minutes < minutes or (best_minutes == minutes and best_price <= price)):
+                dominated = True
+            if dominated:
+                break
+        if not dominated:
+            front.append(flight)
+        current = best.get(stops)
+        if current is None or minutes < current[0]:
+            best[stops] = (minutes, price)
+    return front
@@ -0,0 +1,101 @@
+"""Vectorized great-circle distances (numpy).
+
+``haversine_matrix`` computes every origin x target distance in one broadcast instead of
+a Python loop per pair, and ``distances_from`` the distances from one centre to N points
+(e.g. every feature of a places response). ``rank_by_proximity`` uses them to order
+candidate places (e.g. hotels) by their aggregate distance to a set of points of interest.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+AGGREGATES = ("sum", "mean", "max")
+
+
+def coordinates(item: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """``(lat, lon)`` of a dict carrying ``lat``/``lon``, or None when missing/invalid."""
+    try:
+        lat, lon = float(item.get("lat")), float(item.get("lon"))
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    return lat, lon
+
+
+def haversine_matrix(origins: Sequence[Tuple[float, float]], targets: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """``(len(origins), len(targets))`` array of distances in km."""
+    a = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    b = np.radians(np.asarray(targets, dtype=np.float64).reshape(-1, 2))
+    lat1, lon1 = a[:, 0:1], a[:, 1:2]
+    lat2, lon2 = b[:, 0], b[:, 1]
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def distances_from(lat: float, lon: float, points: Sequence[Optional[Tuple[float, float]]]) -> np.ndarray:
+    """Distances in km from ``(lat, lon)`` to each point; NaN where a point is None."""
+    located = [p is not None for p in points]
+    out = np.full(len(points), np.nan)
+    if any(located):
+        mask = np.asarray(located)
+        out[mask] = haversine_matrix([(lat, lon)], [p for p in points if p is not None])[0]
+    return out
+
+
+def rounded_km(distances: np.ndarray, ndigits: int = 2) -> List[Optional[float]]:
+    """``distances`` rounded for a JSON response, NaN as None."""
+    return [None if d != d else d for d in np.round(distances, ndigits).tolist()]
+
+
+def rank_by_proximity(
+    candidates: Iterable[Dict[str, Any]],
+    pois: Iterable[Dict[str, Any]],
+    aggregate: str = "sum",
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Order ``candidates`` by aggregate distance to ``pois``; returns ``(ranked, unlocated)``.
+
+    Each ranked candidate is a copy with ``proximity: {total_km, mean_km, max_km,
+    nearest_km}``; ``aggregate`` (sum, mean or max) picks the ordering. Candidates or POIs
+    without valid coordinates are left out of the distance computation.
+    """
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"aggregate must be one of {', '.join(AGGREGATES)}")
+    located: List[Dict[str, Any]] = []
+    origins: List[Tuple[float, float]] = []
+    unlocated: List[Dict[str, Any]] = []
+    for c in candidates:
+        point = coordinates(c)
+        if point is None:
+            unlocated.append(c)
+        else:
+            located.append(c)
+            origins.append(point)
+    targets = [p for p in (coordinates(poi) for poi in pois) if p is not None]
+    if not located or not targets:
+        return [{**c, "proximity": None} for c in located], unlocated
+
+    distances = haversine_matrix(origins, targets)
+    total = distances.sum(axis=1)
+    mean = total / len(targets)
+    furthest = distances.max(axis=1)
+    nearest = distances.min(axis=1)
+    key = {"sum": total, "mean": mean, "max": furthest}[aggregate]
+    # Stable, so equally placed candidates keep their incoming (e.g. price) order
+    order = np.argsort(key, kind="stable")
+    ranked = [
+        {
+            **located[i],
+            "proximity": {
+                "total_km": round(float(total[i]), 3),
+                "mean_km": round(float(mean[i]), 3),
+                "max_km": round(float(furthest[i]), 3),
+                "nearest_km": round(float(nearest[i]), 3),
+            },
+        }
+        for i in order.tolist()
+    ]
+    return ranked, unlocated
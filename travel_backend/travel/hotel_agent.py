@@ -1,7 +1,11 @@
+import asyncio
 import os
 import json
 import re
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
 
 from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain_openai import ChatOpenAI
@@ -10,14 +14,72 @@ from langchain_core.tools import tool
 from serpapi import GoogleSearch
 from dotenv import load_dotenv
 
+from .agent_registry import registry
+from .cache import TTLCache, get_cache
+from .coalesce import get_single_flight
+from .geodistance import rank_by_proximity
+from .hotel_index import HotelIndex, recommend
+from .quota import QuotaExceeded, charge
+from .upstream import serpapi_get_json
+
 load_dotenv()
 
 
 class HotelSearchTool:
     """Tool for searching hotels using SerpAPI Google Hotels API"""
 
-    def __init__(self, serpapi_key: str):
+    def __init__(self, serpapi_key: str, cache: Optional[TTLCache] = None):
         self.serpapi_key = serpapi_key
+        # Optional cache of the unfiltered property list per stay (see travel.cache); budget
+        # filtering runs on every call, so changing it never costs an upstream call
+        self.cache = cache
+        # Identical concurrent searches share one upstream call; budget filtering happens per caller
+        self._coalescer = get_single_flight("serpapi-hotels")
+
+    def _coalesce_key(self, params: Dict[str, Any]) -> str:
+        return self._coalescer.make_key({k: v for k, v in params.items() if k != "api_key"})
+
+    @staticmethod
+    def _normalize_date(value: Any) -> str:
+        text = str(value or "").strip()
+        try:
+            return date.fromisoformat(text[:10]).isoformat()
+        except ValueError:
+            return text
+
+    def _build_params(
+        self,
+        destination: str,
+        check_in_date: str,
+        check_out_date: str,
+        adults: int,
+        currency: str,
+        country: str,
+        language: str,
+    ) -> Dict[str, Any]:
+        """SerpAPI params; every field is normalized so it doubles as the cache key"""
+        return {
+            "engine": "google_hotels",
+            "api_key": self.serpapi_key,
+            "q": " ".join(str(destination or "").split()),
+            "check_in_date": self._normalize_date(check_in_date),
+            "check_out_date": self._normalize_date(check_out_date),
+            "adults": max(int(adults or 1), 1),
+            "currency": str(currency or "USD").strip().upper(),
+            "gl": str(country or "us").strip().lower(),
+            "hl": str(language or "en").strip().lower(),
+            "vacation_rentals": False,
+        }
+
+    def _cache_key(self, params: Dict[str, Any], page: int = 0) -> str:
+        return self.cache.make_key(
+            params["q"].lower(), params["check_in_date"], params["check_out_date"],
+            params["adults"], params["currency"], params["gl"], params["hl"], page,
+        )
+
+    @staticmethod
+    def _should_cache(result: Any) -> bool:
+        return isinstance(result, dict) and bool(result.get("success")) and bool(result.get("hotels"))
 
     def search_hotels(
         self,
@@ -29,47 +91,180 @@ class HotelSearchTool:
         country: str = "us",
         language: str = "en",
         budget_max: Optional[int] = None,
+        bypass_cache: bool = False,
     ) -> Dict[str, Any]:
+        """Search hotels, serving the property list from cache when possible.
+
+        ``budget_max`` is applied to the (cached) list on every call. ``bypass_cache``
+        forces an upstream call and replaces the cached entry. With a cache configured
+        the result carries ``cache: {hit, age_seconds, stale}``. Only the first results
+        page is read; pagination (``min_results``) is available in ``search_hotels_async``.
+        """
         try:
-            params = {
-                "engine": "google_hotels",
-                "api_key": self.serpapi_key,
-                "q": destination,
-                "check_in_date": check_in_date,
-                "check_out_date": check_out_date,
-                "adults": adults,
-                "currency": currency,
-                "gl": country,
-                "hl": language,
-                "vacation_rentals": False,
-            }
+            params = self._build_params(destination, check_in_date, check_out_date, adults, currency, country, language)
+
+            def fetch():
+                def call():
+                    charge("serpapi")
+                    return GoogleSearch(params).get_dict()
+
+                results = self._coalescer.do(self._coalesce_key(params), call)
+                try:
+                    print(f"HotelSearchTool: fetched results with keys: {list(results.keys())[:8]}")
+                except Exception:
+                    pass
+                return self._process_hotels_results(results)
+
+            if self.cache is None:
+                return self._filter_hotels(fetch(), budget_max)
+            result, meta = self.cache.get_or_fetch(
+                self._cache_key(params), fetch, should_cache=self._should_cache, bypass=bypass_cache
+            )
+            return {**self._filter_hotels(result, budget_max), "cache": meta}
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            return {"success": False, "error": f"Hotel search failed: {str(e)}", "hotels": []}
 
-            search = GoogleSearch(params)
-            results = search.get_dict()
-            try:
-                print(f"HotelSearchTool: fetched results with keys: {list(results.keys())[:8]}")
-            except Exception:
-                pass
-            return self._process_hotels_results(results, budget_max)
+    async def search_hotels_async(
+        self,
+        destination: str,
+        check_in_date: str,
+        check_out_date: str,
+        adults: int = 1,
+        currency: str = "USD",
+        country: str = "us",
+        language: str = "en",
+        budget_max: Optional[int] = None,
+        bypass_cache: bool = False,
+        min_results: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        time_budget: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Non-blocking ``search_hotels`` over the shared httpx client.
+
+        With ``min_results`` the search follows SerpAPI's ``next_page_token`` until that many
+        hotels pass the filters, ``max_pages`` pages were read or ``time_budget`` seconds
+        passed (defaults: ``HOTEL_MAX_PAGES``, ``HOTEL_PAGINATION_TIME_BUDGET``). When a page
+        cannot reach ``min_results`` by itself, the next one is requested before it is filtered.
+        Each page is cached on its own and the result carries ``pagination: {pages, stopped}``.
+        """
+        try:
+            params = self._build_params(destination, check_in_date, check_out_date, adults, currency, country, language)
+            first, meta = await self._fetch_page_async(params, 0, None, bypass_cache)
+            if min_results and first.get("success"):
+                result = await self._paginate_async(params, first, budget_max, int(min_results),
+                                                    max_pages, time_budget, bypass_cache)
+            else:
+                result = self._filter_hotels(first, budget_max)
+            return result if meta is None else {**result, "cache": meta}
+        except (asyncio.CancelledError, QuotaExceeded):
+            raise
         except Exception as e:
             return {"success": False, "error": f"Hotel search failed: {str(e)}", "hotels": []}
 
-    def _process_hotels_results(self, results: Dict[str, Any], budget_max: Optional[int]) -> Dict[str, Any]:
+    async def _fetch_page_async(
+        self, params: Dict[str, Any], page: int, token: Optional[str], bypass_cache: bool
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """One processed, unfiltered results page and its cache meta (None without a cache)."""
+        page_params = params if token is None else {**params, "next_page_token": token}
+
+        async def fetch():
+            results = await self._coalescer.ado(self._coalesce_key(page_params), lambda: serpapi_get_json(page_params))
+            return self._process_hotels_results(results)
+
+        if self.cache is None:
+            return await fetch(), None
+        return await self.cache.aget_or_fetch(
+            self._cache_key(params, page), fetch, should_cache=self._should_cache, bypass=bypass_cache
+        )
+
+    async def _paginate_async(
+        self,
+        params: Dict[str, Any],
+        first: Dict[str, Any],
+        budget_max: Any,
+        min_results: int,
+        max_pages: Optional[int],
+        time_budget: Optional[float],
+        bypass_cache: bool,
+    ) -> Dict[str, Any]:
+        from django.conf import settings
+
+        max_pages = max(1, int(max_pages or getattr(settings, "HOTEL_MAX_PAGES", 3)))
+        time_budget = float(time_budget or getattr(settings, "HOTEL_PAGINATION_TIME_BUDGET", 8.0))
+        started = time.monotonic()
+        hotels: List[Dict[str, Any]] = []
+        seen: set = set()
+        page_result, pages, stopped = first, 0, None
+        prefetch: Optional[asyncio.Task] = None
+        try:
+            while True:
+                pages += 1
+                token = page_result.get("next_page_token") if page_result.get("success") else None
+                more = bool(token) and pages < max_pages
+                if more and len(hotels) + len(page_result.get("hotels") or []) < min_results:
+                    # This page cannot reach min_results even unfiltered: send the next request now
+                    prefetch = asyncio.ensure_future(self._fetch_page_async(params, pages, token, bypass_cache))
+                    await asyncio.sleep(0)
+                # Pages of a refreshed stay can overlap the cached ones; keep the first copy
+                for hotel in self._filter_hotels(page_result, budget_max).get("hotels", []):
+                    if hotel["id"] not in seen:
+                        seen.add(hotel["id"])
+                        hotels.append(hotel)
+                if len(hotels) >= min_results:
+                    stopped = "enough_results"
+                    break
+                if more and prefetch is None:
+                    prefetch = asyncio.ensure_future(self._fetch_page_async(params, pages, token, bypass_cache))
+                if prefetch is None:
+                    stopped = "max_pages" if token else "last_page"
+                    break
+                remaining = time_budget - (time.monotonic() - started)
+                try:
+                    page_result, _meta = await asyncio.wait_for(prefetch, max(remaining, 0.0))
+                except asyncio.TimeoutError:
+                    stopped = "time_budget"
+                    break
+                except QuotaExceeded:
+                    stopped = "quota"
+                    break
+                except Exception as e:
+                    print(f"HotelSearchTool: page {pages + 1} failed: {e}")
+                    stopped = "page_error"
+                    break
+                finally:
+                    prefetch = None
+        finally:
+            if prefetch is not None:
+                prefetch.cancel()
+
+        return {
+            **first,
+            "hotels": hotels,
+            "total_results": len(hotels),
+            "pagination": {
+                "pages": pages,
+                "stopped": stopped,
+                "elapsed_ms": int((time.monotonic() - started) * 1000),
+            },
+        }
+
+    def _process_hotels_results(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """Map the raw SerpAPI properties; this unfiltered result is what gets cached."""
         hotels: List[Dict[str, Any]] = []
         try:
             raw_hotels = results.get("properties", []) or results.get("hotels_results", [])
             for item in raw_hotels:
                 mapped = self._extract_hotel(item)
-                if mapped is None:
-                    continue
-                if budget_max is not None and mapped.get("price", 0) > budget_max:
-                    continue
-                hotels.append(mapped)
+                if mapped is not None:
+                    hotels.append(mapped)
 
             return {
                 "success": True,
                 "hotels": hotels,
                 "total_results": len(hotels),
+                "next_page_token": (results.get("serpapi_pagination") or {}).get("next_page_token"),
                 "search_info": {
                     "destination": results.get("search_parameters", {}).get("q"),
                     "dates": {
@@ -81,6 +276,27 @@ class HotelSearchTool:
         except Exception as e:
             return {"success": False, "error": f"Failed to process hotels: {str(e)}", "hotels": []}
 
+    def _filter_hotels(self, result: Dict[str, Any], budget_max: Any) -> Dict[str, Any]:
+        """Apply per-request filters to a processed (possibly cached) result.
+
+        Hotels without a usable price (missing, 0 or not a number) are kept: SerpAPI often
+        omits rates for properties that are bookable, so the budget cannot rule them out.
+        """
+        if not result.get("success"):
+            return result
+        try:
+            limit = float(budget_max) if budget_max not in (None, "") else None
+        except (TypeError, ValueError):
+            limit = None
+        if limit is None:
+            return result
+        hotels = []
+        for hotel in result.get("hotels", []):
+            price = hotel.get("price")
+            if not isinstance(price, (int, float)) or price <= 0 or price <= limit:
+                hotels.append(hotel)
+        return {**result, "hotels": hotels, "total_results": len(hotels)}
+
     def _extract_hotel(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         try:
             name = item.get("name") or item.get("title")
@@ -122,6 +338,7 @@ class HotelSearchTool:
                 price_category = "comfort"
 
             distance = item.get("distance_from_destination") or item.get("distance") or ""
+            gps = item.get("gps_coordinates") or {}
 
             mapped = {
                 "id": item.get("property_token") or item.get("link") or name,
@@ -130,6 +347,8 @@ class HotelSearchTool:
                 "rating": float(rating) if isinstance(rating, (int, float)) else 0,
                 "location": address,
                 "distance": str(distance) if distance else "",
+                "lat": gps.get("latitude") if isinstance(gps, dict) else None,
+                "lon": gps.get("longitude") if isinstance(gps, dict) else None,
                 "amenities": amenities if isinstance(amenities, list) else [],
                 "image": image_url or "/placeholder.svg",
                 "priceCategory": price_category,
@@ -142,12 +361,32 @@ class HotelSearchTool:
 class HotelAIAgent:
     """AI Agent for hotel search and recommendations (SerpAPI Google Hotels)"""
 
-    def __init__(self, openai_api_key: str, serpapi_key: str):
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.1, api_key=openai_api_key)
-        self.hotel_search = HotelSearchTool(serpapi_key)
-        self.agent_executor = self._create_agent()
-
-    def _create_agent(self) -> AgentExecutor:
+    def __init__(self, openai_api_key: str, serpapi_key: str, cache: Optional[TTLCache] = None):
+        self._openai_api_key = openai_api_key
+        self._llm: Optional[ChatOpenAI] = None
+        self._agent_executor: Optional[AgentExecutor] = None
+        self._init_lock = threading.Lock()
+        self.hotel_search = HotelSearchTool(serpapi_key, cache=cache)
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        if self._llm is None:
+            with self._init_lock:
+                if self._llm is None:
+                    self._llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.1, api_key=self._openai_api_key)
+        return self._llm
+
+    @property
+    def agent_executor(self) -> AgentExecutor:
+        """LangChain tool-calling executor, built on first use"""
+        if self._agent_executor is None:
+            llm = self.llm
+            with self._init_lock:
+                if self._agent_executor is None:
+                    self._agent_executor = self._create_agent(llm)
+        return self._agent_executor
+
+    def _create_agent(self, llm: ChatOpenAI) -> AgentExecutor:
         @tool
         def search_hotels(
             destination: str,
@@ -195,21 +434,7 @@ class HotelAIAgent:
                 if not hotels:
                     return json.dumps({"success": True, "recommendations": {}})
 
-                by_price = sorted(hotels, key=lambda h: h.get("price", 1e9))
-                by_rating = sorted(hotels, key=lambda h: -h.get("rating", 0))
-
-                def value_score(h):
-                    price = h.get("price", 0) or 1
-                    rating = h.get("rating", 0)
-                    return rating / price
-
-                by_value = sorted(hotels, key=value_score, reverse=True)
-
-                recs = {
-                    "best_budget": by_price[0] if by_price else None,
-                    "best_rated": by_rating[0] if by_rating else None,
-                    "best_value": by_value[0] if by_value else None,
-                }
+                recs = recommend(hotels)
                 return json.dumps({"success": True, "recommendations": recs}, indent=2)
             except Exception as e:
                 return json.dumps({"success": False, "error": str(e)})
@@ -227,7 +452,7 @@ Return structured JSON that contains: hotels[], recommendations{{best_budget, be
             ]
         )
 
-        agent = create_openai_tools_agent(self.llm, [search_hotels, analyze_hotel_options], prompt)
+        agent = create_openai_tools_agent(llm, [search_hotels, analyze_hotel_options], prompt)
         return AgentExecutor(agent=agent, tools=[search_hotels, analyze_hotel_options], verbose=True)
 
     async def search_and_recommend_hotels(
@@ -240,12 +465,15 @@ Return structured JSON that contains: hotels[], recommendations{{best_budget, be
         country: str = "us",
         language: str = "en",
         budget_max: Optional[int] = None,
+        bypass_cache: bool = False,
+        min_results: Optional[int] = None,
+        max_pages: Optional[int] = None,
     ) -> Dict[str, Any]:
         """Return only the hotel items needed by the frontend mock: id, name, price, rating, location, distance, amenities, image, priceCategory."""
         print(
             f"HotelAIAgent.search_and_recommend_hotels params: dest={destination}, dates={check_in_date}->{check_out_date}, adults={adults}, budget_max={budget_max}"
         )
-        base = self.hotel_search.search_hotels(
+        base = await self.hotel_search.search_hotels_async(
             destination=destination,
             check_in_date=check_in_date,
             check_out_date=check_out_date,
@@ -254,41 +482,145 @@ Return structured JSON that contains: hotels[], recommendations{{best_budget, be
             country=country,
             language=language,
             budget_max=budget_max,
+            bypass_cache=bypass_cache,
+            min_results=min_results,
+            max_pages=max_pages,
         )
 
         print(f"HotelAIAgent: raw base success={base.get('success')} total={len(base.get('hotels', [])) if isinstance(base, dict) else 'n/a'}")
         hotels = base.get("hotels", []) if isinstance(base, dict) else []
 
         # Ensure each item only has required fields
-        trimmed: List[Dict[str, Any]] = []
-        for h in hotels:
-            trimmed.append(
-                {
-                    "id": h.get("id"),
-                    "name": h.get("name"),
-                    "price": h.get("price", 0),
-                    "rating": h.get("rating", 0.0),
-                    "location": h.get("location", ""),
-                    "distance": h.get("distance", ""),
-                    "amenities": h.get("amenities", []),
-                    "image": h.get("image", "/placeholder.svg"),
-                    "priceCategory": h.get("priceCategory") or (
-                        "luxury" if (h.get("price") or 0) >= 250 else ("comfort" if (h.get("price") or 0) >= 120 else "budget")
-                    ),
-                }
-            )
+        trimmed = [_trim_hotel(h) for h in hotels]
 
         print(f"HotelAIAgent: trimmed {len(trimmed)} hotels. Sample: {trimmed[0] if trimmed else '[]'}")
-        return {"success": True, "data": {"hotels": trimmed}}
+        response = {"success": True, "data": {"hotels": trimmed}, "cache": base.get("cache") if isinstance(base, dict) else None}
+        if isinstance(base, dict) and base.get("pagination"):
+            response["pagination"] = base["pagination"]
+        return response
+
+    async def query_hotels(
+        self,
+        destination: str,
+        check_in_date: str,
+        check_out_date: str,
+        adults: int = 1,
+        currency: str = "USD",
+        country: str = "us",
+        language: str = "en",
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Filter, rank and page a stay's hotels server-side (see travel.hotel_index).
+
+        The hotel list comes from the search cache, so refining filters costs no upstream
+        call; only a cold stay triggers a search.
+        """
+        base = await self.hotel_search.search_hotels_async(
+            destination=destination,
+            check_in_date=check_in_date,
+            check_out_date=check_out_date,
+            adults=adults,
+            currency=currency,
+            country=country,
+            language=language,
+        )
+        if not base.get("success"):
+            return {"success": False, "error": base.get("error") or "Hotel search failed"}
+        filters = filters or {}
+        index = HotelIndex([_trim_hotel(h) for h in base.get("hotels", [])])
+        total, page = index.query(**filters)
+        return {
+            "success": True,
+            "data": {
+                "hotels": page,
+                "total": total,
+                "offset": filters.get("offset", 0),
+                "limit": filters.get("limit", 20),
+                "amenities": index.amenities(),
+            },
+            "cache": base.get("cache"),
+        }
+
+    async def rank_hotels_by_proximity(
+        self,
+        destination: str,
+        check_in_date: str,
+        check_out_date: str,
+        pois: List[Dict[str, Any]],
+        adults: int = 1,
+        currency: str = "USD",
+        country: str = "us",
+        language: str = "en",
+        budget_max: Optional[int] = None,
+        aggregate: str = "sum",
+        limit: int = 20,
+    ) -> Dict[str, Any]:
+        """Order a stay's (cached) hotels by aggregate distance to ``pois`` (see travel.geodistance)."""
+        base = await self.hotel_search.search_hotels_async(
+            destination=destination,
+            check_in_date=check_in_date,
+            check_out_date=check_out_date,
+            adults=adults,
+            currency=currency,
+            country=country,
+            language=language,
+            budget_max=budget_max,
+        )
+        if not base.get("success"):
+            return {"success": False, "error": base.get("error") or "Hotel search failed"}
+        ranked, unlocated = rank_by_proximity([_trim_hotel(h) for h in base.get("hotels", [])], pois, aggregate)
+        return {
+            "success": True,
+            "data": {
+                "hotels": ranked[:limit],
+                "total": len(ranked),
+                "without_coordinates": len(unlocated),
+                "aggregate": aggregate,
+            },
+            "cache": base.get("cache"),
+        }
+
+
+def _trim_hotel(h: Dict[str, Any]) -> Dict[str, Any]:
+    """Only the fields the frontend hotel cards use."""
+    return {
+        "id": h.get("id"),
+        "name": h.get("name"),
+        "price": h.get("price", 0),
+        "rating": h.get("rating", 0.0),
+        "location": h.get("location", ""),
+        "distance": h.get("distance", ""),
+        "lat": h.get("lat"),
+        "lon": h.get("lon"),
+        "amenities": h.get("amenities", []),
+        "image": h.get("image", "/placeholder.svg"),
+        "priceCategory": h.get("priceCategory") or (
+            "luxury" if (h.get("price") or 0) >= 250 else ("comfort" if (h.get("price") or 0) >= 120 else "budget")
+        ),
+    }
 
 
 def get_hotel_agent() -> HotelAIAgent:
+    """Get the process-wide hotel AI agent, rebuilt only when its API keys change"""
     openai_api_key = os.getenv("OPENAI_API_KEY")
     serpapi_key = os.getenv("SERPAPI_KEY")
     if not openai_api_key:
         raise ValueError("OPENAI_API_KEY environment variable is required")
     if not serpapi_key:
         raise ValueError("SERPAPI_KEY environment variable is required")
-    return HotelAIAgent(openai_api_key, serpapi_key)
+    return registry.get(
+        "hotel",
+        registry.fingerprint(openai_api_key, serpapi_key),
+        lambda: HotelAIAgent(openai_api_key, serpapi_key, cache=get_hotel_cache()),
+    )
+
+
+def get_hotel_cache() -> Optional[TTLCache]:
+    """Shared hotel property-list cache, or None when HOTEL_CACHE_TTL is 0."""
+    from django.conf import settings
+    ttl = getattr(settings, "HOTEL_CACHE_TTL", 1800)
+    if not ttl:
+        return None
+    return get_cache("hotels", ttl=ttl, stale_ttl=getattr(settings, "HOTEL_CACHE_STALE_TTL", 0))
 
 
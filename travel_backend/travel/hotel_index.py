@@ -0,0 +1,172 @@
+"""Filtering and top-k ranking over a hotel search result (see /api/hotels/query/).
+
+``HotelIndex`` keeps one row per hotel in parallel columns: price, rating and value score
+in ``array('d')``, the price category as a small int code, and the amenities as an int
+bitset over the result's amenity vocabulary. A query tests ``mask & required == required``
+and numeric bounds per row, then selects only the requested page with a bounded heap,
+so the UI never has to download and filter the whole list.
+"""
+
+import heapq
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+PRICE_CATEGORIES = ("budget", "comfort", "luxury")
+
+SORTS = ("value", "price", "rating")
+
+
+def value_score(hotel: Dict[str, Any]) -> float:
+    """Rating per unit of nightly price; 0 when the price is unknown."""
+    price = hotel.get("price") or 0
+    rating = hotel.get("rating") or 0
+    if not isinstance(price, (int, float)) or not isinstance(rating, (int, float)) or price <= 0:
+        return 0.0
+    return float(rating) / float(price)
+
+
+def _number(value: Any) -> float:
+    """``value`` as a float, 0 when missing or not numeric (e.g. an unparsed price string)."""
+    return float(value) if isinstance(value, (int, float)) else 0.0
+
+
+def _amenity_key(name: Any) -> str:
+    return " ".join(str(name or "").split()).lower()
+
+
+def recommend(hotels: Iterable[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """best_budget / best_rated / best_value in one pass.
+
+    Unknown (zero or non-numeric) prices never win best_budget; ties fall back to rating,
+    then price.
+    """
+    best_budget = best_rated = best_value = None
+    budget_key = rated_key = value_key = None
+    for h in hotels:
+        price = _number(h.get("price"))
+        rating = _number(h.get("rating"))
+        if price > 0:
+            key = (price, -rating)
+            if budget_key is None or key < budget_key:
+                best_budget, budget_key = h, key
+        key = (-rating, price if price > 0 else float("inf"))
+        if rated_key is None or key < rated_key:
+            best_rated, rated_key = h, key
+        key = (-value_score(h), -rating)
+        if value_key is None or key < value_key:
+            best_value, value_key = h, key
+    return {"best_budget": best_budget, "best_rated": best_rated, "best_value": best_value}
+
+
+class HotelIndex:
+    """Columnar view of one hotel list for repeated multi-criteria queries."""
+
+    def __init__(self, hotels: List[Dict[str, Any]]):
+        self.hotels = hotels
+        self.prices = array("d")
+        self.ratings = array("d")
+        self.values = array("d")
+        self.categories = array("b")
+        self.masks: List[int] = []
+        self.vocabulary: Dict[str, int] = {}
+        self._labels: List[str] = []
+        self._counts: List[int] = []
+        for h in hotels:
+            self.prices.append(_number(h.get("price")))
+            self.ratings.append(_number(h.get("rating")))
+            self.values.append(value_score(h))
+            category = h.get("priceCategory")
+            self.categories.append(PRICE_CATEGORIES.index(category) if category in PRICE_CATEGORIES else -1)
+            mask = 0
+            for name in h.get("amenities") or []:
+                key = _amenity_key(name)
+                if not key:
+                    continue
+                bit = self.vocabulary.get(key)
+                if bit is None:
+                    bit = self.vocabulary[key] = len(self._labels)
+                    self._labels.append(str(name).strip())
+                    self._counts.append(0)
+                if not mask >> bit & 1:
+                    self._counts[bit] += 1
+                mask |= 1 << bit
+            self.masks.append(mask)
+
+    def __len__(self) -> int:
+        return len(self.hotels)
+
+    def amenities(self) -> List[Dict[str, Any]]:
+        """Amenity vocabulary with hotel counts, most common first (for filter chips)."""
+        order = sorted(range(len(self._labels)), key=lambda b: (-self._counts[b], self._labels[b].lower()))
+        return [{"name": self._labels[b], "count": self._counts[b]} for b in order]
+
+    def required_mask(self, amenities: Iterable[Any]) -> Optional[int]:
+        """Bitset of the requested amenities; None if one of them no hotel offers."""
+        mask = 0
+        for name in amenities:
+            key = _amenity_key(name)
+            if not key:
+                continue
+            bit = self.vocabulary.get(key)
+            if bit is None:
+                return None
+            mask |= 1 << bit
+        return mask
+
+    def query(
+        self,
+        amenities: Iterable[Any] = (),
+        price_min: Optional[float] = None,
+        price_max: Optional[float] = None,
+        min_rating: Optional[float] = None,
+        categories: Iterable[str] = (),
+        sort: str = "value",
+        offset: int = 0,
+        limit: int = 20,
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Return ``(total matches, requested page)`` of hotels.
+
+        Hotels must offer every amenity in ``amenities``. A price bound excludes hotels
+        with an unknown price. ``sort`` is ``value`` (rating per price, high first),
+        ``price`` (low first, unknown last) or ``rating`` (high first).
+        """
+        required = self.required_mask(amenities)
+        if required is None:
+            return 0, []
+        codes = {PRICE_CATEGORIES.index(c) for c in categories if c in PRICE_CATEGORIES}
+        if categories and not codes:
+            return 0, []
+        lo = float(price_min) if price_min is not None else None
+        hi = float(price_max) if price_max is not None else None
+        rating_floor = float(min_rating) if min_rating is not None else None
+        prices, ratings, values, cats, masks = self.prices, self.ratings, self.values, self.categories, self.masks
+
+        matches = []
+        for i in range(len(self.hotels)):
+            if masks[i] & required != required:
+                continue
+            price = prices[i]
+            if (lo is not None or hi is not None) and price <= 0:
+                continue
+            if lo is not None and price < lo:
+                continue
+            if hi is not None and price > hi:
+                continue
+            if rating_floor is not None and ratings[i] < rating_floor:
+                continue
+            if codes and cats[i] not in codes:
+                continue
+            matches.append(i)
+
+        if sort == "price":
+            key = lambda i: (prices[i] if prices[i] > 0 else float("inf"), -ratings[i], i)
+        elif sort == "rating":
+            key = lambda i: (-ratings[i], prices[i] if prices[i] > 0 else float("inf"), i)
+        else:
+            key = lambda i: (-values[i], -ratings[i], i)
+        offset, limit = max(0, int(offset)), max(0, int(limit))
+        # Only the rows up to the end of the requested page are ordered
+        top = heapq.nsmallest(offset + limit, matches, key=key)
+        return len(matches), [
+            {**self.hotels[i], "valueScore": round(values[i], 5)} for i in top[offset:offset + limit]
+        ]
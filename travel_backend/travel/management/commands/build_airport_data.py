@@ -0,0 +1,57 @@
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from travel.airports import DATA_PATH, FIELDS
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerate travel/data/airports.csv from the airportsdata project "
+        "(https://github.com/mborsetti/airportsdata, MIT): pass its airports.csv and iata_macs.csv."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("airports_csv", help="airportsdata airports.csv")
+        parser.add_argument("macs_csv", help="airportsdata iata_macs.csv (metropolitan area codes)")
+        parser.add_argument("--output", default=str(DATA_PATH))
+
+    def handle(self, *args, **options):
+        airports_path = Path(options["airports_csv"])
+        macs_path = Path(options["macs_csv"])
+        for path in (airports_path, macs_path):
+            if not path.exists():
+                raise CommandError(f"{path} does not exist")
+
+        # Airport code -> (metro code, metro city name)
+        metros = {}
+        with macs_path.open(newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                metros[row["Airport Code"].strip()] = (row["City Code"].strip(), row["City Name"].strip())
+
+        rows = []
+        with airports_path.open(newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                iata = (row.get("iata") or "").strip().upper()
+                if len(iata) != 3:
+                    continue
+                metro, metro_city = metros.get(iata, ("", ""))
+                rows.append({
+                    "iata": iata,
+                    "name": row["name"].strip(),
+                    "city": row["city"].strip(),
+                    "subdivision": row["subd"].strip(),
+                    "country": row["country"].strip().upper(),
+                    "lat": f"{float(row['lat']):.5f}",
+                    "lon": f"{float(row['lon']):.5f}",
+                    "metro": metro,
+                    "metro_city": metro_city,
+                })
+        rows.sort(key=lambda r: r["iata"])
+
+        with open(options["output"], "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(rows)} airports to {options['output']}"))
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from travel.price_watch import refresh_prices
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-price flights and hotels selected for upcoming trips and record price changes "
+        "(PriceSnapshot). Use --loop to keep running as a worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--horizon-days", type=int, default=settings.PRICE_WATCH_HORIZON_DAYS,
+                            help="only trips starting within this many days")
+        parser.add_argument("--concurrency", type=int, default=settings.PRICE_WATCH_CONCURRENCY,
+                            help="searches in flight at once")
+        parser.add_argument("--loop", action="store_true", help="repeat every --interval seconds")
+        parser.add_argument("--interval", type=int, default=settings.PRICE_WATCH_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            try:
+                stats = refresh_prices(options["horizon_days"], options["concurrency"])
+                self.stdout.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {stats}")
+            except Exception as e:
+                if not options["loop"]:
+                    raise
+                self.stderr.write(f"price refresh failed: {e}")
+            if not options["loop"]:
+                return
+            time.sleep(max(0, options["interval"] - (time.monotonic() - started)))
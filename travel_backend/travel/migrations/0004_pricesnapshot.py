@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 07:08
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0003_liveitineraryitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('item_type', models.CharField(choices=[('flight', 'Flight'), ('hotel', 'Hotel')], max_length=20)),
+                ('item_key', models.CharField(max_length=200)),
+                ('name', models.CharField(blank=True, max_length=200)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('lowest_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('selected_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('currency', models.CharField(default='USD', max_length=3)),
+                ('search', models.JSONField(blank=True, default=dict)),
+                ('checked_at', models.DateTimeField(auto_now_add=True)),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_snapshots', to='travel.trip')),
+            ],
+            options={
+                'ordering': ['trip', 'item_type', 'item_key', '-checked_at'],
+                'indexes': [models.Index(fields=['trip', 'item_type', 'item_key', 'checked_at'], name='travel_pric_trip_id_b06517_idx')],
+            },
+        ),
+    ]
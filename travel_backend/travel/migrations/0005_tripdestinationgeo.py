@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 07:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0004_pricesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripDestinationGeo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destination', models.CharField(max_length=200)),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('city', models.CharField(blank=True, max_length=200)),
+                ('country_code', models.CharField(blank=True, max_length=8)),
+                ('formatted', models.CharField(blank=True, max_length=300)),
+                ('place_id', models.CharField(blank=True, max_length=255)),
+                ('city_place_id', models.CharField(blank=True, max_length=255)),
+                ('boundary_place_ids', models.JSONField(blank=True, default=list)),
+                ('resolved_at', models.DateTimeField(auto_now=True)),
+                ('trip', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='destination_geo', to='travel.trip')),
+            ],
+        ),
+    ]
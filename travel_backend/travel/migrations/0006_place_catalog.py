@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-17 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0005_tripdestinationgeo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('place_id', models.CharField(max_length=255, unique=True)),
+                ('name', models.CharField(blank=True, max_length=300)),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('geohash', models.CharField(db_index=True, max_length=12)),
+                ('categories', models.JSONField(blank=True, default=list)),
+                ('feature', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlaceCoverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geohash', models.CharField(max_length=12)),
+                ('category', models.CharField(max_length=100)),
+                ('feature_count', models.PositiveIntegerField(default=0)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('geohash', 'category')},
+            },
+        ),
+    ]
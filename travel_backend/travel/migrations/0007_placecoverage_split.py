@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0006_place_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='placecoverage',
+            name='split',
+            field=models.BooleanField(default=False),
+        ),
+    ]
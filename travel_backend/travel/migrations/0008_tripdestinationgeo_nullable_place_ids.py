@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel', '0007_placecoverage_split'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tripdestinationgeo',
+            name='boundary_place_ids',
+            field=models.JSONField(blank=True, default=list, null=True),
+        ),
+        migrations.AlterField(
+            model_name='tripdestinationgeo',
+            name='city_place_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -296,3 +296,103 @@ class LiveItineraryItem(models.Model):
             end = self.planned_end_time
             return (end.hour * 60 + end.minute) - (start.hour * 60 + start.minute)
         return 0
+
+class PriceSnapshot(models.Model):
+    """Re-priced saved flight/hotel selection, written by the price-watch refresher when the price changes"""
+    ITEM_TYPE_CHOICES = [
+        ('flight', 'Flight'),
+        ('hotel', 'Hotel'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='price_snapshots')
+    item_type = models.CharField(max_length=20, choices=ITEM_TYPE_CHOICES)
+    # Stable identity of the watched selection (airline + departure time, hotel id or name)
+    item_key = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, blank=True)
+    # Price of the same flight/hotel in the latest search; null when it was no longer offered
+    price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    # Cheapest option for the same search, for "a cheaper alternative exists" hints
+    lowest_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    selected_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    currency = models.CharField(max_length=3, default='USD')
+    search = models.JSONField(default=dict, blank=True)
+    checked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['trip', 'item_type', 'item_key', '-checked_at']
+        indexes = [models.Index(fields=['trip', 'item_type', 'item_key', 'checked_at'])]
+
+    def __str__(self):
+        return f"{self.name or self.item_key}: {self.price} {self.currency} ({self.checked_at:%Y-%m-%d %H:%M})"
+
+class TripDestinationGeo(models.Model):
+    """Geoapify context resolved once for a trip's destination, reused by trip-scoped endpoints"""
+    trip = models.OneToOneField(Trip, on_delete=models.CASCADE, related_name='destination_geo')
+    # Destination text these values were resolved for; a changed Trip.destination makes them stale
+    destination = models.CharField(max_length=200)
+    lat = models.FloatField()
+    lon = models.FloatField()
+    city = models.CharField(max_length=200, blank=True)
+    country_code = models.CharField(max_length=8, blank=True)
+    formatted = models.CharField(max_length=300, blank=True)
+    place_id = models.CharField(max_length=255, blank=True)
+    # NULL when the lookup failed (not when Geoapify found nothing), so it is retried
+    city_place_id = models.CharField(max_length=255, blank=True, null=True)
+    boundary_place_ids = models.JSONField(default=list, blank=True, null=True)
+    resolved_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.destination} ({self.lat:.4f}, {self.lon:.4f})"
+
+    @staticmethod
+    def normalize(destination):
+        return ' '.join((destination or '').split()).lower()
+
+    def is_current(self, trip=None):
+        return self.normalize(self.destination) == self.normalize((trip or self.trip).destination)
+
+    def is_resolved(self):
+        return self.city_place_id is not None and self.boundary_place_ids is not None
+
+    def as_geo(self):
+        """Same shape as views._geoapify_geocode"""
+        return {
+            'lat': self.lat,
+            'lon': self.lon,
+            'city': self.city or None,
+            'country': self.country_code or None,
+            'formatted': self.formatted or None,
+            'place_id': self.place_id or None,
+        }
+
+class Place(models.Model):
+    """Geoapify place kept in the local catalog (see travel/places_catalog.py)"""
+    place_id = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=300, blank=True)
+    lat = models.FloatField()
+    lon = models.FloatField()
+    # Full-precision geohash: a prefix match selects the places of one geohash cell
+    geohash = models.CharField(max_length=12, db_index=True)
+    categories = models.JSONField(default=list, blank=True)
+    # The Geoapify feature as returned, so catalog answers match upstream ones
+    feature = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.name or self.place_id} ({self.lat:.4f}, {self.lon:.4f})"
+
+class PlaceCoverage(models.Model):
+    """A geohash cell whose places of one category were fetched from Geoapify at fetched_at"""
+    geohash = models.CharField(max_length=12)
+    category = models.CharField(max_length=100)
+    feature_count = models.PositiveIntegerField(default=0)
+    # Too dense for one fetch: the places are held by the cell's sub-cells instead
+    split = models.BooleanField(default=False)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['geohash', 'category']
+
+    def __str__(self):
+        return f"{self.geohash} {self.category} ({self.feature_count})"
@@ -0,0 +1,303 @@
+"""Persistent local catalog of Geoapify places with an in-memory grid index.
+
+Every tile fetched by the POI tile cache (travel/poi_tiles.py) is written here: one
+``Place`` row per feature and one ``PlaceCoverage`` row per (geohash cell, category).
+While a coverage row is younger than ``PLACES_CATALOG_MAX_AGE`` seconds, the cell is
+answered from the database. Places therefore outlive cache evictions and restarts, and
+attractions, food and transport searches over a known area make no upstream call.
+
+``GridIndex`` buckets places into fixed lat/lon cells and answers radius,
+bounding-box and k-nearest queries with category filters. Each query computes the
+distances of its candidate set in one vectorized call (travel.geodistance).
+``PlacesCatalog.index()`` keeps one index over all fresh places for /api/places/nearby/
+and rebuilds it when the catalog changed.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .geodistance import EARTH_RADIUS_KM, haversine_matrix
+from .poi_tiles import SPLIT, encode, feature_id, feature_point, in_category
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE = math.radians(1) * EARTH_RADIUS_KM
+
+
+def _matches(categories: Sequence[str], wanted: Sequence[str]) -> bool:
+    if not wanted:
+        return True
+    return any(c == w or c.startswith(w + ".") for c in categories for w in wanted)
+
+
+class GridIndex:
+    """Places bucketed into ``cell_deg`` x ``cell_deg`` cells for spatial queries."""
+
+    def __init__(self, features: Iterable[Dict[str, Any]], cell_deg: float = 0.05):
+        self.cell_deg = float(cell_deg)
+        self.features: List[Dict[str, Any]] = []
+        self.categories: List[List[str]] = []
+        self.cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        lats, lons = [], []
+        for feature in features:
+            point = feature_point(feature)
+            if point is None:
+                continue
+            index = len(self.features)
+            self.features.append(feature)
+            self.categories.append(list((feature.get("properties") or {}).get("categories") or []))
+            lats.append(point[0])
+            lons.append(point[1])
+            self.cells[self._cell(*point)].append(index)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        rows = [row for row, _col in self.cells] or [0]
+        cols = [col for _row, col in self.cells] or [0]
+        self._extent = (min(rows), max(rows), min(cols), max(cols))
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _collect(self, rows: range, cols: range, wanted: Sequence[str]) -> List[int]:
+        out: List[int] = []
+        if len(rows) * len(cols) > len(self.cells):
+            # Sparse grid: walking the occupied cells is cheaper than the whole range
+            keys = [key for key in self.cells if key[0] in rows and key[1] in cols]
+        else:
+            keys = [(row, col) for row in rows for col in cols if (row, col) in self.cells]
+        for key in keys:
+            out.extend(i for i in self.cells[key] if _matches(self.categories[i], wanted))
+        return out
+
+    def _distances(self, lat: float, lon: float, indices: List[int]) -> np.ndarray:
+        if not indices:
+            return np.empty(0)
+        idx = np.asarray(indices)
+        return haversine_matrix([(lat, lon)], np.column_stack((self.lats[idx], self.lons[idx])))[0]
+
+    def bbox(self, lat_min: float, lon_min: float, lat_max: float, lon_max: float,
+             categories: Sequence[str] = (), limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Places inside the box, in catalog order."""
+        row_lo, col_lo = self._cell(lat_min, lon_min)
+        row_hi, col_hi = self._cell(lat_max, lon_max)
+        found = [
+            i for i in self._collect(range(row_lo, row_hi + 1), range(col_lo, col_hi + 1), categories)
+            if lat_min <= self.lats[i] <= lat_max and lon_min <= self.lons[i] <= lon_max
+        ]
+        found.sort()
+        return [self.features[i] for i in found[:limit]]
+
+    def radius(self, lat: float, lon: float, radius_km: float, categories: Sequence[str] = (),
+               limit: Optional[int] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """``(distance_km, place)`` within ``radius_km``, nearest first."""
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 0.01))
+        row_lo, col_lo = self._cell(lat - dlat, lon - dlon)
+        row_hi, col_hi = self._cell(lat + dlat, lon + dlon)
+        indices = self._collect(range(row_lo, row_hi + 1), range(col_lo, col_hi + 1), categories)
+        distances = self._distances(lat, lon, indices)
+        order = [j for j in np.argsort(distances, kind="stable").tolist() if distances[j] <= radius_km]
+        return [(float(distances[j]), self.features[indices[j]]) for j in order[:limit]]
+
+    def nearest(self, lat: float, lon: float, k: int, categories: Sequence[str] = (),
+                max_km: Optional[float] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """The ``k`` places nearest to the point (optionally within ``max_km``), nearest first.
+
+        Searches rings of cells around the point's cell until the k-th distance found is
+        no larger than the distance to the edge of the searched square.
+        """
+        k = max(1, int(k))
+        if not self.features:
+            return []
+        row0, col0 = self._cell(lat, lon)
+        row_min, row_max, col_min, col_max = self._extent
+        max_ring = max(abs(row0 - row_min), abs(row0 - row_max), abs(col0 - col_min), abs(col0 - col_max))
+        best: List[Tuple[float, int]] = []
+        for ring in range(max_ring + 1):
+            if ring == 0:
+                border = [(row0, col0)]
+            else:
+                # Only the cells on the ring's border are new
+                border = [(row0 + dr, col0 + dc) for dr in (-ring, ring) for dc in range(-ring, ring + 1)]
+                border += [(row0 + dr, col0 + dc) for dr in range(-ring + 1, ring) for dc in (-ring, ring)]
+            indices = [i for key in border if key in self.cells
+                       for i in self.cells[key] if _matches(self.categories[i], categories)]
+            distances = self._distances(lat, lon, indices)
+            best.extend(zip(distances.tolist(), indices))
+            best.sort()
+            del best[k:]
+            # Anything outside the searched square is at least this far away
+            lat_lo, lat_hi = (row0 - ring) * self.cell_deg, (row0 + ring + 1) * self.cell_deg
+            lon_lo, lon_hi = (col0 - ring) * self.cell_deg, (col0 + ring + 1) * self.cell_deg
+            edge_km = min(lat - lat_lo, lat_hi - lat) * KM_PER_DEGREE
+            # Distance to the nearer meridian edge (cross-track distance)
+            dlon = math.radians(min(lon - lon_lo, lon_hi - lon, 90.0))
+            edge_km = min(edge_km, EARTH_RADIUS_KM * math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(dlon))))
+            if len(best) >= k and best[-1][0] <= edge_km:
+                break
+            if max_km is not None and edge_km > max_km:
+                break
+        return [(d, self.features[i]) for d, i in best if max_km is None or d <= max_km]
+
+
+class PlacesCatalog:
+    """Database-backed store for POI tiles plus a process-wide ``GridIndex`` over it."""
+
+    def __init__(self, max_age: float, cell_deg: float = 0.05, refresh_interval: float = 60.0):
+        self.max_age = float(max_age)
+        self.cell_deg = float(cell_deg)
+        self.refresh_interval = float(refresh_interval)
+        self._index: Optional[GridIndex] = None
+        self._index_version: Optional[Tuple[Any, ...]] = None
+        self._index_checked = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"cells_loaded": 0, "cells_saved": 0, "places_saved": 0, "index_builds": 0, "errors": 0}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["indexed_places"] = len(self._index) if self._index is not None else 0
+        out["max_age"] = self.max_age
+        return out
+
+    def _fresh_since(self):
+        from django.utils import timezone
+        return timezone.now() - timedelta(seconds=self.max_age)
+
+    def load(self, geohash: str, categories: Sequence[str]) -> Optional[Tuple[str, Any]]:
+        """``(category, features)`` of the most specific of ``categories`` freshly covered in the cell.
+
+        ``features`` is ``SPLIT`` when the cell was too dense and its sub-cells hold the places.
+        """
+        from .models import Place, PlaceCoverage
+
+        try:
+            coverage = (PlaceCoverage.objects
+                        .filter(geohash=geohash, category__in=list(categories), fetched_at__gte=self._fresh_since())
+                        .order_by("-fetched_at"))
+            covered = {row.category: row for row in coverage}
+            if not covered:
+                return None
+            category = max(covered, key=len)
+            if covered[category].split:
+                self._count("cells_loaded")
+                return category, SPLIT
+            # Places not returned by the latest fetch of the cell are left out
+            rows = Place.objects.filter(geohash__startswith=geohash, updated_at__gte=covered[category].fetched_at)
+            features = [row.feature for row in rows.only("feature") if in_category(row.feature, category)]
+        except Exception as e:
+            logger.warning("[places-catalog] load failed for %s: %s", geohash, e)
+            self._count("errors")
+            return None
+        self._count("cells_loaded")
+        return category, features
+
+    def save(self, geohash: str, by_category: Dict[str, Any]) -> None:
+        """Upsert the places fetched for a cell and mark its categories as covered.
+
+        A category whose value is ``SPLIT`` is recorded as held by the cell's sub-cells.
+        """
+        from django.utils import timezone
+        from .models import Place, PlaceCoverage
+
+        fetched_at = timezone.now()
+        places: Dict[str, Place] = {}
+        for features in by_category.values():
+            if features == SPLIT:
+                continue
+            for feature in features:
+                point = feature_point(feature)
+                if point is None:
+                    continue
+                props = feature.get("properties") or {}
+                pid = feature_id(feature)[:255]
+                places[pid] = Place(
+                    place_id=pid,
+                    name=str(props.get("name") or props.get("address_line1") or "")[:300],
+                    lat=point[0],
+                    lon=point[1],
+                    geohash=encode(point[0], point[1], 12),
+                    categories=list(props.get("categories") or []),
+                    feature=feature,
+                )
+        try:
+            if places:
+                Place.objects.bulk_create(
+                    list(places.values()),
+                    update_conflicts=True,
+                    unique_fields=["place_id"],
+                    update_fields=["name", "lat", "lon", "geohash", "categories", "feature", "updated_at"],
+                )
+            for category, features in by_category.items():
+                split = features == SPLIT
+                PlaceCoverage.objects.update_or_create(
+                    geohash=geohash, category=category,
+                    defaults={"feature_count": 0 if split else len(features), "split": split, "fetched_at": fetched_at},
+                )
+        except Exception as e:
+            logger.warning("[places-catalog] save failed for %s: %s", geohash, e)
+            self._count("errors")
+            return
+        self._count("cells_saved")
+        self._count("places_saved", len(places))
+
+    def index(self) -> GridIndex:
+        """Grid index over the fresh places, rebuilt when the catalog changed."""
+        from django.db.models import Count, Max
+        from .models import Place
+
+        with self._lock:
+            if self._index is not None and time.monotonic() - self._index_checked < self.refresh_interval:
+                return self._index
+        fresh = Place.objects.filter(updated_at__gte=self._fresh_since())
+        summary = fresh.aggregate(count=Count("id"), latest=Max("updated_at"))
+        version = (summary["count"], summary["latest"])
+        with self._lock:
+            self._index_checked = time.monotonic()
+            if self._index is not None and version == self._index_version:
+                return self._index
+        index = GridIndex((row.feature for row in fresh.only("feature").iterator()), cell_deg=self.cell_deg)
+        with self._lock:
+            self._index, self._index_version = index, version
+            self._stats["index_builds"] += 1
+        return index
+
+
+_instance: Optional[PlacesCatalog] = None
+_instance_lock = threading.Lock()
+
+
+def get_catalog() -> Optional[PlacesCatalog]:
+    """Process-wide catalog, or None when ``PLACES_CATALOG_MAX_AGE`` is 0 (disabled)."""
+    global _instance
+    from django.conf import settings
+
+    if not getattr(settings, "PLACES_CATALOG_MAX_AGE", 0):
+        return None
+    with _instance_lock:
+        if _instance is None:
+            _instance = PlacesCatalog(
+                max_age=settings.PLACES_CATALOG_MAX_AGE,
+                cell_deg=settings.PLACES_GRID_CELL_DEG,
+                refresh_interval=settings.PLACES_INDEX_REFRESH,
+            )
+        return _instance
+
+
+def catalog_stats() -> Dict[str, Any]:
+    """Counters for /api/system/stats/ (empty before first use or when disabled)."""
+    return _instance.stats() if _instance is not None else {}
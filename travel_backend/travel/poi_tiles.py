@@ -0,0 +1,394 @@
+"""Geohash-tiled cache of Geoapify places (POIs), shared by every places lookup.
+
+The map is cut into geohash cells of ``POI_TILE_PRECISION`` characters (4: roughly
+39 x 19.5 km at the equator, narrower towards the poles, so the default 15 km radius
+overlaps at most about 9 cells). A tile entry holds the features of one Geoapify
+category inside one cell, stored in the ``poi-tiles`` namespace of the search cache. A
+radius query visits the cells overlapping its circle, nearest first. It fetches a cell
+only when the cache has nothing for it (one Geoapify call per cell covering all missing
+categories) and stops as soon as the ``limit`` nearest features are known. Before
+fetching anything it counts the uncached cells it may need; above ``max_fetch`` the
+caller goes straight to Geoapify. Neighbouring destinations and overlapping radii
+therefore reuse the same tiles, and a popular city is eventually served without any
+upstream call.
+
+A fetch returns at most ``fetch_limit`` features, so a full response does not hold the
+whole cell. Its categories are then fetched one by one, and a category that still fills
+a fetch is marked ``SPLIT``: its places are held by the 32 sub-cells one character
+longer, fetched lazily, nearest first, like any other cell. Cells are split down to
+``max_precision`` characters; a cell that is still full there keeps the places nearest
+its centre.
+
+A cached parent category also answers its subcategories: a ``public_transport`` tile
+answers ``public_transport.bus`` by filtering on the features' own categories. Under
+the cache, fetched tiles are persisted in the places catalog (travel/places_catalog.py),
+which answers cells the cache has evicted while their data is still fresh.
+"""
+
+import heapq
+import math
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cache import TTLCache, get_cache
+from .coalesce import get_single_flight
+from .geodistance import distances_from
+
+EARTH_RADIUS_KM = 6371.0
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Tile value of a category whose places live in the cell's sub-cells
+SPLIT = "split"
+
+# (lat_min, lon_min, lat_max, lon_max)
+Box = Tuple[float, float, float, float]
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """``(height, width)`` in degrees of a geohash cell of ``precision`` characters."""
+    bits = 5 * precision
+    return 180.0 / (1 << (bits // 2)), 360.0 / (1 << ((bits + 1) // 2))
+
+
+def encode(lat: float, lon: float, precision: int) -> str:
+    """Geohash of ``(lat, lon)``."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars = []
+    bit = value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value, lon_lo = value * 2 + 1, mid
+            else:
+                value, lon_hi = value * 2, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value, lat_lo = value * 2 + 1, mid
+            else:
+                value, lat_hi = value * 2, mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[value])
+            bit = value = 0
+    return "".join(chars)
+
+
+def bounds(geohash: str) -> Box:
+    """Bounding box of a geohash cell."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            on = value >> shift & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if on else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if on else (lat_lo, mid)
+            even = not even
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def km_between(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    h = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, h)))
+
+
+def km_to_box(lat: float, lon: float, box: Box) -> float:
+    """Distance from a point to the nearest point of ``box`` (0 inside it)."""
+    lat_min, lon_min, lat_max, lon_max = box
+    return km_between(lat, lon, min(max(lat, lat_min), lat_max), min(max(lon, lon_min), lon_max))
+
+
+def covering_cells(lat: float, lon: float, radius_km: float, precision: int) -> List[Tuple[float, str]]:
+    """``(distance_km, geohash)`` of the cells that overlap the circle, nearest first."""
+    height, width = cell_size(precision)
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = dlat / max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 0.01)
+    lat_min, lat_max = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    lon_min, lon_max = max(-180.0, lon - dlon), min(180.0, lon + dlon)
+    cells = []
+    row = math.floor((lat_min + 90.0) / height)
+    while row * height - 90.0 <= lat_max and row * height < 180.0:
+        col = math.floor((lon_min + 180.0) / width)
+        while col * width - 180.0 <= lon_max and col * width < 360.0:
+            geohash = encode(row * height - 90.0 + height / 2, col * width - 180.0 + width / 2, precision)
+            distance = km_to_box(lat, lon, bounds(geohash))
+            if distance <= radius_km:
+                cells.append((distance, geohash))
+            col += 1
+        row += 1
+    cells.sort()
+    return cells
+
+
+def split_categories(categories: str) -> List[str]:
+    return sorted({c.strip() for c in (categories or "").split(",") if c.strip()})
+
+
+def in_category(feature: Dict[str, Any], category: str) -> bool:
+    props = feature.get("properties") or {}
+    for c in props.get("categories") or []:
+        if c == category or c.startswith(category + "."):
+            return True
+    return False
+
+
+def feature_id(feature: Dict[str, Any]) -> str:
+    props = feature.get("properties") or {}
+    fid = props.get("place_id") or props.get("osm_id")
+    if fid:
+        return str(fid)
+    return f"{props.get('name')}|{props.get('lat')}|{props.get('lon')}"
+
+
+def feature_point(feature: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    props = feature.get("properties") or {}
+    lat, lon = props.get("lat"), props.get("lon")
+    if lat is None or lon is None:
+        coords = (feature.get("geometry") or {}).get("coordinates") or []
+        if len(coords) < 2:
+            return None
+        lon, lat = coords[0], coords[1]
+    try:
+        return float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+
+
+class TileFetchBudgetExceeded(Exception):
+    """A query needed more uncached tiles than ``max_fetch``; the caller should go upstream."""
+
+
+# fetch(box, categories, limit) -> Geoapify FeatureCollection for the cell
+TileFetcher = Callable[[Box, List[str], int], Dict[str, Any]]
+
+# (distance_km, geohash, categories) of a cell still to visit
+_Visit = Tuple[float, str, Tuple[str, ...]]
+
+
+class PoiTileCache:
+    """Radius queries over geohash tiles kept in a TTLCache."""
+
+    def __init__(self, cache: TTLCache, precision: int = 4, fetch_limit: int = 200, max_fetch: int = 9,
+                 store=None, max_precision: int = 7):
+        self.cache = cache
+        # Optional persistent layer under the cache (travel.places_catalog.PlacesCatalog)
+        self.store = store
+        self.precision = max(1, min(9, int(precision)))
+        self.max_precision = max(self.precision, min(9, int(max_precision)))
+        self.fetch_limit = max(1, int(fetch_limit))
+        self.max_fetch = max(0, int(max_fetch))
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "served_from_tiles": 0, "tiles_read": 0, "tiles_fetched": 0,
+                       "tiles_from_store": 0, "tiles_split": 0, "tiles_truncated": 0, "over_budget": 0}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        out.update({"precision": self.precision, "max_precision": self.max_precision,
+                    "fetch_limit": self.fetch_limit, "max_fetch": self.max_fetch})
+        return out
+
+    def _lookup(self, geohash: str, category: str) -> Any:
+        """Cached features of ``category`` in a cell, also derived from a cached parent category.
+
+        None when the cell is not covered, ``SPLIT`` when its sub-cells hold the places.
+        """
+        parts = category.split(".")
+        candidates = [".".join(parts[:depth]) for depth in range(len(parts), 0, -1)]
+        found = None
+        for candidate in candidates:
+            hit = self.cache.get(self.cache.make_key(geohash, candidate))
+            if hit is not None:
+                found = candidate, hit["value"] or []
+                break
+        if found is None and self.store is not None:
+            found = self.store.load(geohash, candidates)
+            if found is not None:
+                self.cache.set(self.cache.make_key(geohash, found[0]), found[1])
+                self._count("tiles_from_store")
+        if found is None:
+            return None
+        candidate, features = found
+        if features == SPLIT or candidate == category:
+            return features
+        return [f for f in features if in_category(f, category)]
+
+    def _fetch(self, geohash: str, categories: List[str], fetch: TileFetcher) -> Tuple[Dict[str, Any], int]:
+        """Fetch a cell; returns ``({category: features or SPLIT}, upstream calls made)``."""
+        group = get_single_flight("geoapify-tiles")
+        raw = group.do(
+            group.make_key(geohash, categories, self.fetch_limit),
+            lambda: fetch(bounds(geohash), categories, self.fetch_limit),
+        )
+        self._count("tiles_fetched")
+        features = (raw or {}).get("features") or []
+        if len(features) >= self.fetch_limit:
+            # The cell holds more than one fetch returns, so no category is complete
+            if len(categories) > 1:
+                by_category: Dict[str, Any] = {}
+                calls = 1
+                for category in categories:
+                    result, made = self._fetch(geohash, [category], fetch)
+                    by_category.update(result)
+                    calls += made
+                return by_category, calls
+            if len(geohash) < self.max_precision:
+                by_category = {categories[0]: SPLIT}
+                self._count("tiles_split")
+            else:
+                # Finest cell: keep the places nearest its centre
+                by_category = {categories[0]: features}
+                self._count("tiles_truncated")
+        else:
+            by_category = {c: [f for f in features if in_category(f, c)] for c in categories}
+        for category, members in by_category.items():
+            self.cache.set(self.cache.make_key(geohash, category), members)
+        if self.store is not None:
+            self.store.save(geohash, by_category)
+        return by_category, 1
+
+    @staticmethod
+    def _sub_cells(geohash: str, categories: Tuple[str, ...], lat: float, lon: float,
+                   radius_km: float) -> List[_Visit]:
+        visits = []
+        for char in _BASE32:
+            distance = km_to_box(lat, lon, bounds(geohash + char))
+            if distance <= radius_km:
+                visits.append((distance, geohash + char, categories))
+        return visits
+
+    def _walk(self, lat: float, lon: float, radius_km: float, wanted: List[str], limit: int,
+              fetch: Optional[TileFetcher]) -> Tuple[Dict[str, Tuple[float, Dict[str, Any]]], int, int]:
+        """Visit cells nearest first until the ``limit`` nearest features are known.
+
+        Returns ``(found, read, fetched)``. Without ``fetch`` nothing is fetched: uncached
+        cells count as fetched and contribute no features. A fetched cell can only add
+        features (and stop the walk sooner), so that dry run gives an upper bound on the
+        cells a real walk fetches, barring cells found to be split on the way.
+        """
+        found: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        fetched = read = 0
+        visits: List[_Visit] = [(d, g, tuple(wanted)) for d, g in covering_cells(lat, lon, radius_km, self.precision)]
+        heapq.heapify(visits)
+        while visits:
+            cell_distance, geohash, categories = heapq.heappop(visits)
+            if len(found) >= limit:
+                kth = sorted(d for d, _f in found.values())[limit - 1]
+                if kth <= cell_distance:
+                    break
+            cell: List[Dict[str, Any]] = []
+            missing, split = [], []
+            for category in categories:
+                features = self._lookup(geohash, category)
+                if features is None:
+                    missing.append(category)
+                elif features == SPLIT:
+                    split.append(category)
+                else:
+                    cell.extend(features)
+            if missing and fetch is None:
+                fetched += 1
+            elif missing:
+                if fetched >= self.max_fetch:
+                    self._count("tiles_read", read)
+                    self._count("over_budget")
+                    raise TileFetchBudgetExceeded(f"more than {self.max_fetch} uncached tiles")
+                by_category, calls = self._fetch(geohash, missing, fetch)
+                fetched += calls
+                for category, features in by_category.items():
+                    if features == SPLIT:
+                        split.append(category)
+                    else:
+                        cell.extend(features)
+            else:
+                read += 1
+            if split:
+                for visit in self._sub_cells(geohash, tuple(split), lat, lon, radius_km):
+                    heapq.heappush(visits, visit)
+            distances = distances_from(lat, lon, [feature_point(f) for f in cell]).tolist()
+            for feature, distance in zip(cell, distances):
+                # NaN (no coordinates) never passes
+                if distance <= radius_km:
+                    found.setdefault(feature_id(feature), (distance, feature))
+        return found, read, fetched
+
+    def query(
+        self,
+        lat: float,
+        lon: float,
+        categories: str,
+        radius_m: float,
+        limit: int,
+        fetch: TileFetcher,
+    ) -> Dict[str, Any]:
+        """Geoapify-shaped FeatureCollection of the ``limit`` features nearest to the centre.
+
+        Only features within ``radius_m`` count, and ``fetch`` is called for cells the
+        cache does not cover. Raises ``TileFetchBudgetExceeded``, before fetching
+        anything, when the query may need more than ``max_fetch`` uncached cells. Cells
+        found to be split while fetching can still exceed the budget part way; the tiles
+        fetched up to that point stay cached, so a repeated query gets further.
+        """
+        self._count("queries")
+        wanted = split_categories(categories)
+        radius_km = max(0.0, float(radius_m)) / 1000.0
+        limit = max(1, int(limit))
+        _found, _read, needed = self._walk(lat, lon, radius_km, wanted, limit, None)
+        if needed > self.max_fetch:
+            self._count("over_budget")
+            raise TileFetchBudgetExceeded(f"{needed} uncached tiles, more than {self.max_fetch}")
+        found, read, fetched = self._walk(lat, lon, radius_km, wanted, limit, fetch) if needed else (_found, _read, 0)
+        self._count("tiles_read", read)
+        if not fetched:
+            self._count("served_from_tiles")
+        nearest = sorted(found.values(), key=lambda pair: pair[0])[:limit]
+        return {
+            "type": "FeatureCollection",
+            "features": [feature for _distance, feature in nearest],
+            "tiles": {"read": read, "fetched": fetched},
+        }
+
+
+_instance: Optional[PoiTileCache] = None
+_instance_lock = threading.Lock()
+
+
+def get_poi_tiles() -> Optional[PoiTileCache]:
+    """Process-wide tile cache, or None when ``POI_TILE_TTL`` is 0 (tiling disabled)."""
+    global _instance
+    from django.conf import settings
+    from .places_catalog import get_catalog
+
+    if not getattr(settings, "POI_TILE_TTL", 0):
+        return None
+    with _instance_lock:
+        if _instance is None:
+            _instance = PoiTileCache(
+                get_cache("poi-tiles", ttl=settings.POI_TILE_TTL),
+                precision=settings.POI_TILE_PRECISION,
+                fetch_limit=settings.POI_TILE_FETCH_LIMIT,
+                max_fetch=settings.POI_TILE_MAX_FETCH,
+                store=get_catalog(),
+                max_precision=settings.POI_TILE_MAX_PRECISION,
+            )
+        return _instance
+
+
+def poi_tile_stats() -> Dict[str, Any]:
+    """Counters for /api/system/stats/ (empty before the first query or when disabled)."""
+    return _instance.stats() if _instance is not None else {}
@@ -0,0 +1,223 @@
+"""Background re-pricing of saved flight and hotel selections.
+
+``refresh_prices`` collects the flights/hotels selected for upcoming trips (selected
+``TripItem`` rows and ``TripPlanningStage.selected_items``), searches every distinct
+route/stay once, most-watched first, and writes a ``PriceSnapshot`` whenever a
+selection's price (or the cheapest alternative) changed since the last check.
+
+Searches go through the agents' search tools, so they share request coalescing and the
+call budget with interactive searches. They skip reading the result cache, whose stale
+entries would record old prices as current, but store their fresh results in it, which
+leaves popular routes warm.
+Run it with ``python manage.py refresh_prices`` (``--loop`` for a long-running worker).
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+
+from .quota import QuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER_IDS = {"flight_placeholder", "hotel_placeholder"}
+
+
+def _money(value: Any) -> Optional[Decimal]:
+    if value is None or value == "":
+        return None
+    try:
+        return Decimal(str(value)).quantize(Decimal("0.01"))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _iata(value: Any) -> Optional[str]:
+    code = str(value or "").strip().upper()
+    return code if len(code) == 3 and code.isalpha() else None
+
+
+def _flight_watch(trip, item: Dict[str, Any], selected_price: Any) -> Optional[Dict[str, Any]]:
+    origin, destination = _iata(item.get("departure")), _iata(item.get("arrival"))
+    if not origin or not destination or item.get("id") in _PLACEHOLDER_IDS:
+        return None
+    departure_time = str(item.get("departureTime") or "")
+    try:
+        departure_date = datetime.strptime(departure_time[:10], "%Y-%m-%d").date()
+    except ValueError:
+        departure_date = trip.start_date
+    if departure_date < date.today():
+        return None
+    round_trip = str(item.get("type") or "").lower().startswith("round")
+    airline = str(item.get("airline") or "")
+    return {
+        "kind": "flight",
+        "trip": trip,
+        "item_key": f"{airline}|{departure_time or departure_date}"[:200],
+        "name": f"{airline} {origin}-{destination}".strip()[:200],
+        "match": {
+            "airline": airline,
+            "departureTime": departure_time,
+            "departure": origin,
+            "arrival": destination,
+            "flightNumber": str(item.get("flightNumber") or "").strip(),
+        },
+        "selected_price": _money(selected_price if selected_price not in (None, "") else item.get("price")) or Decimal("0"),
+        "search": {
+            "origin": origin,
+            "destination": destination,
+            "departure_date": departure_date.isoformat(),
+            "return_date": trip.end_date.isoformat() if round_trip else None,
+            "adults": max(int(trip.travelers or 1), 1),
+        },
+    }
+
+
+def _hotel_watch(trip, item: Dict[str, Any], selected_price: Any) -> Optional[Dict[str, Any]]:
+    name = str(item.get("name") or "").strip()
+    hotel_id = str(item.get("id") or "").strip()
+    if not (name or hotel_id) or hotel_id in _PLACEHOLDER_IDS or trip.end_date <= trip.start_date:
+        return None
+    if trip.start_date < date.today():
+        return None
+    return {
+        "kind": "hotel",
+        "trip": trip,
+        "item_key": (hotel_id or name)[:200],
+        "name": name[:200],
+        "match": {"id": hotel_id, "name": name.lower()},
+        "selected_price": _money(selected_price if selected_price not in (None, "") else item.get("price")) or Decimal("0"),
+        "search": {
+            "destination": trip.destination,
+            "check_in_date": trip.start_date.isoformat(),
+            "check_out_date": trip.end_date.isoformat(),
+            "adults": max(int(trip.travelers or 1), 1),
+        },
+    }
+
+
+def collect_watches(horizon_days: int) -> List[Dict[str, Any]]:
+    """Saved flight/hotel selections of planned trips starting within ``horizon_days``."""
+    from .models import Trip, TripItem, TripPlanningStage
+
+    today = date.today()
+    trips = {
+        t.id: t for t in Trip.objects.filter(
+            status="planned", start_date__gte=today, start_date__lte=today + timedelta(days=horizon_days)
+        )
+    }
+    builders = {"flight": _flight_watch, "hotel": _hotel_watch}
+    watches: Dict[Tuple[Any, str, str], Dict[str, Any]] = {}
+
+    def add(trip, kind: str, item: Any, selected_price: Any = None) -> None:
+        if not isinstance(item, dict):
+            return
+        watch = builders[kind](trip, item, selected_price)
+        if watch is not None:
+            watches.setdefault((trip.id, kind, watch["item_key"]), watch)
+
+    items = TripItem.objects.filter(trip_id__in=list(trips), is_selected=True, item_type__in=builders)
+    for item in items:
+        add(trips[item.trip_id], item.item_type, item.metadata, item.price)
+    stages = TripPlanningStage.objects.filter(trip_id__in=list(trips), stage_type__in=builders)
+    for stage in stages:
+        for item in stage.selected_items or []:
+            add(trips[stage.trip_id], stage.stage_type, item)
+    return list(watches.values())
+
+
+def _search_key(watch: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (watch["kind"],) + tuple(sorted(watch["search"].items()))
+
+
+async def _run_searches(searches: List[Tuple[Tuple[Any, ...], Dict[str, Any]]], concurrency: int) -> Dict[Tuple[Any, ...], Any]:
+    from .flight_agent import get_flight_agent
+    from .hotel_agent import get_hotel_agent
+
+    flight_search = get_flight_agent().flight_search
+    hotel_search = get_hotel_agent().hotel_search
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(kind: str, search: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            if kind == "flight":
+                return await flight_search.search_flights_async(**search, bypass_cache=True)
+            return await hotel_search.search_hotels_async(**search, bypass_cache=True)
+
+    results = await asyncio.gather(*(run(key[0], search) for key, search in searches), return_exceptions=True)
+    return {key: result for (key, _search), result in zip(searches, results)}
+
+
+def _price_in(watch: Dict[str, Any], result: Dict[str, Any]) -> Tuple[Optional[Decimal], Optional[Decimal]]:
+    """(price of the watched selection, cheapest price) in a search result."""
+    options = result.get("flights" if watch["kind"] == "flight" else "hotels") or []
+    priced = [o for o in options if isinstance(o.get("price"), (int, float)) and o["price"] > 0]
+    lowest = _money(min(o["price"] for o in priced)) if priced else None
+    match = watch["match"]
+    for option in priced:
+        if watch["kind"] == "flight":
+            found = (
+                option.get("airline") == match["airline"]
+                and option.get("departureTime") == match["departureTime"]
+                and option.get("departure") == match["departure"]
+                and option.get("arrival") == match["arrival"]
+                # Selections saved before flight numbers were recorded match on route and time
+                and (not match["flightNumber"] or str(option.get("flightNumber") or "") == match["flightNumber"])
+            )
+        else:
+            found = (match["id"] and option.get("id") == match["id"]) or (
+                str(option.get("name") or "").strip().lower() == match["name"]
+            )
+        if found:
+            return _money(option["price"]), lowest
+    return None, lowest
+
+
+def refresh_prices(horizon_days: int = 90, concurrency: int = 4) -> Dict[str, Any]:
+    """Re-price saved selections once; returns counters for logging."""
+    from .models import PriceSnapshot
+
+    watches = collect_watches(horizon_days)
+    by_search: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = {}
+    for watch in watches:
+        by_search.setdefault(_search_key(watch), []).append(watch)
+    # Most-watched routes first, so a budget cut-off still warms the popular ones
+    searches = sorted(by_search.items(), key=lambda kv: -len(kv[1]))
+    results = {}
+    if searches:
+        results = asyncio.run(_run_searches([(key, group[0]["search"]) for key, group in searches], concurrency))
+
+    stats = {"watches": len(watches), "searches": len(searches), "snapshots": 0, "changed": 0,
+             "failed_searches": 0, "quota_limited": 0}
+    for key, group in searches:
+        result = results.get(key)
+        if isinstance(result, QuotaExceeded):
+            stats["quota_limited"] += 1
+            continue
+        if isinstance(result, BaseException) or not isinstance(result, dict) or not result.get("success"):
+            stats["failed_searches"] += 1
+            continue
+        for watch in group:
+            price, lowest = _price_in(watch, result)
+            last = (PriceSnapshot.objects
+                    .filter(trip=watch["trip"], item_type=watch["kind"], item_key=watch["item_key"])
+                    .order_by("-checked_at").first())
+            if last is not None and last.price == price and last.lowest_price == lowest:
+                continue
+            PriceSnapshot.objects.create(
+                trip=watch["trip"],
+                item_type=watch["kind"],
+                item_key=watch["item_key"],
+                name=watch["name"],
+                price=price,
+                lowest_price=lowest,
+                selected_price=watch["selected_price"],
+                search=watch["search"],
+            )
+            stats["snapshots"] += 1
+            if last is not None:
+                stats["changed"] += 1
+    logger.info("[price-watch] %s", stats)
+    return stats
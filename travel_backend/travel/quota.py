@@ -0,0 +1,294 @@
+"""Upstream call budget: per-provider token buckets with per-user fair share.
+
+Every upstream call (SerpAPI, Geoapify, OpenAI) takes one token from its provider's bucket
+and from the calling user's share of it (``charge``). Endpoints decorated with ``metered``
+check up front that their estimated cost (``ENDPOINT_COSTS``) is available and answer
+429 with ``Retry-After`` instead of starting work the budget cannot cover.
+
+The user is tracked in a context variable, so it follows a request into asyncio tasks and
+``sync_to_async`` threads without being passed around. Calls made outside a request (e.g.
+background cache refreshes) only draw from the provider bucket.
+
+Buckets live in each worker process; ``QUOTA_PROCESS_COUNT`` splits the configured
+per-minute rates between workers.
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from rest_framework import exceptions
+
+# Estimated upstream calls per endpoint, per unit (day of a calendar, leg of a batch).
+# A staged flight search covers its first stage: 5 date offsets x up to 4 gl attempts
+# each (the user's country, then no gl, "us" and "gb"; see FlightSearchTool._gl_candidates).
+# Searches that fall through to later stages make more calls, so for them this is a
+# lower bound and they can still hit 429 partway through.
+FLIGHT_SEARCH_COST = 5 * 4
+ENDPOINT_COSTS: Dict[str, Dict[str, float]] = {
+    "flights.search": {"serpapi": FLIGHT_SEARCH_COST},
+    "flights.calendar": {"serpapi": 1},
+    "flights.batch": {"serpapi": FLIGHT_SEARCH_COST},
+    "hotels.search": {"serpapi": 1},
+    "places.search": {"geoapify": 2},
+    "places.guide": {"openai": 1},
+    "itinerary.auto": {"serpapi": 6, "geoapify": 4, "openai": 1},
+    "budget.estimate": {"openai": 1},
+}
+
+_current_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("quota_user", default=None)
+
+
+class QuotaExceeded(exceptions.Throttled):
+    """An upstream budget is exhausted; DRF renders it as 429 with ``Retry-After``."""
+
+    default_code = "quota_exceeded"
+
+    def __init__(self, provider: str, wait: float, scope: str):
+        super().__init__(wait=wait, detail=f"{provider} call budget exhausted ({scope}).")
+        self.provider = provider
+        self.scope = scope
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait(self, n: float) -> float:
+        missing = min(n, self.capacity) - self._tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    def wait_time(self, n: float = 1) -> float:
+        """Seconds until ``n`` tokens (at most ``capacity``) are available; 0 if they are now."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._wait(n)
+
+    def take(self, n: float = 1) -> float:
+        """Take ``n`` tokens and return 0, or take nothing and return the wait in seconds."""
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = self._wait(n)
+            if wait == 0:
+                self._tokens -= n
+            return wait
+
+    def give(self, n: float = 1) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + n)
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class QuotaManager:
+    """Provider buckets plus one bucket per (provider, user) holding ``user_share`` of it.
+
+    ``limits`` maps a provider to ``{"per_minute": ..., "burst": ...}``; providers without
+    limits are never throttled.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]], user_share: float = 1.0,
+                 costs: Optional[Dict[str, Dict[str, float]]] = None, max_users: int = 10000):
+        self.limits = limits
+        self.user_share = max(0.0, min(1.0, float(user_share)))
+        self.costs = costs if costs is not None else ENDPOINT_COSTS
+        self.max_users = max_users
+        self._providers = {
+            name: TokenBucket(limit["per_minute"] / 60.0, limit.get("burst") or limit["per_minute"])
+            for name, limit in limits.items()
+        }
+        self._users: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {name: {"charged": 0, "rejected_provider": 0, "rejected_user": 0, "admission_rejected": 0}
+                       for name in limits}
+
+    def _user_bucket(self, provider: str, user: Optional[str]) -> Optional[TokenBucket]:
+        if user is None or self.user_share >= 1.0:
+            return None
+        key = (provider, user)
+        with self._lock:
+            bucket = self._users.get(key)
+            if bucket is None:
+                parent = self._providers[provider]
+                bucket = self._users[key] = TokenBucket(parent.rate * self.user_share,
+                                                        max(1.0, parent.capacity * self.user_share))
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(key)
+            return bucket
+
+    def _count(self, provider: str, name: str) -> None:
+        with self._lock:
+            self._stats[provider][name] += 1
+
+    def charge(self, provider: str, cost: float = 1, user: Optional[str] = None) -> None:
+        """Take ``cost`` tokens for one upstream call or raise ``QuotaExceeded``."""
+        bucket = self._providers.get(provider)
+        if bucket is None:
+            return
+        user = user if user is not None else _current_user.get()
+        user_bucket = self._user_bucket(provider, user)
+        if user_bucket is not None:
+            wait = user_bucket.take(cost)
+            if wait:
+                self._count(provider, "rejected_user")
+                raise QuotaExceeded(provider, wait, "per-user share")
+        wait = bucket.take(cost)
+        if wait:
+            if user_bucket is not None:
+                user_bucket.give(cost)
+            self._count(provider, "rejected_provider")
+            raise QuotaExceeded(provider, wait, "global")
+        self._count(provider, "charged")
+
+    def admit(self, endpoint: str, user: Optional[str] = None, units: int = 1) -> None:
+        """Raise ``QuotaExceeded`` unless the estimated cost of ``endpoint`` is available now.
+
+        Nothing is taken; the calls the endpoint actually makes are charged as they happen.
+        """
+        user = user if user is not None else _current_user.get()
+        for provider, cost in self.costs.get(endpoint, {}).items():
+            bucket = self._providers.get(provider)
+            if bucket is None:
+                continue
+            need = cost * max(1, int(units))
+            user_bucket = self._user_bucket(provider, user)
+            if user_bucket is not None:
+                wait = user_bucket.wait_time(need)
+                if wait:
+                    self._count(provider, "admission_rejected")
+                    raise QuotaExceeded(provider, wait, "per-user share")
+            wait = bucket.wait_time(need)
+            if wait:
+                self._count(provider, "admission_rejected")
+                raise QuotaExceeded(provider, wait, "global")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {name: dict(values) for name, values in self._stats.items()}
+            users = len(self._users)
+        return {
+            "providers": {
+                name: {
+                    **counters[name],
+                    "available": round(bucket.tokens, 2),
+                    "capacity": bucket.capacity,
+                    "per_minute": round(bucket.rate * 60, 2),
+                }
+                for name, bucket in self._providers.items()
+            },
+            "user_share": self.user_share,
+            "tracked_users": users,
+        }
+
+
+_manager: Optional[QuotaManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_quota() -> QuotaManager:
+    """Process-wide quota manager configured from settings on first use."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                from django.conf import settings
+                limits = {}
+                if getattr(settings, "QUOTA_ENABLED", True):
+                    processes = max(1, int(getattr(settings, "QUOTA_PROCESS_COUNT", 1)))
+                    for provider, limit in getattr(settings, "UPSTREAM_QUOTAS", {}).items():
+                        if limit.get("per_minute"):
+                            limits[provider] = {
+                                "per_minute": limit["per_minute"] / processes,
+                                "burst": (limit.get("burst") or limit["per_minute"]) / processes,
+                            }
+                costs = {**ENDPOINT_COSTS, **getattr(settings, "QUOTA_ENDPOINT_COSTS", {})}
+                _manager = QuotaManager(limits, getattr(settings, "QUOTA_USER_SHARE", 1.0), costs)
+    return _manager
+
+
+def charge(provider: str, cost: float = 1) -> None:
+    """Charge one upstream call to the current user and the provider budget."""
+    get_quota().charge(provider, cost)
+
+
+def current_user() -> Optional[str]:
+    return _current_user.get()
+
+
+@contextmanager
+def user_scope(user: Optional[str]):
+    """Attribute upstream calls made inside the block to ``user``."""
+    token = _current_user.set(user)
+    try:
+        yield
+    finally:
+        try:
+            _current_user.reset(token)
+        except ValueError:
+            # Async generators may be closed from another context; that context never saw the set
+            pass
+
+
+def _user_key(request) -> Optional[str]:
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    addr = request.META.get("REMOTE_ADDR") if hasattr(request, "META") else None
+    return f"ip:{addr}" if addr else None
+
+
+def metered(endpoint: str, units: Optional[Callable[[Any], int]] = None):
+    """Admit a DRF view against its ``ENDPOINT_COSTS`` entry and attribute its calls to the user.
+
+    Goes below ``@api_view``/``@permission_classes`` or ``@async_api_view``. ``units(request)``
+    scales the cost, e.g. by the number of days of a fare calendar.
+    """
+    def scale(request) -> int:
+        if units is None:
+            return 1
+        try:
+            return max(1, int(units(request)))
+        except (TypeError, ValueError):
+            return 1
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapped(request, *args, **kwargs):
+                user = _user_key(request)
+                with user_scope(user):
+                    get_quota().admit(endpoint, user, scale(request))
+                    return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapped(request, *args, **kwargs):
+                user = _user_key(request)
+                with user_scope(user):
+                    get_quota().admit(endpoint, user, scale(request))
+                    return view(request, *args, **kwargs)
+        return wrapped
+
+    return decorator
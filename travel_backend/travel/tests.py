@@ -1,3 +1,1622 @@
-from django.test import TestCase
+import asyncio
+import http.server
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import httpx
+import numpy as np
+import requests
+from django.contrib.auth.models import User
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from . import price_watch, upstream, views
+from .agent_registry import AgentRegistry
+from .airports import AirportIndex, get_airport_index
+from .async_api import async_api_view, stream_body
+from .cache import LocalLRUBackend, TTLCache
+from .coalesce import SingleFlight
+from .flight_agent import FlightAIAgent, FlightSearchTool
+from .flight_ranking import rank_flights
+from .geodistance import coordinates, distances_from, haversine_matrix, rank_by_proximity, rounded_km
+from .hotel_agent import HotelAIAgent, HotelSearchTool
+from .hotel_index import HotelIndex, recommend
+from .models import PlaceCoverage, PriceSnapshot, Trip, TripDestinationGeo, TripItem
+from .places_catalog import GridIndex, PlacesCatalog
+from .poi_tiles import SPLIT, PoiTileCache, TileFetchBudgetExceeded, km_between
+from .quota import QuotaExceeded, QuotaManager, TokenBucket, current_user, metered, user_scope
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_leader(self):
+        group = SingleFlight('test')
+        calls = []
+        release = threading.Event()
+
+        def fn():
+            calls.append(1)
+            release.wait(2)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(group.do('k', fn))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        # Let every thread join the call before the leader returns
+        deadline = time.monotonic() + 2
+        while group.stats()['calls'] < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join(2)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 5)
+        stats = group.stats()
+        self.assertEqual((stats['leaders'], stats['coalesced'], stats['inflight']), (1, 4, 0))
+
+    def test_leader_error_reaches_every_waiter(self):
+        group = SingleFlight('test')
+        release = threading.Event()
+
+        def fn():
+            release.wait(2)
+            raise ValueError('upstream failed')
+
+        errors = []
+
+        def caller():
+            try:
+                group.do('k', fn)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=caller) for _ in range(3)]
+        for t in threads:
+            t.start()
+        deadline = time.monotonic() + 2
+        while group.stats()['calls'] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join(2)
+
+        self.assertEqual(errors, ['upstream failed'] * 3)
+        self.assertEqual(group.stats()['errors'], 1)
+        # The failed call is not kept: the next caller starts afresh
+        self.assertEqual(group.do('k', lambda: 'retried'), 'retried')
+
+    def test_async_callers_on_one_loop_share_the_call(self):
+        group = SingleFlight('test')
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'value'
+
+        async def main():
+            return await asyncio.gather(*(group.ado('k', fn) for _ in range(4)))
+
+        self.assertEqual(asyncio.run(main()), ['value'] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_call_does_not_die_with_another_requests_loop(self):
+        # Under WSGI each async request runs on its own loop, torn down when it ends
+        group = SingleFlight('test')
+        started = threading.Event()
+        results = {}
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(0.2)
+            return 'done'
+
+        async def first():
+            try:
+                # The first request gives up (client disconnect, timeout) and its loop closes
+                await asyncio.wait_for(group.ado('k', slow), 0.05)
+            except asyncio.TimeoutError:
+                results['A'] = 'timed out'
+
+        def second():
+            started.wait(2)
+            try:
+                results['B'] = asyncio.run(group.ado('k', slow))
+            except BaseException as e:
+                results['B'] = repr(e)
+
+        thread = threading.Thread(target=second)
+        thread.start()
+        asyncio.run(first())
+        thread.join(2)
+
+        self.assertEqual(results, {'A': 'timed out', 'B': 'done'})
+
+    def test_async_caller_joins_a_thread_call(self):
+        group = SingleFlight('test')
+        started = threading.Event()
+        release = threading.Event()
+
+        def fn():
+            started.set()
+            release.wait(2)
+            return 'value'
+
+        thread = threading.Thread(target=lambda: group.do('k', fn))
+        thread.start()
+        started.wait(2)
+
+        async def join():
+            waiter = asyncio.ensure_future(group.ado('k', fn))
+            await asyncio.sleep(0.02)
+            release.set()
+            return await waiter
+
+        self.assertEqual(asyncio.run(join()), 'value')
+        thread.join(2)
+        self.assertEqual(group.stats()['leaders'], 1)
+
+
+class StreamBodyTests(SimpleTestCase):
+    def test_wsgi_body_yields_each_item_before_the_stream_ends(self):
+        request = RequestFactory().post('/api/flights/search/stream/')
+        second = threading.Event()
+
+        async def events():
+            yield 'first\n'
+            # Only released once the first item reached the server
+            while not second.is_set():
+                await asyncio.sleep(0.01)
+            yield 'second\n'
+
+        body = stream_body(request, events())
+        self.assertEqual(next(body), 'first\n')
+        second.set()
+        self.assertEqual(list(body), ['second\n'])
+
+    def test_closing_the_wsgi_body_stops_the_stream(self):
+        request = RequestFactory().post('/api/flights/search/stream/')
+        stopped = threading.Event()
+
+        async def events():
+            try:
+                while True:
+                    yield 'tick\n'
+                    await asyncio.sleep(0.01)
+            finally:
+                stopped.set()
+
+        body = stream_body(request, events())
+        self.assertEqual(next(body), 'tick\n')
+        body.close()
+        self.assertTrue(stopped.is_set())
+
+
+class _FakeFlightSearch:
+    """search_flights_async stub: per-origin latency and whether flights come back."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.started = []
+        self.cancelled = []
+
+    async def search_flights_async(self, origin, destination, departure_date, **kwargs):
+        latency, has_flights = self.plan[origin]
+        self.started.append(origin)
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled.append(origin)
+            raise
+        flights = [{'origin': origin, 'price': 100}] if has_flights else []
+        return {'success': True, 'flights': flights}
+
+
+class IterStageTests(SimpleTestCase):
+    def run_stage(self, plan):
+        agent = FlightAIAgent.__new__(FlightAIAgent)
+        agent.flight_search = _FakeFlightSearch(plan)
+        agent.max_workers = len(plan)
+        combos = [(origin, 'DST', '2030-01-01') for origin in plan]
+
+        async def collect():
+            out = []
+            async for combo, _result, is_winner in agent._iter_stage(combos, {}, concurrent=True):
+                out.append((combo[0], is_winner))
+            return out
+
+        return asyncio.run(collect()), agent.flight_search
+
+    def test_winner_follows_priority_not_completion_order(self):
+        # Latencies reversed: the lowest-priority combination answers first
+        events, search = self.run_stage({'A': (0.15, True), 'B': (0.08, True), 'C': (0.01, True)})
+        self.assertEqual(events, [('C', False), ('B', False), ('A', False), ('A', True)])
+        self.assertEqual(search.cancelled, [])
+
+    def test_empty_higher_priority_results_pass_the_win_down(self):
+        events, search = self.run_stage({'A': (0.03, False), 'B': (0.06, True), 'C': (0.01, True), 'D': (1.0, True)})
+        self.assertEqual(events, [('C', False), ('A', False), ('B', False), ('B', True)])
+        # The remaining lower-priority search is cancelled once the winner is known
+        self.assertEqual(search.cancelled, ['D'])
+
+
+def _flight(name, price, minutes, stops):
+    return {'name': name, 'price': price, 'durationMinutes': minutes, 'stops': stops}
+
+
+class RankFlightsTests(SimpleTestCase):
+    def names(self, flights):
+        return [f['name'] for f in flights]
+
+    def test_pareto_front_keeps_only_undominated_flights(self):
+        ranked = rank_flights([
+            _flight('cheap-slow', 100, 600, 1),
+            _flight('mid', 200, 300, 1),
+            _flight('dominated', 250, 400, 1),
+            _flight('direct', 400, 280, 0),
+            _flight('fast', 300, 200, 2),
+            _flight('no-price', None, 100, 0),
+        ])
+        self.assertEqual(self.names(ranked['pareto_front']), ['cheap-slow', 'mid', 'fast', 'direct'])
+
+    def test_identical_flights_appear_once_in_the_front(self):
+        ranked = rank_flights([_flight('first', 100, 300, 0), _flight('second', 100, 300, 0)])
+        self.assertEqual(self.names(ranked['pareto_front']), ['first'])
+
+    def test_equal_price_and_duration_with_more_stops_is_dominated(self):
+        ranked = rank_flights([_flight('two-stops', 100, 300, 2), _flight('direct', 100, 300, 0)])
+        self.assertEqual(self.names(ranked['pareto_front']), ['direct'])
+
+    def test_picks_break_ties_on_the_other_criteria(self):
+        ranked = rank_flights([
+            _flight('cheap-long', 100, 500, 1),
+            _flight('cheap-short', 100, 400, 2),
+            _flight('fast-pricey', 300, 200, 1),
+            _flight('fast-cheaper', 250, 200, 1),
+            _flight('direct-pricey', 500, 300, 0),
+            _flight('direct-cheaper', 450, 300, 0),
+        ])
+        self.assertEqual(ranked['best_value']['name'], 'cheap-short')
+        self.assertEqual(ranked['fastest']['name'], 'fast-cheaper')
+        self.assertEqual(ranked['most_convenient']['name'], 'direct-cheaper')
+        self.assertEqual(ranked['price_range'], {'lowest': 100, 'highest': 500})
+
+    def test_unknown_values_rank_last(self):
+        ranked = rank_flights([
+            {'name': 'unknown', 'price': None, 'duration': '', 'stops': None},
+            _flight('known', 900, 900, 3),
+        ])
+        self.assertEqual(ranked['best_value']['name'], 'known')
+        self.assertEqual(ranked['fastest']['name'], 'known')
+        self.assertEqual(ranked['most_convenient']['name'], 'known')
+
+    def test_duration_string_is_parsed_when_minutes_are_missing(self):
+        ranked = rank_flights([
+            {'name': 'parsed', 'price': 100, 'duration': '1h 30m', 'stops': 0},
+            _flight('slower', 100, 120, 0),
+        ])
+        self.assertEqual(ranked['fastest']['name'], 'parsed')
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch('travel.quota.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_refills_at_rate_up_to_capacity(self):
+        bucket = TokenBucket(rate=2, capacity=4)
+        self.assertEqual(bucket.take(4), 0)
+        self.assertEqual(bucket.tokens, 0)
+        self.clock.now += 1
+        self.assertAlmostEqual(bucket.tokens, 2)
+        self.clock.now += 60
+        self.assertAlmostEqual(bucket.tokens, 4)
+
+    def test_take_returns_the_wait_and_takes_nothing(self):
+        bucket = TokenBucket(rate=2, capacity=4)
+        bucket.take(3)
+        self.assertAlmostEqual(bucket.take(3), 1.0)
+        self.assertAlmostEqual(bucket.tokens, 1)
+        # Asking for more than the capacity waits for a full bucket, not forever
+        self.assertAlmostEqual(bucket.wait_time(10), 1.5)
+
+    def test_give_returns_tokens_without_exceeding_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=4)
+        bucket.take(2)
+        bucket.give(1)
+        self.assertAlmostEqual(bucket.tokens, 3)
+        bucket.give(5)
+        self.assertAlmostEqual(bucket.tokens, 4)
+
+
+class QuotaManagerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch('travel.quota.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_user_share_is_rejected_before_the_provider_budget(self):
+        quota = QuotaManager({'serpapi': {'per_minute': 60, 'burst': 8}}, user_share=0.25)
+        quota.charge('serpapi', user='user:1')
+        quota.charge('serpapi', user='user:1')
+        with self.assertRaises(QuotaExceeded) as caught:
+            quota.charge('serpapi', user='user:1')
+        self.assertEqual(caught.exception.scope, 'per-user share')
+        # Other users still have their share of the provider budget
+        quota.charge('serpapi', user='user:2')
+        self.assertEqual(quota.stats()['providers']['serpapi']['rejected_user'], 1)
+
+    def test_provider_rejection_gives_the_user_token_back(self):
+        quota = QuotaManager({'serpapi': {'per_minute': 60, 'burst': 4}}, user_share=0.5)
+        quota.charge('serpapi', cost=4)
+        with self.assertRaises(QuotaExceeded) as caught:
+            quota.charge('serpapi', user='user:1')
+        self.assertEqual(caught.exception.scope, 'global')
+        self.assertAlmostEqual(quota._user_bucket('serpapi', 'user:1').tokens, 2)
+
+    def test_admit_checks_the_estimate_without_taking_tokens(self):
+        quota = QuotaManager({'serpapi': {'per_minute': 60, 'burst': 10}},
+                             costs={'flights.calendar': {'serpapi': 1}})
+        quota.admit('flights.calendar', units=10)
+        self.assertEqual(quota.stats()['providers']['serpapi']['available'], 10)
+        quota.charge('serpapi', cost=5)
+        with self.assertRaises(QuotaExceeded):
+            quota.admit('flights.calendar', units=10)
+
+    def test_unlimited_providers_are_never_throttled(self):
+        quota = QuotaManager({})
+        quota.charge('openai', cost=1000)
+        quota.admit('itinerary.auto')
+
+
+class MeteredTests(SimpleTestCase):
+    def setUp(self):
+        empty = QuotaManager({'serpapi': {'per_minute': 6, 'burst': 1}}, costs={'flights.search': {'serpapi': 1}})
+        empty.charge('serpapi')
+        patcher = mock.patch('travel.quota.get_quota', return_value=empty)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def test_sync_view_answers_429_with_retry_after(self):
+        @api_view(['POST'])
+        @permission_classes([AllowAny])
+        @metered('flights.search')
+        def view(request):
+            self.calls.append(1)
+            return Response({})
+
+        response = view(RequestFactory().post('/api/flights/search/'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(self.calls, [])
+
+    def test_async_view_answers_429_with_retry_after(self):
+        @async_api_view(['POST'], require_auth=False)
+        @metered('flights.search')
+        async def view(request):
+            self.calls.append(1)
+
+        response = asyncio.run(view(RequestFactory().post('/api/flights/search/')))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(self.calls, [])
+
+
+def _hotel(name, price, rating, amenities=(), category='comfort'):
+    return {'name': name, 'price': price, 'rating': rating, 'amenities': list(amenities), 'priceCategory': category}
+
+
+class HotelIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = HotelIndex([
+            _hotel('pool-spa', 200, 4.5, ['Pool', 'Spa', 'Free Wi-Fi'], 'luxury'),
+            _hotel('pool-only', 120, 4.0, ['pool', 'Free  Wi-Fi']),
+            _hotel('spa-only', 90, 3.5, ['Spa']),
+            _hotel('no-price', None, 4.8, ['Pool', 'Spa']),
+            _hotel('cheap', 40, 3.0, [], 'budget'),
+        ])
+
+    def names(self, hotels):
+        return [h['name'] for h in hotels]
+
+    def test_hotels_must_offer_every_requested_amenity(self):
+        total, page = self.index.query(amenities=['POOL', 'spa'], sort='rating')
+        self.assertEqual(total, 2)
+        self.assertEqual(self.names(page), ['no-price', 'pool-spa'])
+        # Amenity names are matched case- and whitespace-insensitively
+        total, _page = self.index.query(amenities=['free wi-fi'])
+        self.assertEqual(total, 2)
+
+    def test_unknown_amenity_matches_nothing(self):
+        self.assertEqual(self.index.query(amenities=['Helipad']), (0, []))
+
+    def test_price_bounds_exclude_unknown_prices(self):
+        total, page = self.index.query(price_min=50, price_max=150, sort='price')
+        self.assertEqual((total, self.names(page)), (2, ['spa-only', 'pool-only']))
+        total, page = self.index.query(price_max=1000, sort='price')
+        self.assertNotIn('no-price', self.names(page))
+        # Without a bound, unknown prices are listed last
+        _total, page = self.index.query(sort='price')
+        self.assertEqual(self.names(page)[-1], 'no-price')
+
+    def test_rating_and_category_filters(self):
+        total, page = self.index.query(min_rating=4.0, categories=['comfort'], sort='rating')
+        self.assertEqual((total, self.names(page)), (2, ['no-price', 'pool-only']))
+        self.assertEqual(self.index.query(categories=['hostel']), (0, []))
+
+    def test_pages_follow_one_order_without_gaps_or_repeats(self):
+        hotels = [_hotel(f'h{i}', 50 + (i * 37) % 200, 3 + (i % 5) * 0.4) for i in range(23)]
+        index = HotelIndex(hotels)
+        _total, everything = index.query(sort='value', limit=100)
+        pages = []
+        for offset in range(0, 23, 5):
+            total, page = index.query(sort='value', offset=offset, limit=5)
+            self.assertEqual(total, 23)
+            pages.extend(page)
+        self.assertEqual(self.names(pages), self.names(everything))
+        self.assertEqual(index.query(offset=30, limit=5), (23, []))
+
+    def test_amenity_counts(self):
+        self.assertEqual(self.index.amenities()[:2], [{'name': 'Pool', 'count': 3}, {'name': 'Spa', 'count': 3}])
+
+
+class RecommendTests(SimpleTestCase):
+    def test_picks_and_tie_breaks(self):
+        picks = recommend([
+            _hotel('cheap-low', 50, 3.0),
+            _hotel('cheap-high', 50, 4.0),
+            _hotel('top', 300, 4.9),
+            _hotel('top-cheaper', 250, 4.9),
+            _hotel('unknown', None, 5.0),
+        ])
+        self.assertEqual(picks['best_budget']['name'], 'cheap-high')
+        self.assertEqual(picks['best_rated']['name'], 'unknown')
+        self.assertEqual(picks['best_value']['name'], 'cheap-high')
+
+    def test_non_numeric_prices_are_treated_as_unknown(self):
+        picks = recommend([_hotel('text-price', '$120', 4.0), _hotel('numeric', 150, 3.5)])
+        self.assertEqual(picks['best_budget']['name'], 'numeric')
+        self.assertEqual(picks['best_rated']['name'], 'text-price')
+
+
+class _FakeGeoapify:
+    """Tile fetcher over a fixed set of places: the ``limit`` nearest to the box centre."""
+
+    def __init__(self, places):
+        self.features = [
+            {'properties': {'place_id': pid, 'lat': lat, 'lon': lon, 'categories': [category]}}
+            for pid, lat, lon, category in places
+        ]
+        self.calls = []
+
+    def __call__(self, box, categories, limit):
+        self.calls.append((box, tuple(categories)))
+        lat_min, lon_min, lat_max, lon_max = box
+        centre = ((lat_min + lat_max) / 2, (lon_min + lon_max) / 2)
+        inside = [
+            f for f in self.features
+            if lat_min <= f['properties']['lat'] < lat_max and lon_min <= f['properties']['lon'] < lon_max
+            and any(c == w or c.startswith(w + '.') for c in f['properties']['categories'] for w in categories)
+        ]
+        inside.sort(key=lambda f: km_between(*centre, f['properties']['lat'], f['properties']['lon']))
+        return {'features': inside[:limit]}
+
+    def nearest(self, lat, lon, category, radius_km, limit):
+        ranked = sorted(
+            (km_between(lat, lon, f['properties']['lat'], f['properties']['lon']), f['properties']['place_id'])
+            for f in self.features if f['properties']['categories'][0].startswith(category)
+        )
+        return [pid for d, pid in ranked if d <= radius_km][:limit]
+
+
+def _scatter(n, lat, lon, spread, category, seed):
+    rng = random.Random(seed)
+    return [(f'{category}-{i}', lat + rng.uniform(-spread, spread), lon + rng.uniform(-spread, spread), category)
+            for i in range(n)]
+
+
+class PoiTileCacheTests(SimpleTestCase):
+    def tiles(self, **kwargs):
+        cache = TTLCache('poi-tiles-test', LocalLRUBackend(maxsize=100000), ttl=3600)
+        options = {'precision': 4, 'fetch_limit': 30, 'max_fetch': 40, 'max_precision': 7}
+        options.update(kwargs)
+        return PoiTileCache(cache, **options)
+
+    def ids(self, result):
+        return [f['properties']['place_id'] for f in result['features']]
+
+    def test_dense_cells_are_split_so_off_centre_queries_stay_exact(self):
+        world = _FakeGeoapify(_scatter(1500, 48.85, 2.35, 0.05, 'catering.restaurant', seed=1))
+        tiles = self.tiles()
+        for lat, lon in [(48.83, 2.31), (48.88, 2.39), (48.85, 2.35)]:
+            result = tiles.query(lat, lon, 'catering.restaurant', 5000, 10, world)
+            self.assertEqual(self.ids(result), world.nearest(lat, lon, 'catering', 5.0, 10))
+        self.assertGreater(tiles.stats()['tiles_split'], 0)
+
+    def test_a_dense_category_does_not_crowd_out_a_sparse_one(self):
+        places = (_scatter(200, 48.85, 2.35, 0.05, 'catering.restaurant', seed=2)
+                  + _scatter(5, 48.85, 2.35, 0.05, 'catering.cafe', seed=3))
+        world = _FakeGeoapify(places)
+        result = self.tiles(max_fetch=500).query(48.85, 2.35, 'catering.restaurant,catering.cafe', 15000, 300, world)
+        cafes = [pid for pid in self.ids(result) if pid.startswith('catering.cafe')]
+        self.assertEqual(sorted(cafes), sorted(world.nearest(48.85, 2.35, 'catering.cafe', 15.0, 10)))
+
+    def test_warm_queries_make_no_upstream_call(self):
+        world = _FakeGeoapify(_scatter(300, 48.85, 2.35, 0.1, 'tourism.attraction', seed=4))
+        tiles = self.tiles()
+        first = tiles.query(48.85, 2.35, 'tourism.attraction', 15000, 20, world)
+        calls = len(world.calls)
+        second = tiles.query(48.851, 2.352, 'tourism.attraction', 15000, 20, world)
+        self.assertEqual(len(world.calls), calls)
+        self.assertEqual(second['tiles']['fetched'], 0)
+        self.assertEqual(self.ids(first), world.nearest(48.85, 2.35, 'tourism', 15.0, 20))
+
+    def test_over_budget_query_fetches_nothing(self):
+        world = _FakeGeoapify(_scatter(20, 48.85, 2.35, 0.5, 'tourism.attraction', seed=5))
+        tiles = self.tiles(precision=5, max_fetch=9)
+        with self.assertRaises(TileFetchBudgetExceeded):
+            tiles.query(48.85, 2.35, 'tourism.attraction', 15000, 20, world)
+        self.assertEqual(world.calls, [])
+        # At the default precision the same query fits the budget
+        tiles = self.tiles(max_fetch=9)
+        tiles.query(48.85, 2.35, 'tourism.attraction', 15000, 20, world)
+        self.assertLessEqual(len(world.calls), 9)
+
+    def test_finest_cells_keep_the_places_nearest_their_centre(self):
+        world = _FakeGeoapify(_scatter(500, 48.85, 2.35, 0.001, 'catering.restaurant', seed=6))
+        tiles = self.tiles(max_precision=5)
+        result = tiles.query(48.85, 2.35, 'catering.restaurant', 1000, 500, world)
+        self.assertEqual(len(result['features']), 30)
+        self.assertEqual(tiles.stats()['tiles_truncated'], 1)
+
+
+class PlacesCatalogTests(TestCase):
+    def test_split_cells_are_persisted(self):
+        catalog = PlacesCatalog(max_age=3600)
+        feature = {'properties': {'place_id': 'p1', 'lat': 48.85, 'lon': 2.35, 'categories': ['tourism.sights']}}
+        catalog.save('u09t', {'catering.restaurant': SPLIT, 'tourism': [feature]})
+        self.assertEqual(catalog.load('u09t', ['catering.restaurant', 'catering']), ('catering.restaurant', SPLIT))
+        self.assertEqual(catalog.load('u09t', ['tourism.sights', 'tourism']), ('tourism', [feature]))
+
+
+class _FakeGeoapifyHttp:
+    """_http_get_json stub answering geocode and boundary lookups, failing the first N boundary calls."""
+
+    def __init__(self, boundary_failures=0):
+        self.boundary_failures = boundary_failures
+        self.urls = []
+
+    def __call__(self, url, **kwargs):
+        self.urls.append(url)
+        if '/v1/boundaries' in url:
+            if self.boundary_failures:
+                self.boundary_failures -= 1
+                raise requests.Timeout('read timed out')
+            return {'features': [{'properties': {'place_id': 'boundary-1'}}]}
+        if 'type=city' in url:
+            return {'features': [{'properties': {'place_id': 'city-1'}}]}
+        return {'features': [{
+            'geometry': {'coordinates': [2.35, 48.85]},
+            'properties': {'city': 'Paris', 'country_code': 'fr', 'formatted': 'Paris, France', 'place_id': 'geo-1'},
+        }]}
+
+
+def _use_fresh_local_caches(test):
+    """Give ``test`` its own in-process search caches instead of the shared file cache."""
+    registry = mock.patch.dict('travel.cache._registry', clear=True)
+    registry.start()
+    test.addCleanup(registry.stop)
+    local = override_settings(SEARCH_CACHE_BACKEND='local')
+    local.enable()
+    test.addCleanup(local.disable)
+
+
+class TripGeoTests(TestCase):
+    def setUp(self):
+        _use_fresh_local_caches(self)
+
+    def trip(self, destination):
+        user = User.objects.create_user(username=f'u-{destination}', password='x')
+        return Trip.objects.create(user=user, title='Trip', destination=destination, start_date=date(2030, 5, 1),
+                                   end_date=date(2030, 5, 5), budget=1000)
+
+    def test_stored_context_is_reused_without_upstream_calls(self):
+        trip = self.trip('Geo Reuse City')
+        fake = _FakeGeoapifyHttp()
+        with mock.patch('travel.views._http_get_json', fake):
+            stored = views._trip_geo(trip, 'key')
+            calls = len(fake.urls)
+            again = views._trip_geo(trip, 'key')
+        self.assertEqual((stored.city_place_id, stored.boundary_place_ids), ('city-1', ['boundary-1']))
+        self.assertEqual(again.pk, stored.pk)
+        self.assertEqual(len(fake.urls), calls)
+
+    def test_failed_place_id_lookup_is_not_pinned(self):
+        trip = self.trip('Geo Timeout City')
+        fake = _FakeGeoapifyHttp(boundary_failures=1)
+        with mock.patch('travel.views._http_get_json', fake):
+            stored = views._trip_geo(trip, 'key')
+            self.assertEqual(stored.city_place_id, 'city-1')
+            self.assertIsNone(stored.boundary_place_ids)
+            retried = views._trip_geo(trip, 'key')
+        self.assertEqual(retried.boundary_place_ids, ['boundary-1'])
+        self.assertTrue(TripDestinationGeo.objects.get(trip=trip).is_resolved())
+
+    def test_changed_destination_is_resolved_again(self):
+        trip = self.trip('Geo Old City')
+        fake = _FakeGeoapifyHttp()
+        with mock.patch('travel.views._http_get_json', fake):
+            views._trip_geo(trip, 'key')
+            trip.destination = 'Geo New City'
+            stored = views._trip_geo(trip, 'key')
+        self.assertEqual(stored.destination, 'Geo New City')
+        self.assertEqual(TripDestinationGeo.objects.filter(trip=trip).count(), 1)
+
+
+class TTLCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch('travel.cache.time.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = TTLCache('test', LocalLRUBackend(maxsize=100), ttl=60, stale_ttl=120)
+
+    def test_fresh_stale_and_expired_entries(self):
+        self.cache.set('k', 'v')
+        self.clock.now += 30
+        self.assertEqual(self.cache.get('k'), {'value': 'v', 'age_seconds': 30.0, 'stale': False})
+        self.clock.now += 60
+        self.assertTrue(self.cache.get('k')['stale'])
+        self.clock.now += 100
+        self.assertIsNone(self.cache.get('k'))
+
+    def test_stale_hit_is_served_and_refreshed_once_in_the_background(self):
+        self.cache.set('k', 'old')
+        self.clock.now += 90
+        refreshed = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            refreshed.wait(2)
+            return 'new'
+
+        value, meta = self.cache.get_or_fetch('k', fetch)
+        self.assertEqual((value, meta['hit'], meta['stale']), ('old', True, True))
+        # A second stale hit while the refresh runs does not start another one
+        self.assertEqual(self.cache.get_or_fetch('k', fetch)[0], 'old')
+        refreshed.set()
+        deadline = time.monotonic() + 2
+        while self.cache.stats()['refreshes'] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.get('k')['value'], 'new')
+
+    def test_failures_are_not_cached(self):
+        def fail():
+            raise RuntimeError('upstream down')
+
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_fetch('k', fail)
+        self.assertIsNone(self.cache.get('k'))
+        value, meta = self.cache.get_or_fetch('k', lambda: 'ok')
+        self.assertEqual((value, meta['hit']), ('ok', False))
+
+    def test_should_cache_ttl_for_and_bypass(self):
+        self.cache.get_or_fetch('rejected', lambda: {'error': 'x'}, should_cache=lambda v: 'error' not in v)
+        self.assertIsNone(self.cache.get('rejected'))
+        self.cache.get_or_fetch('short', lambda: [], ttl_for=lambda v: 5 if not v else None)
+        self.clock.now += 10
+        self.assertTrue(self.cache.get('short')['stale'])
+        self.cache.get_or_fetch('never', lambda: [], ttl_for=lambda v: 0)
+        self.assertIsNone(self.cache.get('never'))
+        self.cache.set('k', 'old')
+        value, meta = self.cache.get_or_fetch('k', lambda: 'new', bypass=True)
+        self.assertEqual((value, meta['hit'], self.cache.get('k')['value']), ('new', False, 'new'))
+
+    def test_local_backend_evicts_least_recently_used(self):
+        backend = LocalLRUBackend(maxsize=2)
+        backend.set('a', 1, None)
+        backend.set('b', 2, None)
+        backend.get('a')
+        backend.set('c', 3, None)
+        self.assertEqual((backend.get('a'), backend.get('b'), backend.get('c')), (1, None, 3))
+        self.assertEqual(backend.evictions, 1)
+
+
+class _FakeGoogleSearch:
+    """Stands in for serpapi.GoogleSearch; only gl values in ``hits`` return a flight."""
+
+    hits = set()
+    calls = []
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_dict(self):
+        gl = self.params.get('gl')
+        type(self).calls.append(gl)
+        if gl not in self.hits:
+            return {}
+        leg = {
+            'airline': 'BA',
+            'departure_airport': {'id': 'JFK', 'time': '2025-03-01 09:00'},
+            'arrival_airport': {'id': 'LHR', 'time': '2025-03-01 21:00'},
+        }
+        return {'best_flights': [{'flights': [leg], 'price': 500, 'total_duration': 420}]}
+
+
+class SerpapiMemoTests(SimpleTestCase):
+    def setUp(self):
+        _FakeGoogleSearch.hits = {'gb'}
+        _FakeGoogleSearch.calls = []
+        patcher = mock.patch('travel.flight_agent.GoogleSearch', _FakeGoogleSearch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        memo = TTLCache('serpapi-memo-test', LocalLRUBackend(maxsize=100), ttl=3600)
+        self.tool = FlightSearchTool('key', memo=memo)
+
+    def test_remembers_working_gl_and_skips_known_empty_ones(self):
+        first = self.tool._search_serpapi('JFK', 'LHR', '2025-03-01')
+        self.assertEqual(first['total_results'], 1)
+        self.assertEqual(_FakeGoogleSearch.calls, [None, 'us', 'gb'])
+
+        _FakeGoogleSearch.calls = []
+        second = self.tool._search_serpapi('JFK', 'LHR', '2025-03-01')
+        self.assertEqual(second['total_results'], 1)
+        self.assertEqual(_FakeGoogleSearch.calls, ['gb'])
+
+    def test_all_empty_route_costs_nothing_on_repeat(self):
+        _FakeGoogleSearch.hits = set()
+        self.tool._search_serpapi('JFK', 'LHR', '2025-03-01')
+        self.assertEqual(len(_FakeGoogleSearch.calls), 3)
+
+        _FakeGoogleSearch.calls = []
+        again = self.tool._search_serpapi('JFK', 'LHR', '2025-03-01')
+        self.assertEqual(_FakeGoogleSearch.calls, [])
+        self.assertTrue(again['success'])
+        self.assertEqual(again['negative_cache_skips'], 3)
+
+        # A different date is a different search
+        self.tool._search_serpapi('JFK', 'LHR', '2025-03-02')
+        self.assertEqual(len(_FakeGoogleSearch.calls), 3)
+
+    def test_failed_call_is_not_memoized_as_empty(self):
+        with mock.patch.object(_FakeGoogleSearch, 'get_dict', side_effect=RuntimeError('boom')):
+            failed = self.tool._search_serpapi('JFK', 'LHR', '2025-03-01')
+        self.assertFalse(failed['success'])
+        self.tool._search_serpapi('JFK', 'LHR', '2025-03-01')
+        self.assertEqual(_FakeGoogleSearch.calls, [None, 'us', 'gb'])
+
+
+class AgentRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = AgentRegistry()
+        self.built = []
+
+    def _factory(self, label):
+        def build():
+            self.built.append(label)
+            return object()
+        return build
+
+    def test_builds_once_per_fingerprint(self):
+        fp = AgentRegistry.fingerprint('openai-key', 'serp-key')
+        first = self.registry.get('flight', fp, self._factory('a'))
+        second = self.registry.get('flight', fp, self._factory('b'))
+        self.assertIs(first, second)
+        self.assertEqual(self.built, ['a'])
+
+    def test_rebuilds_when_config_changes(self):
+        first = self.registry.get('flight', AgentRegistry.fingerprint('k1'), self._factory('a'))
+        second = self.registry.get('flight', AgentRegistry.fingerprint('k2'), self._factory('b'))
+        self.assertIsNot(first, second)
+        self.assertIs(self.registry.get('flight', AgentRegistry.fingerprint('k2'), self._factory('c')), second)
+        self.assertEqual(self.built, ['a', 'b'])
+
+    def test_fingerprint_hides_raw_keys(self):
+        fp = AgentRegistry.fingerprint('sk-secret', None)
+        self.assertNotIn('sk-secret', fp)
+        self.assertEqual(fp, AgentRegistry.fingerprint('sk-secret', ''))
+
+    def test_concurrent_first_use_builds_once(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def slow():
+            time.sleep(0.05)
+            return self._factory('x')()
+
+        def worker():
+            barrier.wait()
+            results.append(self.registry.get('hotel', 'fp', slow))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.built, ['x'])
+        self.assertEqual(len({id(r) for r in results}), 1)
+
+
+class _JsonHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.peers.add(self.client_address)
+        query = parse_qs(urlparse(self.path).query)
+        server.queries.append({k: v[0] for k, v in query.items()})
+        status, body, delay = server.reply(self.path)
+        if delay:
+            time.sleep(delay)
+        payload = json.dumps(body).encode() if not isinstance(body, bytes) else body
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_json_server(test, reply):
+    """Local keep-alive JSON server; ``reply(path)`` returns ``(status, body, delay)``."""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _JsonHandler)
+    server.daemon_threads = True
+    # Cancelled clients hang up mid-reply; that is expected here
+    server.handle_error = lambda request, client_address: None
+    server.reply = reply
+    server.peers = set()
+    server.queries = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+class AsyncUpstreamTests(SimpleTestCase):
+    def setUp(self):
+        self.server, self.base = _start_json_server(self, self._reply)
+        patcher = mock.patch('travel.upstream.SERPAPI_ENDPOINT', self.base + '/search')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _reply(self, path):
+        if 'fail=1' in path:
+            return 502, {'error': 'bad gateway'}, 0
+        if 'bad=1' in path:
+            return 400, {'error': 'Invalid API key'}, 0
+        if path.startswith('/slow'):
+            return 200, {}, 0.5
+        return 200, {'best_flights': []}, 0
+
+    def test_calls_from_separate_loops_share_one_connection(self):
+        for _ in range(3):
+            data = asyncio.run(upstream.serpapi_get_json({'engine': 'google_flights', 'gl': None}))
+            self.assertEqual(data, {'best_flights': []})
+        self.assertEqual(len(self.server.peers), 1)
+        query = self.server.queries[0]
+        self.assertEqual(query['output'], 'json')
+        self.assertNotIn('gl', query)
+
+    def test_error_payload_is_returned_and_server_error_raises(self):
+        data = asyncio.run(upstream.serpapi_get_json({'bad': 1}))
+        self.assertEqual(data, {'error': 'Invalid API key'})
+        with self.assertRaises(httpx.HTTPStatusError):
+            asyncio.run(upstream.serpapi_get_json({'fail': 1}))
+
+    def test_cancelling_the_caller_does_not_break_the_client(self):
+        async def cancelled():
+            task = asyncio.ensure_future(upstream.async_get(self.base + '/slow'))
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        asyncio.run(cancelled())
+        resp = asyncio.run(upstream.async_get(self.base + '/ok'))
+        self.assertEqual(resp.status_code, 200)
+
+
+class FareCalendarTests(SimpleTestCase):
+    PRICES = {'2025-03-01': 420, '2025-03-02': 310, '2025-03-03': None, '2025-03-04': 350}
+
+    def setUp(self):
+        cache = TTLCache('fare-calendar-test', LocalLRUBackend(maxsize=100), ttl=3600)
+        self.agent = FlightAIAgent('openai-key', 'serp-key', max_workers=2, cache=cache)
+        self.calls = []
+        self.in_flight = 0
+        self.peak = 0
+        self.agent.flight_search._search_serpapi_async = self._fake_search
+
+    async def _fake_search(self, origin, destination, departure_date, return_date=None, *args):
+        self.calls.append((departure_date, return_date))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        price = self.PRICES[departure_date]
+        flights = [] if price is None else [
+            {'airline': 'AA', 'price': price, 'stops': 0},
+            {'airline': 'UA', 'price': price + 50, 'stops': 1},
+            {'airline': 'XX', 'price': 0, 'stops': 0},
+        ]
+        return {'success': True, 'flights': flights, 'total_results': len(flights)}
+
+    def test_lowest_fare_per_date_and_cheapest_day(self):
+        result = asyncio.run(self.agent.fare_calendar('JFK', 'LAX', '2025-03-01', days=4))
+        data = result['data']
+        self.assertEqual([d['lowest_price'] for d in data['calendar']], [420, 310, None, 350])
+        self.assertEqual(data['calendar'][1]['airline'], 'AA')
+        self.assertEqual(data['cheapest_date'], '2025-03-02')
+        self.assertEqual(data['cheapest_price'], 310)
+        self.assertLessEqual(self.peak, 2)
+        self.assertEqual(data['cached_dates'], 0)
+
+    def test_round_trip_dates_and_cached_repeat(self):
+        asyncio.run(self.agent.fare_calendar('JFK', 'LAX', '2025-03-01', days=2, trip_length=5))
+        self.assertEqual(sorted(self.calls), [('2025-03-01', '2025-03-06'), ('2025-03-02', '2025-03-07')])
+        again = asyncio.run(self.agent.fare_calendar('JFK', 'LAX', '2025-03-01', days=2, trip_length=5))
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(again['data']['cached_dates'], 2)
+
+    def test_rejects_bad_start_date(self):
+        result = asyncio.run(self.agent.fare_calendar('JFK', 'LAX', '03/01/2025'))
+        self.assertFalse(result['success'])
+        self.assertEqual(self.calls, [])
+
+
+def _airport(iata, name, city, country, lat, lon, metro='', metro_city=''):
+    return {'iata': iata, 'name': name, 'city': city, 'subdivision': '', 'country': country,
+            'lat': str(lat), 'lon': str(lon), 'metro': metro, 'metro_city': metro_city}
+
+
+class AirportIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = AirportIndex([
+            _airport('JFK', 'John F Kennedy International Airport', 'New York', 'US', 40.64, -73.78, 'NYC', 'New York'),
+            _airport('LGA', 'LaGuardia Airport', 'New York', 'US', 40.78, -73.87, 'NYC', 'New York'),
+            _airport('JRB', 'Downtown Manhattan Heliport', 'New York', 'US', 40.70, -74.01),
+            _airport('DEL', 'Indira Gandhi International Airport', 'New Delhi', 'IN', 28.57, 77.10),
+            _airport('MUC', 'Munich Airport', 'München', 'DE', 48.35, 11.79),
+            _airport('TRF', 'Sandefjord Airport Torp', 'Sandefjord', 'NO', 59.19, 10.26),
+            _airport('OSL', 'Oslo Airport Gardermoen', 'Oslo', 'NO', 60.19, 11.10),
+        ])
+
+    def codes(self, query, limit=10):
+        return [e['code'] for e in self.index.search(query, limit)]
+
+    def test_exact_code_and_metro(self):
+        self.assertEqual(self.codes('jfk')[0], 'JFK')
+        self.assertEqual(self.codes('NYC')[0], 'NYC')
+        metro = self.index.get('nyc')
+        self.assertEqual(metro['type'], 'metro')
+        self.assertEqual(metro['airports'], ['JFK', 'LGA'])
+        self.assertNotIn('_terms', metro)
+
+    def test_city_prefix_ranks_hub_first_and_heliport_last(self):
+        codes = self.codes('new yo')
+        self.assertEqual(codes[0], 'JFK')
+        self.assertGreater(codes.index('JRB'), max(codes.index(c) for c in ('JFK', 'LGA', 'NYC')))
+
+    def test_accents_and_typos(self):
+        self.assertEqual(self.codes('munchen'), ['MUC'])
+        self.assertIn('MUC', self.codes('munich'))
+        self.assertIn('OSL', self.codes('oslp'))
+
+    def test_city_airports_and_country_hubs(self):
+        self.assertEqual(self.index.city_airports('Delhi'), ['DEL'])
+        self.assertEqual(self.index.city_airports('New York', limit=2), ['JFK', 'LGA'])
+        self.assertEqual(self.index.country_hubs('no', limit=6), ['OSL', 'BGO', 'TRD', 'SVG', 'TRF'])
+
+    def test_shipped_data_file_loads(self):
+        index = get_airport_index()
+        self.assertIs(index, get_airport_index())
+        self.assertEqual(index.get('LHR')['country'], 'GB')
+        self.assertEqual(index.search('london', 1)[0]['city'], 'London')
+
+
+class SearchBatchTests(SimpleTestCase):
+    FARES = {('JFK', 'LHR'): [640, 520], ('LHR', 'CDG'): [0, 95], ('CDG', 'JFK'): []}
+
+    def setUp(self):
+        self.agent = FlightAIAgent('openai-key', 'serp-key')
+        self.calls = []
+
+        async def fake_search(origin, destination, departure_date, **kwargs):
+            self.calls.append((origin, destination, departure_date))
+            self.assertIsInstance(kwargs['shared'], dict)
+            flights = [{'airline': 'AA', 'price': p} for p in self.FARES[(origin.upper(), destination.upper())]]
+            return {'success': True, 'data': {'flights': flights}}
+
+        self.agent.search_and_recommend_flights = fake_search
+
+    def test_identical_legs_are_searched_once(self):
+        legs = [
+            {'origin': 'JFK', 'destination': 'LHR', 'departure_date': '2025-03-01'},
+            {'origin': 'jfk ', 'destination': 'lhr', 'departure_date': '2025-03-01'},
+            {'origin': 'JFK', 'destination': 'LHR', 'departure_date': '2025-03-01', 'adults': 2},
+        ]
+        data = asyncio.run(self.agent.search_batch(legs))['data']
+        self.assertEqual([leg['duplicate_of'] for leg in data['legs']], [None, 0, None])
+        self.assertEqual(data['unique_legs'], 2)
+        self.assertEqual(len(self.calls), 2)
+        self.assertIs(data['legs'][1]['result'], data['legs'][0]['result'])
+
+    def test_cheapest_combination_skips_unpriced_flights(self):
+        legs = [
+            {'origin': 'JFK', 'destination': 'LHR', 'departure_date': '2025-03-01'},
+            {'origin': 'LHR', 'destination': 'CDG', 'departure_date': '2025-03-05'},
+        ]
+        combo = asyncio.run(self.agent.search_batch(legs))['data']['cheapest_combination']
+        self.assertTrue(combo['complete'])
+        self.assertEqual([f['price'] for f in combo['flights']], [520, 95])
+        self.assertEqual(combo['total_price'], 615)
+
+    def test_leg_without_flights_makes_combination_incomplete(self):
+        legs = [
+            {'origin': 'JFK', 'destination': 'LHR', 'departure_date': '2025-03-01'},
+            {'origin': 'CDG', 'destination': 'JFK', 'departure_date': '2025-03-09'},
+        ]
+        combo = asyncio.run(self.agent.search_batch(legs))['data']['cheapest_combination']
+        self.assertFalse(combo['complete'])
+        self.assertIsNone(combo['total_price'])
+        self.assertEqual(combo['missing_legs'], [1])
+
+
+class PriceWatchTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('watcher', password='pw')
+        start = date.today() + timedelta(days=10)
+        self.trip = Trip.objects.create(user=user, title='Trip', destination='London', start_date=start,
+                                        end_date=start + timedelta(days=4), budget=2000)
+        self.departure = f'{start.isoformat()} 09:00'
+        TripItem.objects.create(trip=self.trip, item_type='flight', name='BA JFK-LHR', price=500, is_selected=True,
+                                metadata={'airline': 'BA', 'departure': 'JFK', 'arrival': 'LHR',
+                                          'departureTime': self.departure, 'flightNumber': 'BA 178'})
+        self.flights = []
+
+    def flight(self, price, number='BA 178', departure='JFK', arrival='LHR'):
+        return {'airline': 'BA', 'price': price, 'departure': departure, 'arrival': arrival,
+                'departureTime': self.departure, 'flightNumber': number}
+
+    def refresh(self):
+        async def fake_run(searches, concurrency):
+            return {key: {'success': True, 'flights': list(self.flights)} for key, _search in searches}
+
+        with mock.patch('travel.price_watch._run_searches', fake_run):
+            return price_watch.refresh_prices(horizon_days=30)
+
+    def snapshots(self):
+        return list(PriceSnapshot.objects.filter(trip=self.trip).order_by('checked_at'))
+
+    def test_snapshot_only_when_price_changes(self):
+        self.flights = [self.flight(500), self.flight(450, number='BA 112')]
+        self.assertEqual(self.refresh()['snapshots'], 1)
+        self.assertEqual(self.refresh()['snapshots'], 0)
+        self.flights = [self.flight(530), self.flight(450, number='BA 112')]
+        stats = self.refresh()
+        self.assertEqual((stats['snapshots'], stats['changed']), (1, 1))
+        latest = self.snapshots()[-1]
+        self.assertEqual((latest.price, latest.lowest_price, latest.selected_price),
+                         (Decimal('530.00'), Decimal('450.00'), Decimal('500.00')))
+
+    def test_same_airline_and_time_on_another_flight_or_route_is_not_a_match(self):
+        self.flights = [self.flight(300, number='BA 112'), self.flight(250, arrival='LGW')]
+        self.refresh()
+        snapshot = self.snapshots()[-1]
+        self.assertIsNone(snapshot.price)
+        self.assertEqual(snapshot.lowest_price, Decimal('250.00'))
+
+    def test_selection_without_flight_number_matches_on_route_and_time(self):
+        item = TripItem.objects.get(trip=self.trip)
+        item.metadata.pop('flightNumber')
+        item.save()
+        self.flights = [self.flight(480, arrival='LGW'), self.flight(510)]
+        self.refresh()
+        self.assertEqual(self.snapshots()[-1].price, Decimal('510.00'))
+
+    def test_searches_skip_the_result_cache(self):
+        flight_search = mock.Mock(search_flights_async=mock.AsyncMock(return_value={'success': True}))
+        hotel_search = mock.Mock(search_hotels_async=mock.AsyncMock(return_value={'success': True}))
+        with mock.patch('travel.flight_agent.get_flight_agent', return_value=mock.Mock(flight_search=flight_search)), \
+                mock.patch('travel.hotel_agent.get_hotel_agent', return_value=mock.Mock(hotel_search=hotel_search)):
+            asyncio.run(price_watch._run_searches([
+                (('flight',), {'origin': 'JFK'}),
+                (('hotel',), {'destination': 'London'}),
+            ], 2))
+        flight_search.search_flights_async.assert_awaited_once_with(origin='JFK', bypass_cache=True)
+        hotel_search.search_hotels_async.assert_awaited_once_with(destination='London', bypass_cache=True)
+
+
+class _FakeHotelSearch:
+    """Stands in for serpapi.GoogleSearch on the hotels engine."""
+
+    calls = []
+    properties = []
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_dict(self):
+        type(self).calls.append(self.params)
+        return {'properties': list(self.properties)}
+
+
+def _property(name, price=None):
+    item = {'name': name, 'overall_rating': 4.2}
+    if price is not None:
+        item['rate_per_night'] = {'extracted_lowest': price}
+    return item
+
+
+class HotelSearchCacheTests(SimpleTestCase):
+    def setUp(self):
+        _FakeHotelSearch.calls = []
+        _FakeHotelSearch.properties = [_property('Cheap Inn', 80), _property('Grand', 320), _property('No Rate')]
+        patcher = mock.patch('travel.hotel_agent.GoogleSearch', _FakeHotelSearch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tool = HotelSearchTool('key', cache=TTLCache('hotel-test', LocalLRUBackend(maxsize=100), ttl=3600))
+
+    def search(self, **kwargs):
+        return self.tool.search_hotels('Lisbon', '2030-05-01', '2030-05-04', **kwargs)
+
+    def names(self, result):
+        return sorted(h['name'] for h in result['hotels'])
+
+    def test_budget_filter_runs_on_the_cached_list(self):
+        tight = self.search(budget_max=100)
+        self.assertEqual(self.names(tight), ['Cheap Inn', 'No Rate'])
+        wide = self.search(budget_max=500)
+        self.assertEqual(self.names(wide), ['Cheap Inn', 'Grand', 'No Rate'])
+        self.assertTrue(wide['cache']['hit'])
+        self.assertEqual(len(_FakeHotelSearch.calls), 1)
+
+    def test_bypass_refreshes_the_cached_list(self):
+        self.search()
+        _FakeHotelSearch.properties = [_property('Cheap Inn', 95)]
+        fresh = self.search(bypass_cache=True)
+        self.assertFalse(fresh['cache']['hit'])
+        self.assertEqual(self.search()['hotels'][0]['price'], 95)
+        self.assertEqual(len(_FakeHotelSearch.calls), 2)
+
+    def test_unknown_prices_are_kept_and_never_raise(self):
+        result = {'success': True, 'hotels': [{'name': 'A', 'price': '$120'}, {'name': 'B', 'price': 150},
+                                              {'name': 'C'}, {'name': 'D', 'price': 90}]}
+        filtered = self.tool._filter_hotels(result, '100')
+        self.assertEqual([h['name'] for h in filtered['hotels']], ['A', 'C', 'D'])
+        self.assertEqual(filtered['total_results'], 3)
+        self.assertIs(self.tool._filter_hotels(result, 'any'), result)
+
+
+class HotelPaginationTests(SimpleTestCase):
+    def setUp(self):
+        self.requested = []
+        self.pages = []
+        self.delay = 0
+        patcher = mock.patch('travel.hotel_agent.serpapi_get_json', self._fake_serpapi)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tool = HotelSearchTool('key', cache=TTLCache('hotel-pages-test', LocalLRUBackend(maxsize=100), ttl=3600))
+
+    async def _fake_serpapi(self, params):
+        token = params.get('next_page_token')
+        page = int(token) if token else 0
+        self.requested.append(page)
+        if page and self.delay:
+            await asyncio.sleep(self.delay)
+        properties = [{'property_token': pid, **_property(pid, price)} for pid, price in self.pages[page]]
+        out = {'properties': properties}
+        if page + 1 < len(self.pages):
+            out['serpapi_pagination'] = {'next_page_token': str(page + 1)}
+        return out
+
+    def search(self, **kwargs):
+        return asyncio.run(self.tool.search_hotels_async('Lisbon', '2030-05-01', '2030-05-04', **kwargs))
+
+    def test_reads_pages_until_enough_results_pass_the_budget(self):
+        self.pages = [[('a', 90), ('b', 400)], [('c', 80), ('a', 90), ('d', 500)], [('e', 70)], [('f', 60)]]
+        result = self.search(budget_max=100, min_results=3, max_pages=5)
+        self.assertEqual([h['id'] for h in result['hotels']], ['a', 'c', 'e'])
+        self.assertEqual(result['pagination']['stopped'], 'enough_results')
+        self.assertEqual(result['pagination']['pages'], 3)
+        self.assertNotIn(3, self.requested)
+
+    def test_stops_at_max_pages_and_last_page(self):
+        self.pages = [[('a', 90)], [('b', 90)], [('c', 90)]]
+        result = self.search(min_results=10, max_pages=2)
+        self.assertEqual(result['pagination']['stopped'], 'max_pages')
+        self.assertEqual(len(result['hotels']), 2)
+        result = self.search(min_results=10, max_pages=5)
+        self.assertEqual(result['pagination']['stopped'], 'last_page')
+        self.assertEqual(len(result['hotels']), 3)
+
+    def test_pages_are_cached_individually(self):
+        self.pages = [[('a', 90)], [('b', 90)]]
+        self.search(min_results=2)
+        self.search(min_results=2)
+        self.assertEqual(self.requested, [0, 1])
+
+    def test_time_budget_returns_what_it_has(self):
+        self.pages = [[('a', 90)], [('b', 90)]]
+        self.delay = 0.5
+        result = self.search(min_results=2, time_budget=0.05)
+        self.assertEqual(result['pagination']['stopped'], 'time_budget')
+        self.assertEqual([h['id'] for h in result['hotels']], ['a'])
+
+    def test_without_min_results_only_the_first_page_is_read(self):
+        self.pages = [[('a', 90)], [('b', 90)]]
+        result = self.search()
+        self.assertNotIn('pagination', result)
+        self.assertEqual(self.requested, [0])
+
+
+class RankByProximityTests(SimpleTestCase):
+    POIS = [{'lat': 38.7139, 'lon': -9.1394}, {'lat': 38.6916, 'lon': -9.2160}, {'name': 'no coordinates'}]
+
+    def hotel(self, hotel_id, lat, lon, price=100):
+        return {'id': hotel_id, 'name': hotel_id, 'price': price, 'lat': lat, 'lon': lon}
+
+    def test_matches_per_pair_distances(self):
+        hotels = [self.hotel(f'h{i}', 38.70 + i * 0.01, -9.20 + i * 0.02) for i in range(6)]
+        ranked, unlocated = rank_by_proximity(hotels, self.POIS)
+        self.assertEqual(unlocated, [])
+        for hotel in ranked:
+            pairs = [km_between(hotel['lat'], hotel['lon'], p['lat'], p['lon']) for p in self.POIS[:2]]
+            self.assertAlmostEqual(hotel['proximity']['total_km'], sum(pairs), places=3)
+            self.assertAlmostEqual(hotel['proximity']['nearest_km'], min(pairs), places=3)
+        totals = [h['proximity']['total_km'] for h in ranked]
+        self.assertEqual(totals, sorted(totals))
+
+    def test_aggregate_changes_the_order(self):
+        # 'between' is moderately far from both POIs; 'beside' is next to one and far from the other
+        between = self.hotel('between', 38.7100, -9.1777)
+        beside = self.hotel('beside', 38.7139, -9.1394)
+        by_sum, _ = rank_by_proximity([between, beside], self.POIS, 'sum')
+        self.assertEqual([h['id'] for h in by_sum], ['beside', 'between'])
+        by_max, _ = rank_by_proximity([beside, between], self.POIS, 'max')
+        self.assertEqual([h['id'] for h in by_max], ['between', 'beside'])
+        with self.assertRaises(ValueError):
+            rank_by_proximity([beside], self.POIS, 'median')
+
+    def test_ties_keep_incoming_order_and_unlocated_are_split_out(self):
+        hotels = [self.hotel('a', 38.70, -9.18, 50), self.hotel('b', 38.70, -9.18, 80),
+                  {'id': 'c', 'lat': None, 'lon': -9.1}, {'id': 'd', 'lat': 120, 'lon': 0}]
+        ranked, unlocated = rank_by_proximity(hotels, self.POIS)
+        self.assertEqual([h['id'] for h in ranked], ['a', 'b'])
+        self.assertEqual([h['id'] for h in unlocated], ['c', 'd'])
+        ranked, _ = rank_by_proximity(hotels[:2], [{'name': 'no coordinates'}])
+        self.assertEqual([h['proximity'] for h in ranked], [None, None])
+
+    def test_agent_ranks_the_stay_and_counts_hotels_without_coordinates(self):
+        agent = HotelAIAgent.__new__(HotelAIAgent)
+        agent.hotel_search = mock.Mock(search_hotels_async=mock.AsyncMock(return_value={
+            'success': True,
+            'hotels': [self.hotel('far', 38.80, -9.40), self.hotel('near', 38.71, -9.15), {'id': 'x', 'name': 'x'}],
+            'cache': {'hit': True},
+        }))
+        result = asyncio.run(agent.rank_hotels_by_proximity('Lisbon', '2030-05-01', '2030-05-04', self.POIS, limit=1))
+        self.assertEqual([h['id'] for h in result['data']['hotels']], ['near'])
+        self.assertEqual((result['data']['total'], result['data']['without_coordinates']), (2, 1))
+        self.assertEqual(result['cache'], {'hit': True})
+
+
+@override_settings(UPSTREAM_POOL_MAXSIZE=4, UPSTREAM_POOL_SIZES={'127.0.0.1': 2},
+                   UPSTREAM_CONNECT_TIMEOUT=1.5, UPSTREAM_READ_TIMEOUT=7.0)
+class PooledSessionTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(upstream._sessions, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: [session.close() for session in upstream._sessions.values()])
+        self.server, self.base = _start_json_server(self, lambda path: (200, {'ok': True}, 0))
+
+    def test_one_session_per_host_sized_from_settings(self):
+        session = upstream.get_session(self.base + '/a')
+        self.assertIs(upstream.get_session(self.base + '/b?x=1'), session)
+        other = upstream.get_session('https://api.geoapify.com/v2/places')
+        self.assertIsNot(other, session)
+        stats = upstream.pool_stats()
+        self.assertEqual(stats['127.0.0.1']['pool_maxsize'], 2)
+        self.assertEqual(stats['api.geoapify.com']['pool_maxsize'], 4)
+
+    def test_sequential_calls_reuse_the_connection(self):
+        for _ in range(4):
+            self.assertEqual(upstream.http_get(self.base + '/ping', params={'q': 1}).json(), {'ok': True})
+        self.assertEqual(len(self.server.peers), 1)
+        self.assertEqual(self.server.queries[-1], {'q': '1'})
+
+    def test_default_and_explicit_timeouts(self):
+        session = mock.Mock()
+        with mock.patch('travel.upstream.get_session', return_value=session):
+            upstream.http_get(self.base + '/ping')
+            self.assertEqual(session.get.call_args.kwargs['timeout'], (1.5, 7.0))
+            upstream.http_get(self.base + '/ping', timeout=3)
+            self.assertEqual(session.get.call_args.kwargs['timeout'], 3)
+
+
+@override_settings(GEOCODE_CACHE_TTL=3600, GEOCODE_NEGATIVE_TTL=300)
+class GeoLookupCacheTests(SimpleTestCase):
+    def setUp(self):
+        _use_fresh_local_caches(self)
+        self.clock = _Clock()
+        patcher = mock.patch('travel.cache.time.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def lookup(self, answer, destination='  Porto,  Portugal '):
+        def fetch(dest):
+            self.calls.append(dest)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+        return views._cached_geo_lookup('geocode', destination, fetch, default='fallback')
+
+    def test_found_results_are_cached_per_normalized_destination(self):
+        self.assertEqual(self.lookup({'lat': 41.1}), {'lat': 41.1})
+        self.assertEqual(self.lookup({'lat': 0}, destination='porto, portugal'), {'lat': 41.1})
+        self.assertEqual(self.calls, ['Porto, Portugal'])
+        self.clock.now += 3601
+        self.lookup({'lat': 41.2})
+        self.assertEqual(len(self.calls), 2)
+
+    def test_not_found_is_cached_for_the_negative_ttl(self):
+        self.assertIsNone(self.lookup(None))
+        self.clock.now += 299
+        self.assertIsNone(self.lookup({'lat': 41.1}))
+        self.assertEqual(len(self.calls), 1)
+        self.clock.now += 2
+        self.assertEqual(self.lookup({'lat': 41.1}), {'lat': 41.1})
+        self.assertEqual(len(self.calls), 2)
+
+    def test_failures_return_the_default_and_are_retried(self):
+        self.assertEqual(self.lookup(requests.Timeout('read timed out')), 'fallback')
+        self.assertEqual(self.lookup({'lat': 41.1}), {'lat': 41.1})
+        self.assertEqual(len(self.calls), 2)
+        with self.assertRaises(QuotaExceeded):
+            self.lookup(QuotaExceeded('geoapify', 1.0, 'global'), destination='Braga')
+        self.assertEqual(self.lookup({'lat': 1}, destination=' '), 'fallback')
+
+
+class HedgedGetJsonTests(SimpleTestCase):
+    def setUp(self):
+        self.server, self.base = _start_json_server(self, self._reply)
+        self.charged = []
+        patcher = mock.patch('travel.upstream.charge', self.charged.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _reply(self, path):
+        kind, _, delay = urlparse(path).path.strip('/').partition('/')
+        delay = float(delay or 0)
+        if kind == 'fail':
+            return 500, {'error': 'upstream down'}, delay
+        if kind == 'garbage':
+            return 200, b'not json', delay
+        return 200, {'features': [{'id': path}] if kind == 'hit' else []}, delay
+
+    def hedge(self, paths, width=3, deadline=None):
+        attempts = [(self.base + p, 5) for p in paths]
+        return asyncio.run(upstream.hedged_get_json(
+            attempts, accept=lambda data: bool(data.get('features')), width=width, deadline=deadline, provider='geoapify',
+        ))
+
+    def test_waits_for_a_slower_preferred_attempt(self):
+        outcome = self.hedge(['/hit/0.3', '/hit', '/hit'])
+        self.assertEqual(outcome['index'], 0)
+        self.assertEqual(outcome['stopped'], 'won')
+        self.assertEqual(outcome['data'], {'features': [{'id': '/hit/0.3'}]})
+
+    def test_rejected_and_failed_attempts_fall_through(self):
+        outcome = self.hedge(['/empty', '/fail', '/garbage', '/hit', '/hit'], width=2)
+        self.assertEqual(outcome['index'], 3)
+        self.assertEqual(outcome['failed'], 2)
+        self.assertEqual(outcome['launched'], len(self.charged))
+        self.assertEqual(self.charged, ['geoapify'] * outcome['launched'])
+
+    def test_early_winner_cancels_the_rest(self):
+        outcome = self.hedge(['/hit', '/empty/1', '/empty/1', '/empty/1', '/hit'], width=3)
+        self.assertEqual(outcome['index'], 0)
+        self.assertLessEqual(outcome['launched'], 4)
+        self.assertLess(outcome['elapsed_ms'], 900)
+
+    def test_deadline_returns_the_best_accepted_so_far(self):
+        outcome = self.hedge(['/hit/1', '/hit'], deadline=0.2)
+        self.assertEqual((outcome['index'], outcome['stopped']), (1, 'deadline'))
+        outcome = self.hedge(['/hit/1'], deadline=0.1)
+        self.assertEqual((outcome['index'], outcome['data'], outcome['stopped']), (None, None, 'deadline'))
+
+    def test_all_rejected_is_exhausted(self):
+        outcome = self.hedge(['/empty', '/fail'])
+        self.assertEqual((outcome['index'], outcome['stopped'], outcome['completed']), (None, 'exhausted', 2))
+
+
+def _features(places):
+    return [{'properties': {'place_id': pid, 'lat': lat, 'lon': lon, 'categories': [category]}}
+            for pid, lat, lon, category in places]
+
+
+def _pid(feature):
+    return feature['properties']['place_id']
+
+
+class GridIndexTests(SimpleTestCase):
+    def setUp(self):
+        places = (_scatter(400, 59.91, 10.75, 0.4, 'catering.cafe', seed=1)
+                  + _scatter(200, 59.95, 10.80, 0.3, 'tourism.sights', seed=2)
+                  + _scatter(20, 60.8, 11.9, 0.05, 'catering.restaurant', seed=3))
+        self.features = _features(places)
+        self.index = GridIndex(self.features + [{'properties': {'place_id': 'no-point'}}], cell_deg=0.05)
+
+    def brute(self, lat, lon, category=''):
+        return sorted(
+            (km_between(lat, lon, f['properties']['lat'], f['properties']['lon']), _pid(f))
+            for f in self.features if f['properties']['categories'][0].startswith(category)
+        )
+
+    def test_radius_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(25):
+            lat, lon = 59.91 + rng.uniform(-0.5, 0.5), 10.75 + rng.uniform(-0.5, 0.5)
+            radius_km, category = rng.choice([0.5, 3, 12]), rng.choice(['', 'catering', 'tourism.sights'])
+            found = self.index.radius(lat, lon, radius_km, categories=[category] if category else ())
+            expected = [pid for d, pid in self.brute(lat, lon, category) if d <= radius_km]
+            self.assertEqual(sorted(_pid(f) for _d, f in found), sorted(expected))
+            distances = [d for d, _f in found]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(11)
+        for _ in range(25):
+            lat, lon = 59.91 + rng.uniform(-1, 1), 10.75 + rng.uniform(-1, 1.5)
+            k, category = rng.choice([1, 5, 30]), rng.choice(['', 'catering.restaurant', 'tourism'])
+            found = self.index.nearest(lat, lon, k, categories=[category] if category else ())
+            expected = self.brute(lat, lon, category)[:k]
+            self.assertEqual([_pid(f) for _d, f in found], [pid for _d, pid in expected])
+            for (d, _f), (expected_d, _pid_) in zip(found, expected):
+                self.assertAlmostEqual(d, expected_d, places=6)
+        within = self.index.nearest(59.91, 10.75, 50, max_km=2)
+        self.assertTrue(all(d <= 2 for d, _f in within))
+
+    def test_bbox_and_edge_cases(self):
+        found = self.index.bbox(59.8, 10.6, 60.0, 10.9, categories=['tourism'])
+        expected = [_pid(f) for f in self.features if f['properties']['categories'][0] == 'tourism.sights'
+                    and 59.8 <= f['properties']['lat'] <= 60.0 and 10.6 <= f['properties']['lon'] <= 10.9]
+        self.assertEqual([_pid(f) for f in found], expected)
+        self.assertEqual(len(self.index.bbox(59.8, 10.6, 60.0, 10.9, limit=3)), 3)
+        self.assertEqual(len(self.index), len(self.features))
+        self.assertEqual(GridIndex([]).nearest(0, 0, 3), [])
+
+
+class PlacesCatalogIndexTests(TestCase):
+    def test_only_fresh_places_are_served_and_indexed(self):
+        catalog = PlacesCatalog(max_age=3600, refresh_interval=0)
+        fresh, stale = _features([('fresh', 48.85, 2.35, 'tourism.sights'), ('stale', 48.86, 2.34, 'tourism.sights')])
+        catalog.save('u09t', {'tourism': [fresh, stale]})
+        self.assertEqual(catalog.load('u09t', ['tourism']), ('tourism', [fresh, stale]))
+
+        # A refetch that no longer returns 'stale' drops it from the cell
+        catalog.save('u09t', {'tourism': [fresh]})
+        self.assertEqual(catalog.load('u09t', ['tourism']), ('tourism', [fresh]))
+        self.assertIsNone(catalog.load('u09t', ['catering']))
+
+        PlaceCoverage.objects.update(fetched_at=timezone.now() - timedelta(hours=2))
+        self.assertIsNone(catalog.load('u09t', ['tourism']))
+
+    def test_index_is_rebuilt_only_when_the_catalog_changes(self):
+        catalog = PlacesCatalog(max_age=3600, refresh_interval=0)
+        catalog.save('u09t', {'tourism': _features([('a', 48.85, 2.35, 'tourism.sights')])})
+        index = catalog.index()
+        self.assertIs(catalog.index(), index)
+        catalog.save('u09w', {'catering': _features([('b', 48.86, 2.36, 'catering.cafe')])})
+        rebuilt = catalog.index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual([_pid(f) for _d, f in rebuilt.nearest(48.86, 2.36, 2)], ['b', 'a'])
+        self.assertEqual(catalog.stats()['index_builds'], 2)
+
+
+class PlacesByCategoryTests(SimpleTestCase):
+    GEO = {'lat': 38.72, 'lon': -9.14, 'place_id': 'city-pid'}
+    BUCKETS = {
+        'sights': {'categories': 'tourism.sights', 'limit': 20, 'radius_m': 5000},
+        'food': {'categories': 'catering', 'limit': 10, 'radius_m': 3000},
+        'broken': {'categories': 'leisure', 'limit': 10, 'radius_m': 3000},
+        'no_place_filter': {'categories': 'entertainment', 'limit': 5, 'radius_m': 2000},
+    }
+
+    def setUp(self):
+        self.calls = []
+        self.users = set()
+        # Every working bucket must be in flight at once to get past the barrier
+        self.barrier = threading.Barrier(3, timeout=5)
+
+    def fake_places(self, lat, lon, categories, api_key, limit, radius_m, place_id=None):
+        self.calls.append((categories, place_id))
+        self.users.add(current_user())
+        if categories == 'leisure':
+            raise RuntimeError('boom')
+        if categories == 'entertainment' and place_id:
+            raise requests.HTTPError('400 place filter rejected')
+        if place_id or categories == 'entertainment':
+            self.barrier.wait()
+        return {'features': [{'properties': {'name': f'{categories}-{i}'}} for i in range(limit)]}
+
+    def test_buckets_run_in_parallel_and_failures_come_back_empty(self):
+        user = 'user:42'
+        with mock.patch('travel.views._geoapify_places', self.fake_places), user_scope(user), \
+                self.assertLogs('travel.views', level='WARNING') as logs:
+            out = views._geoapify_places_by_category(self.GEO, self.BUCKETS, 'key')
+        self.assertTrue(any('broken fetch failed' in line for line in logs.output))
+        self.assertEqual({name: len(features) for name, features in out.items()},
+                         {'sights': 20, 'food': 10, 'broken': 0, 'no_place_filter': 5})
+        self.assertIn(('entertainment', None), self.calls)
+        self.assertEqual(self.users, {user})
+
+    def test_no_buckets(self):
+        self.assertEqual(views._geoapify_places_by_category(self.GEO, {}, 'key'), {})
+
+
+class GeodistanceTests(SimpleTestCase):
+    POINTS = [(38.72, -9.14), (-33.87, 151.21), (0.0, 179.9), (0.0, -179.9), (89.9, 10.0), (38.72, -9.14)]
+
+    def test_matrix_matches_the_scalar_formula(self):
+        origins = self.POINTS[:3]
+        matrix = haversine_matrix(origins, self.POINTS)
+        self.assertEqual(matrix.shape, (3, len(self.POINTS)))
+        for i, (lat1, lon1) in enumerate(origins):
+            for j, (lat2, lon2) in enumerate(self.POINTS):
+                self.assertAlmostEqual(matrix[i, j], km_between(lat1, lon1, lat2, lon2), places=6)
+        self.assertEqual(matrix[0, 5], 0.0)
+        # Across the antimeridian, not around the globe
+        self.assertLess(haversine_matrix([self.POINTS[2]], [self.POINTS[3]])[0, 0], 25)
+
+    def test_distances_from_keeps_missing_points_as_none(self):
+        points = [self.POINTS[1], None, self.POINTS[0], None]
+        distances = distances_from(38.72, -9.14, points)
+        self.assertTrue(np.isnan(distances[1]) and np.isnan(distances[3]))
+        rounded = rounded_km(distances)
+        self.assertEqual(rounded[1::2], [None, None])
+        self.assertEqual(rounded[2], 0.0)
+        self.assertEqual(rounded[0], round(km_between(38.72, -9.14, -33.87, 151.21), 2))
+        self.assertEqual(rounded_km(distances_from(0, 0, [None, None])), [None, None])
+        self.assertEqual(rounded_km(distances_from(0, 0, [])), [])
+
+    def test_feature_distances_for_a_places_response(self):
+        features = [
+            {'properties': {'lat': 38.7139, 'lon': -9.1394}},
+            {'geometry': {'coordinates': [-9.2160, 38.6916]}},
+            {'properties': {'name': 'no coordinates'}},
+        ]
+        distances = views._feature_distances_km({'lat': 38.72, 'lon': -9.14}, features)
+        self.assertEqual(distances[0], round(km_between(38.72, -9.14, 38.7139, -9.1394), 2))
+        self.assertIsInstance(distances[0], float)
+        self.assertIsNone(distances[2])
+        self.assertEqual(distances[1], round(km_between(38.72, -9.14, 38.6916, -9.2160), 2))
+        self.assertEqual(coordinates({'lat': '91', 'lon': 0}), None)
+        self.assertEqual(coordinates({'lat': '45.5', 'lon': 10}), (45.5, 10.0))
@@ -0,0 +1,234 @@
+"""Pooled HTTP access to upstream providers (SerpAPI, Geoapify, Ticketmaster).
+
+Async views and agents send their requests through ``async_get``: one pooled
+``httpx.AsyncClient`` per process, owned by a long-lived event loop in a daemon thread.
+Concurrent searches therefore reuse keep-alive connections instead of holding a worker
+thread per call. A client cannot cross event loops, and under WSGI every async request
+(and every background cache refresh) runs on a short-lived loop of its own, so callers
+hand their request to the client's loop instead of opening a client on theirs.
+
+Synchronous callers use ``http_get``: one ``requests.Session`` per upstream host and
+process, with a connection pool sized per host (``UPSTREAM_POOL_SIZES``, default
+``UPSTREAM_POOL_MAXSIZE``), so retries and fallback attempts reuse an open TCP/TLS
+connection instead of handshaking again. Calls without an explicit timeout use
+``UPSTREAM_CONNECT_TIMEOUT``/``UPSTREAM_READ_TIMEOUT``.
+
+``hedged_get_json`` replaces a serial ladder of fallback queries: it keeps a few
+attempts in flight at once and returns the first acceptable response in priority order.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from .quota import charge
+
+logger = logging.getLogger(__name__)
+
+# Overridable so benchmarks and staging can point at a stub server
+SERPAPI_ENDPOINT = os.getenv("SERPAPI_ENDPOINT", "https://serpapi.com/search")
+
+_client_lock = threading.Lock()
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_client: Optional[httpx.AsyncClient] = None
+_client_pid: Optional[int] = None
+
+
+def _close_client(loop: asyncio.AbstractEventLoop, client: httpx.AsyncClient) -> None:
+    if loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(5)
+        except Exception as e:
+            logger.debug("[upstream] closing the async client failed: %s", e)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def _async_runtime() -> Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]:
+    """The process-wide client and the loop it lives on, started on first use."""
+    global _client_loop, _client, _client_pid
+    with _client_lock:
+        if _client_loop is None or _client_pid != os.getpid():
+            # A forked worker cannot use the parent's loop thread or sockets
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="upstream-http", daemon=True).start()
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+            atexit.register(_close_client, loop, client)
+            _client_loop, _client, _client_pid = loop, client, os.getpid()
+        return _client_loop, _client
+
+
+async def async_get(url: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> httpx.Response:
+    """GET over the pooled process-wide AsyncClient, from any event loop.
+
+    The request runs on the client's loop; cancelling the caller cancels it there too.
+    """
+    loop, client = _async_runtime()
+    kwargs = {"timeout": timeout} if timeout else {}
+    future = asyncio.run_coroutine_threadsafe(client.get(url, params=params, **kwargs), loop)
+    return await asyncio.wrap_future(future)
+
+
+async def serpapi_get_json(params: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Async equivalent of ``GoogleSearch(params).get_dict()``.
+
+    Like the SerpAPI client, error payloads (``{"error": ...}``) are returned, not raised;
+    transport failures and non-JSON responses raise, so they are never mistaken for an
+    empty result. Each call is charged to the SerpAPI budget (see travel.quota).
+    """
+    charge("serpapi")
+    query = {k: v for k, v in params.items() if v is not None}
+    query["output"] = "json"
+    query["source"] = "python"
+    resp = await async_get(SERPAPI_ENDPOINT, params=query, timeout=timeout)
+    if resp.status_code >= 500:
+        resp.raise_for_status()
+    return resp.json()
+
+
+async def hedged_get_json(
+    attempts: Sequence[Tuple[str, float]],
+    accept: Callable[[Any], bool],
+    width: int = 3,
+    deadline: Optional[float] = None,
+    provider: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Run ``(url, timeout)`` attempts, ``width`` at a time, and keep the best acceptable JSON.
+
+    Attempts are listed most-preferred first. A freed slot starts the next attempt, and
+    an accepted response wins only once every earlier attempt has failed or was
+    rejected, so the result is the one a serial ladder would have picked. The others
+    are then cancelled. After ``deadline`` seconds the earliest accepted response so far
+    (if any) is returned. Transport, HTTP and JSON errors count as a rejected attempt.
+    Each started attempt is charged to ``provider``, so ``QuotaExceeded`` propagates.
+
+    Returns ``{index, data, launched, completed, failed, stopped, elapsed_ms}``. ``index``
+    is the winning attempt or None, and ``stopped`` is ``won``, ``exhausted`` or ``deadline``.
+    """
+    started = time.monotonic()
+    width = max(1, int(width))
+    pending: Dict["asyncio.Task[Any]", int] = {}
+    accepted: Dict[int, Any] = {}
+    finished = set()
+    failed = 0
+    launched = 0
+    stopped = "exhausted"
+
+    async def fetch(url: str, timeout: float) -> Any:
+        resp = await async_get(url, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    try:
+        while True:
+            first_open = 0
+            while first_open in finished and first_open not in accepted:
+                first_open += 1
+            if first_open in accepted:
+                stopped = "won"
+                break
+            while launched < len(attempts) and len(pending) < width:
+                if provider:
+                    charge(provider)
+                url, timeout = attempts[launched]
+                pending[asyncio.ensure_future(fetch(url, timeout))] = launched
+                launched += 1
+            if not pending:
+                break
+            remaining = None if deadline is None else deadline - (time.monotonic() - started)
+            if remaining is not None and remaining <= 0:
+                stopped = "deadline"
+                break
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                finished.add(index)
+                try:
+                    data = task.result()
+                except (httpx.HTTPError, ValueError) as e:
+                    logger.info("[hedged] attempt %s failed: %s", index, e)
+                    failed += 1
+                    continue
+                if accept(data):
+                    accepted[index] = data
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    index = min(accepted) if accepted else None
+    return {
+        "index": index,
+        "data": accepted.get(index),
+        "launched": launched,
+        "completed": len(finished),
+        "failed": failed,
+        "stopped": stopped,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_pid: Optional[int] = None
+_sessions_lock = threading.Lock()
+
+
+def _pool_settings(host: str) -> Tuple[int, Tuple[float, float]]:
+    try:
+        from django.conf import settings
+        size = getattr(settings, "UPSTREAM_POOL_SIZES", {}).get(host) or getattr(settings, "UPSTREAM_POOL_MAXSIZE", 10)
+        timeout = (getattr(settings, "UPSTREAM_CONNECT_TIMEOUT", 5.0), getattr(settings, "UPSTREAM_READ_TIMEOUT", 30.0))
+    except Exception:
+        size, timeout = 10, (5.0, 30.0)
+    return max(1, int(size)), timeout
+
+
+def get_session(url: str) -> requests.Session:
+    """Keep-alive session for the host of ``url``, shared by the threads of this process."""
+    global _sessions_pid
+    host = (urlparse(url).hostname or "").lower()
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            # Pooled sockets must not be shared with a forked worker
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        session = _sessions.get(host)
+        if session is None:
+            size, _timeout = _pool_settings(host)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def http_get(url: str, params: Optional[Dict[str, Any]] = None,
+             timeout: Union[None, float, Tuple[float, float]] = None, **kwargs: Any) -> requests.Response:
+    """``requests.get`` over the pooled session of the URL's host."""
+    if timeout is None:
+        timeout = _pool_settings((urlparse(url).hostname or "").lower())[1]
+    return get_session(url).get(url, params=params, timeout=timeout, **kwargs)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Open sessions per host with their pool size (for /api/system/stats/)."""
+    with _sessions_lock:
+        sessions = dict(_sessions) if _sessions_pid == os.getpid() else {}
+    out = {}
+    for host, session in sessions.items():
+        adapter = session.get_adapter("https://")
+        out[host] = {"pool_maxsize": adapter._pool_maxsize, "pools": len(adapter.poolmanager.pools)}
+    return out
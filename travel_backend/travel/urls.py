@@ -19,6 +19,8 @@ urlpatterns = [
     path('trips/<uuid:trip_id>/itinerary/generate/', views.generate_itinerary, name='generate_itinerary'),
     path('trips/<uuid:trip_id>/itinerary/auto/', views.generate_full_itinerary, name='generate_full_itinerary'),
     path('trips/<uuid:trip_id>/budget/estimate/', views.estimate_budget, name='estimate_budget'),
+    path('trips/<uuid:trip_id>/price-watch/', views.trip_price_watch, name='trip_price_watch'),
+    path('trips/<uuid:trip_id>/hotels/proximity/', views.hotels_by_proximity, name='hotels_by_proximity'),
     
     # Trip items endpoints
     path('trips/<uuid:trip_id>/items/', views.TripItemListView.as_view(), name='trip_item_list'),
@@ -47,10 +49,14 @@ urlpatterns = [
 
     # Flight search endpoints
     path('flights/search/', views.search_flights_ai, name='search_flights_ai'),
+    path('flights/search/stream/', views.search_flights_stream, name='search_flights_stream'),
+    path('flights/calendar/', views.flight_fare_calendar, name='flight_fare_calendar'),
+    path('flights/batch/', views.search_flights_batch, name='search_flights_batch'),
     path('flights/airports/', views.get_airport_suggestions, name='get_airport_suggestions'),
 
     # Hotel search endpoints
     path('hotels/search/', views.search_hotels_ai, name='search_hotels_ai'),
+    path('hotels/query/', views.query_hotels, name='query_hotels'),
 
     # Events (Ticketmaster) endpoints
     path('events/search/', views.search_events, name='search_events'),
@@ -59,5 +65,9 @@ urlpatterns = [
     path('places/attractions/', views.search_attractions, name='search_attractions'),
     path('places/food/', views.search_food, name='search_food'),
     path('places/transport/', views.search_transport, name='search_transport'),
+    path('places/nearby/', views.nearby_places, name='nearby_places'),
     path('places/guide/', views.place_ai_guide, name='place_ai_guide'),
+
+    # Operations
+    path('system/stats/', views.system_stats, name='system_stats'),
 ]
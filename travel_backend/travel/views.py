@@ -2,11 +2,12 @@ from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from django.contrib.auth import authenticate, login, logout
 from django.shortcuts import get_object_or_404
-from django.db import transaction
-from .models import UserProfile, Trip, TripItem, TripBudget, TripItinerary, UserPreference, TripPlanningStage, LiveItineraryItem
+from django.db import transaction, connection, IntegrityError
+from django.core.exceptions import ValidationError as DjangoValidationError
+from .models import UserProfile, Trip, TripItem, TripBudget, TripItinerary, UserPreference, TripPlanningStage, LiveItineraryItem, PriceSnapshot, TripDestinationGeo
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer,
     TripSerializer, TripCreateSerializer, TripItemSerializer, TripItemCreateSerializer,
@@ -17,15 +18,28 @@ from .serializers import (
 )
 import os
 import requests
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse
 from datetime import timedelta
 import json
 from openai import OpenAI
 from django.conf import settings
 import time
-from functools import lru_cache
 import logging
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from asgiref.sync import async_to_sync, sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
 from django.test import RequestFactory
+from .async_api import async_api_view, stream_body
+from .cache import get_cache
+from .coalesce import get_single_flight
+from .quota import QuotaExceeded, charge, current_user, metered, user_scope
+from .places_catalog import catalog_stats, get_catalog
+from .geodistance import distances_from, rounded_km
+from .poi_tiles import TileFetchBudgetExceeded, feature_point, get_poi_tiles, poi_tile_stats
+from .upstream import hedged_get_json, http_get
 
 # Authentication Views
 @api_view(['POST'])
@@ -110,6 +124,7 @@ class TripListCreateView(generics.ListCreateAPIView):
     
     def perform_create(self, serializer):
         trip = serializer.save(user=self.request.user)
+        _resolve_trip_geo_in_background(trip.id, _get_geoapify_key(self.request))
         return trip
     
     def create(self, request, *args, **kwargs):
@@ -137,6 +152,12 @@ class TripDetailView(generics.RetrieveUpdateDestroyAPIView):
             return TripUpdateSerializer
         return TripSerializer
 
+    def perform_update(self, serializer):
+        previous = serializer.instance.destination
+        trip = serializer.save()
+        if TripDestinationGeo.normalize(trip.destination) != TripDestinationGeo.normalize(previous):
+            _resolve_trip_geo_in_background(trip.id, _get_geoapify_key(self.request))
+
 # Trip Items Views
 class TripItemListView(generics.ListCreateAPIView):
     """List all items for a trip or create new item"""
@@ -327,6 +348,42 @@ class TripPlanningStageDetailView(generics.RetrieveUpdateDestroyAPIView):
             return TripPlanningStageUpdateSerializer
         return TripPlanningStageSerializer
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def trip_price_watch(request, trip_id):
+    """Latest re-priced value and recent history of the trip's saved flights/hotels (see price_watch.py)"""
+    trip = get_object_or_404(Trip, id=trip_id, user=request.user)
+    try:
+        history_limit = min(max(int(request.GET.get('history', 10)), 1), 100)
+    except (TypeError, ValueError):
+        history_limit = 10
+
+    watched = {}
+    for snap in PriceSnapshot.objects.filter(trip=trip).order_by('item_type', 'item_key', '-checked_at'):
+        entry = watched.get((snap.item_type, snap.item_key))
+        if entry is None:
+            entry = watched[(snap.item_type, snap.item_key)] = {
+                'item_type': snap.item_type,
+                'item_key': snap.item_key,
+                'name': snap.name,
+                'selected_price': float(snap.selected_price),
+                'current_price': float(snap.price) if snap.price is not None else None,
+                'lowest_price': float(snap.lowest_price) if snap.lowest_price is not None else None,
+                'change': float(snap.price - snap.selected_price) if snap.price is not None else None,
+                'available': snap.price is not None,
+                'checked_at': snap.checked_at,
+                'history': [],
+            }
+        if len(entry['history']) < history_limit:
+            entry['history'].append({
+                'price': float(snap.price) if snap.price is not None else None,
+                'lowest_price': float(snap.lowest_price) if snap.lowest_price is not None else None,
+                'checked_at': snap.checked_at,
+            })
+
+    return Response({'success': True, 'data': {'items': list(watched.values())}})
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def trip_planning_progress(request, trip_id):
@@ -527,13 +584,12 @@ def trip_live_itinerary(request, trip_id):
         'overdue_items': items.filter(is_completed=False, is_skipped=False).count()
     })
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def search_flights_ai(request):
+@async_api_view(['POST'])
+@metered('flights.search')
+async def search_flights_ai(request):
     """Search for flights using AI agent with SerpAPI"""
     try:
         from .flight_agent import get_flight_agent
-        import asyncio
         
         # Extract search parameters
         data = request.data
@@ -545,10 +601,11 @@ def search_flights_ai(request):
         cabin_class = data.get('cabin_class', 'economy')
         preferences = data.get('preferences', {})
         country = data.get('country')  # Optional 2-letter country code, e.g., 'US'
+        concurrent = data.get('concurrent')  # Optional; None lets the agent decide
         
         # Validate required fields
         if not all([origin, destination, departure_date]):
-            return Response({
+            return JsonResponse({
                 'success': False,
                 'error': 'Missing required fields: origin, destination, departure_date'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -557,31 +614,22 @@ def search_flights_ai(request):
         try:
             flight_agent = get_flight_agent()
         except ValueError as e:
-            return Response({
+            return JsonResponse({
                 'success': False,
                 'error': f'Configuration error: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        # Run async flight search
-        async def search_flights():
-            return await flight_agent.search_and_recommend_flights(
-                origin=origin,
-                destination=destination,
-                departure_date=departure_date,
-                return_date=return_date,
-                adults=adults,
-                cabin_class=cabin_class,
-                preferences=preferences,
-                country=country
-            )
-        
-        # Execute the async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(search_flights())
-        finally:
-            loop.close()
+        result = await flight_agent.search_and_recommend_flights(
+            origin=origin,
+            destination=destination,
+            departure_date=departure_date,
+            return_date=return_date,
+            adults=adults,
+            cabin_class=cabin_class,
+            preferences=preferences,
+            country=country,
+            concurrent=concurrent,
+        )
         
         if result.get('success'):
             try:
@@ -597,16 +645,227 @@ def search_flights_ai(request):
                 }, '\nsummary=', result.get('data', {}).get('summary'), '\ncount=', result.get('data', {}).get('total_flights'))
             except Exception:
                 pass
-            return Response(result, status=status.HTTP_200_OK)
+            return JsonResponse(result, status=status.HTTP_200_OK)
         else:
             try:
                 print('[search_flights_ai] failure', result)
             except Exception:
                 pass
-            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse(result, status=status.HTTP_400_BAD_REQUEST)
             
+    except QuotaExceeded:
+        raise
     except Exception as e:
-        return Response({
+        return JsonResponse({
+            'success': False,
+            'error': f'Failed to search flights: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view(['POST'])
+@metered('flights.search')
+async def search_flights_stream(request):
+    """Streaming variant of search_flights_ai.
+
+    Emits newline-delimited JSON (default) or Server-Sent Events (``?format=sse`` or
+    ``Accept: text/event-stream``): a ``stage`` event per fallback stage, a ``flights`` event
+    per search that returned flights, then one ``result`` event carrying the same payload
+    search_flights_ai returns. Every event carries ``elapsed_ms`` since the request started.
+    """
+    from .flight_agent import get_flight_agent
+
+    data = request.data
+    origin = data.get('origin')
+    destination = data.get('destination')
+    departure_date = data.get('departure_date')
+    if not all([origin, destination, departure_date]):
+        return JsonResponse({
+            'success': False,
+            'error': 'Missing required fields: origin, destination, departure_date'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        flight_agent = get_flight_agent()
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Configuration error: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    use_sse = (request.query_params.get('format') == 'sse'
+               or 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''))
+    started = time.perf_counter()
+
+    def encode(event: dict) -> str:
+        payload = json.dumps({**event, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}, default=str)
+        if use_sse:
+            return f"event: {event['event']}\ndata: {payload}\n\n"
+        return payload + "\n"
+
+    # The body is streamed after this view returns, outside @metered's user scope
+    user = current_user()
+
+    async def events():
+        first_flights_ms = None
+        try:
+            with user_scope(user):
+                async with aclosing(flight_agent.stream_search_and_recommend_flights(
+                    origin=origin,
+                    destination=destination,
+                    departure_date=departure_date,
+                    return_date=data.get('return_date'),
+                    adults=data.get('adults', 1),
+                    cabin_class=data.get('cabin_class', 'economy'),
+                    preferences=data.get('preferences', {}),
+                    country=data.get('country'),
+                    concurrent=data.get('concurrent'),
+                )) as stream:
+                    async for event in stream:
+                        if event['event'] == 'flights' and first_flights_ms is None:
+                            first_flights_ms = round((time.perf_counter() - started) * 1000, 1)
+                        yield encode(event)
+        except QuotaExceeded as e:
+            yield encode({'event': 'result', 'result': {'success': False, 'error': str(e.detail), 'retry_after': e.wait, 'data': None}})
+        except Exception as e:
+            yield encode({'event': 'result', 'result': {'success': False, 'error': f'Failed to search flights: {str(e)}', 'data': None}})
+        logger.info(
+            "[flights:stream] %s->%s %s first_flights_ms=%s total_ms=%.1f",
+            origin, destination, departure_date, first_flights_ms, (time.perf_counter() - started) * 1000,
+        )
+
+    response = StreamingHttpResponse(
+        stream_body(request, events()),
+        content_type='text/event-stream' if use_sse else 'application/x-ndjson',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@async_api_view(['POST'])
+@metered('flights.calendar', units=lambda request: request.data.get('days', 7))
+async def flight_fare_calendar(request):
+    """Lowest fare per departure date over a window, for "cheapest day" pickers"""
+    try:
+        from .flight_agent import get_flight_agent
+
+        data = request.data
+        origin = data.get('origin')
+        destination = data.get('destination')
+        start_date = data.get('start_date') or data.get('departure_date')
+        try:
+            days = int(data.get('days', 7))
+            trip_length = int(data['trip_length']) if data.get('trip_length') not in (None, '') else None
+            adults = int(data.get('adults', 1))
+        except (TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'days, trip_length and adults must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        cabin_class = data.get('cabin_class', 'economy')
+        country = data.get('country')
+
+        if not all([origin, destination, start_date]):
+            return JsonResponse({
+                'success': False,
+                'error': 'Missing required fields: origin, destination, start_date'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        max_days = settings.FLIGHT_CALENDAR_MAX_DAYS
+        if not 1 <= days <= max_days:
+            return JsonResponse({
+                'success': False,
+                'error': f'days must be between 1 and {max_days}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            flight_agent = get_flight_agent()
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'error': f'Configuration error: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        result = await flight_agent.fare_calendar(
+            origin=origin,
+            destination=destination,
+            start_date=start_date,
+            days=days,
+            trip_length=trip_length,
+            adults=adults,
+            cabin_class=cabin_class,
+            country=country,
+        )
+        status_code = status.HTTP_200_OK if result.get('success') else status.HTTP_400_BAD_REQUEST
+        return JsonResponse(result, status=status_code)
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Failed to build fare calendar: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view(['POST'])
+@metered('flights.batch', units=lambda request: len(request.data.get('legs') or []))
+async def search_flights_batch(request):
+    """Search several legs/routes in one call, e.g. the legs of a multi-city trip"""
+    try:
+        from .flight_agent import get_flight_agent
+
+        data = request.data
+        legs = data.get('legs')
+        max_legs = settings.FLIGHT_BATCH_MAX_LEGS
+        if not isinstance(legs, list) or not 1 <= len(legs) <= max_legs:
+            return JsonResponse({
+                'success': False,
+                'error': f'legs must be a list of 1 to {max_legs} searches'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Top-level values apply to every leg that does not set its own
+        defaults = {key: data[key] for key in ('adults', 'cabin_class', 'country', 'preferences') if key in data}
+        normalized = []
+        for index, leg in enumerate(legs):
+            if not isinstance(leg, dict):
+                return JsonResponse({
+                    'success': False,
+                    'error': f'legs[{index}] must be an object'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            leg = {**defaults, **leg}
+            if not all([leg.get('origin'), leg.get('destination'), leg.get('departure_date')]):
+                return JsonResponse({
+                    'success': False,
+                    'error': f'legs[{index}]: missing required fields: origin, destination, departure_date'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                leg['adults'] = int(leg.get('adults', 1))
+            except (TypeError, ValueError):
+                return JsonResponse({
+                    'success': False,
+                    'error': f'legs[{index}]: adults must be an integer'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            normalized.append(leg)
+
+        try:
+            flight_agent = get_flight_agent()
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'error': f'Configuration error: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        started = time.perf_counter()
+        result = await flight_agent.search_batch(normalized, concurrent=data.get('concurrent'))
+        logger.info(
+            "[flights:batch] legs=%d unique=%d upstream_searches=%d total_ms=%.1f",
+            len(normalized), result['data']['unique_legs'], result['data']['upstream_searches'],
+            (time.perf_counter() - started) * 1000,
+        )
+        return JsonResponse(result, status=status.HTTP_200_OK)
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        return JsonResponse({
             'success': False,
             'error': f'Failed to search flights: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -616,80 +875,30 @@ def search_flights_ai(request):
 @permission_classes([IsAuthenticated])
 def get_airport_suggestions(request):
     """Get airport suggestions for autocomplete"""
-    query = request.GET.get('q', '').upper()
-    
-    # Common airport codes and names
-    airports = [
-        {'code': 'JFK', 'name': 'John F. Kennedy International Airport', 'city': 'New York'},
-        {'code': 'LAX', 'name': 'Los Angeles International Airport', 'city': 'Los Angeles'},
-        {'code': 'ORD', 'name': 'O\'Hare International Airport', 'city': 'Chicago'},
-        {'code': 'DFW', 'name': 'Dallas/Fort Worth International Airport', 'city': 'Dallas'},
-        {'code': 'ATL', 'name': 'Hartsfield-Jackson Atlanta International Airport', 'city': 'Atlanta'},
-        {'code': 'SFO', 'name': 'San Francisco International Airport', 'city': 'San Francisco'},
-        {'code': 'MIA', 'name': 'Miami International Airport', 'city': 'Miami'},
-        {'code': 'SEA', 'name': 'Seattle-Tacoma International Airport', 'city': 'Seattle'},
-        {'code': 'DEN', 'name': 'Denver International Airport', 'city': 'Denver'},
-        {'code': 'BOS', 'name': 'Boston Logan International Airport', 'city': 'Boston'},
-        {'code': 'TYO', 'name': 'Tokyo (All Airports)', 'city': 'Tokyo'},
-        {'code': 'NRT', 'name': 'Narita International Airport', 'city': 'Tokyo'},
-        {'code': 'HND', 'name': 'Haneda Airport', 'city': 'Tokyo'},
-        {'code': 'CDG', 'name': 'Charles de Gaulle Airport', 'city': 'Paris'},
-        {'code': 'LHR', 'name': 'Heathrow Airport', 'city': 'London'},
-        {'code': 'FRA', 'name': 'Frankfurt Airport', 'city': 'Frankfurt'},
-        {'code': 'AMS', 'name': 'Amsterdam Airport Schiphol', 'city': 'Amsterdam'},
-        {'code': 'SIN', 'name': 'Changi Airport', 'city': 'Singapore'},
-        {'code': 'HKG', 'name': 'Hong Kong International Airport', 'city': 'Hong Kong'},
-        {'code': 'SYD', 'name': 'Sydney Airport', 'city': 'Sydney'},
-        {'code': 'MEL', 'name': 'Melbourne Airport', 'city': 'Melbourne'},
-        {'code': 'KIX', 'name': 'Kansai International Airport', 'city': 'Osaka'},
-        {'code': 'ITM', 'name': 'Osaka International (Itami) Airport', 'city': 'Osaka'},
-        {'code': 'DPS', 'name': 'Ngurah Rai International Airport', 'city': 'Bali'},
-        {'code': 'ICN', 'name': 'Incheon International Airport', 'city': 'Seoul'},
-        {'code': 'GMP', 'name': 'Gimpo International Airport', 'city': 'Seoul'},
-        {'code': 'BKK', 'name': 'Suvarnabhumi Airport', 'city': 'Bangkok'},
-        {'code': 'DMK', 'name': 'Don Mueang International Airport', 'city': 'Bangkok'},
-        {'code': 'SGN', 'name': 'Tan Son Nhat International Airport', 'city': 'Ho Chi Minh City'},
-        {'code': 'HAN', 'name': 'Noi Bai International Airport', 'city': 'Hanoi'},
-        {'code': 'KUL', 'name': 'Kuala Lumpur International Airport', 'city': 'Kuala Lumpur'},
-        {'code': 'BOM', 'name': 'Chhatrapati Shivaji Maharaj International Airport', 'city': 'Mumbai'},
-        {'code': 'BLR', 'name': 'Kempegowda International Airport', 'city': 'Bengaluru'},
-        {'code': 'FCO', 'name': 'Leonardo da Vinci–Fiumicino Airport', 'city': 'Rome'},
-        {'code': 'MAD', 'name': 'Adolfo Suárez Madrid–Barajas Airport', 'city': 'Madrid'},
-        {'code': 'BCN', 'name': 'Barcelona–El Prat Airport', 'city': 'Barcelona'},
-        {'code': 'ZRH', 'name': 'Zurich Airport', 'city': 'Zurich'},
-        {'code': 'VIE', 'name': 'Vienna International Airport', 'city': 'Vienna'},
-        {'code': 'PRG', 'name': 'Václav Havel Airport Prague', 'city': 'Prague'},
-        {'code': 'LIS', 'name': 'Humberto Delgado Airport', 'city': 'Lisbon'},
-        {'code': 'ATH', 'name': 'Athens International Airport', 'city': 'Athens'},
-        {'code': 'CAI', 'name': 'Cairo International Airport', 'city': 'Cairo'},
-        {'code': 'EZE', 'name': 'Ministro Pistarini International Airport', 'city': 'Buenos Aires'},
-        {'code': 'GIG', 'name': 'Galeão International Airport', 'city': 'Rio de Janeiro'},
-        {'code': 'CPT', 'name': 'Cape Town International Airport', 'city': 'Cape Town'},
-    ]
-    
-    # Filter airports based on query
-    if query:
-        filtered_airports = [
-            airport for airport in airports
-            if query in airport['code'] or query in airport['name'].upper() or query in airport['city'].upper()
-        ]
-    else:
-        filtered_airports = airports[:10]  # Return first 10 if no query
-    
+    from .airports import get_airport_index
+
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except (TypeError, ValueError):
+        limit = 10
+
+    # Ranked prefix/trigram search over the bundled airport dataset (see travel/airports.py)
+    airports = get_airport_index().search(query, limit=limit)
+
     return Response({
         'success': True,
-        'airports': filtered_airports
+        'airports': airports
     }, status=status.HTTP_200_OK)
 
 
 # Hotel AI endpoints (SerpAPI Google Hotels)
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def search_hotels_ai(request):
+@async_api_view(['POST'])
+@metered('hotels.search')
+async def search_hotels_ai(request):
     """Search for hotels using AI agent with SerpAPI Google Hotels"""
     try:
         from .hotel_agent import get_hotel_agent
-        import asyncio
 
         data = request.data
         destination = data.get('destination')
@@ -700,9 +909,20 @@ def search_hotels_ai(request):
         country = data.get('country', 'us')
         language = data.get('language', 'en')
         budget_max = data.get('budget_max')
+        # Skip the cached property list (e.g. an explicit "refresh prices" action)
+        bypass_cache = data.get('bypass_cache') in (True, 1, '1', 'true', 'True')
+        # Optional: follow result pages until this many hotels pass budget_max
+        try:
+            min_results = int(data['min_results']) if data.get('min_results') not in (None, '') else None
+            max_pages = int(data['max_pages']) if data.get('max_pages') not in (None, '') else None
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'error': 'min_results and max_pages must be integers'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        if max_pages is not None:
+            max_pages = min(max(max_pages, 1), settings.HOTEL_MAX_PAGES)
 
         if not all([destination, check_in_date, check_out_date]):
-            return Response({
+            return JsonResponse({
                 'success': False,
                 'error': 'Missing required fields: destination, check_in_date, check_out_date'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -711,26 +931,21 @@ def search_hotels_ai(request):
             hotel_agent = get_hotel_agent()
             print(f"Hotel agent created. User={request.user.username} dest={destination} dates={check_in_date}->{check_out_date} adults={adults} budget_max={budget_max}")
         except ValueError as e:
-            return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        async def do_search():
-            return await hotel_agent.search_and_recommend_hotels(
-                destination=destination,
-                check_in_date=check_in_date,
-                check_out_date=check_out_date,
-                adults=adults,
-                currency=currency,
-                country=country,
-                language=language,
-                budget_max=budget_max,
-            )
-
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(do_search())
-        finally:
-            loop.close()
+            return JsonResponse({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        result = await hotel_agent.search_and_recommend_hotels(
+            destination=destination,
+            check_in_date=check_in_date,
+            check_out_date=check_out_date,
+            adults=adults,
+            currency=currency,
+            country=country,
+            language=language,
+            budget_max=budget_max,
+            bypass_cache=bypass_cache,
+            min_results=min_results,
+            max_pages=max_pages,
+        )
 
         # Debug print of returned data shape and sample
         try:
@@ -742,9 +957,186 @@ def search_hotels_ai(request):
             pass
 
         status_code = status.HTTP_200_OK if result.get('success') else status.HTTP_400_BAD_REQUEST
-        return Response(result, status=status_code)
+        return JsonResponse(result, status=status_code)
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Failed to search hotels: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _as_list(value):
+    """JSON list or comma-separated string -> list of non-empty strings"""
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+@async_api_view(['POST'])
+@metered('hotels.search')
+async def query_hotels(request):
+    """Filter, rank and page the hotels of a stay server-side.
+
+    Body: the stay fields of /hotels/search/ plus optional filters amenities[] (all
+    required), price_min, price_max, min_rating, price_categories[], sort
+    (value|price|rating), page, page_size. Served from the hotel search cache.
+    """
+    try:
+        from .hotel_agent import get_hotel_agent
+        from .hotel_index import PRICE_CATEGORIES, SORTS
+
+        data = request.data
+        destination = data.get('destination')
+        check_in_date = data.get('check_in_date')
+        check_out_date = data.get('check_out_date')
+        if not all([destination, check_in_date, check_out_date]):
+            return JsonResponse({
+                'success': False,
+                'error': 'Missing required fields: destination, check_in_date, check_out_date'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        def number(name):
+            value = data.get(name)
+            return float(value) if value not in (None, '') else None
+
+        try:
+            adults = int(data.get('adults', 1))
+            price_min, price_max, min_rating = number('price_min'), number('price_max'), number('min_rating')
+            page = max(int(data.get('page', 1)), 1)
+            page_size = min(max(int(data.get('page_size', 20)), 1), settings.HOTEL_QUERY_MAX_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'adults, price_min, price_max, min_rating, page and page_size must be numbers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        sort = data.get('sort') or 'value'
+        categories = _as_list(data.get('price_categories'))
+        if sort not in SORTS or any(c not in PRICE_CATEGORIES for c in categories):
+            return JsonResponse({
+                'success': False,
+                'error': f"sort must be one of {', '.join(SORTS)}; price_categories of {', '.join(PRICE_CATEGORIES)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            hotel_agent = get_hotel_agent()
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        result = await hotel_agent.query_hotels(
+            destination=destination,
+            check_in_date=check_in_date,
+            check_out_date=check_out_date,
+            adults=adults,
+            currency=data.get('currency', 'USD'),
+            country=data.get('country', 'us'),
+            language=data.get('language', 'en'),
+            filters={
+                'amenities': _as_list(data.get('amenities')),
+                'price_min': price_min,
+                'price_max': price_max,
+                'min_rating': min_rating,
+                'categories': categories,
+                'sort': sort,
+                'offset': (page - 1) * page_size,
+                'limit': page_size,
+            },
+        )
+        if result.get('success'):
+            result['data']['page'] = page
+            result['data']['page_size'] = page_size
+        status_code = status.HTTP_200_OK if result.get('success') else status.HTTP_400_BAD_REQUEST
+        return JsonResponse(result, status=status_code)
+    except QuotaExceeded:
+        raise
     except Exception as e:
-        return Response({'success': False, 'error': f'Failed to search hotels: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({'success': False, 'error': f'Failed to query hotels: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _trip_stay_and_pois(trip_id, user):
+    """Stay fields of a trip plus its selected attractions/restaurants (stage selections and TripItems)"""
+    trip = Trip.objects.filter(id=trip_id, user=user).first()
+    if trip is None:
+        return None, []
+    pois = []
+    for stage in TripPlanningStage.objects.filter(trip=trip, stage_type__in=['attractions', 'food']):
+        for item in stage.selected_items or []:
+            if isinstance(item, dict):
+                pois.append({'name': item.get('name'), 'lat': item.get('lat'), 'lon': item.get('lon'), 'category': stage.stage_type})
+    for item in TripItem.objects.filter(trip=trip, is_selected=True, item_type__in=['attraction', 'restaurant']):
+        meta = item.metadata or {}
+        pois.append({'name': item.name, 'lat': meta.get('lat'), 'lon': meta.get('lon'), 'category': item.item_type})
+    stay = {
+        'destination': trip.destination,
+        'check_in_date': trip.start_date.isoformat(),
+        'check_out_date': trip.end_date.isoformat(),
+        'adults': trip.travelers,
+    }
+    return stay, pois
+
+
+@async_api_view(['POST'])
+@metered('hotels.search')
+async def hotels_by_proximity(request, trip_id):
+    """Rank the trip's candidate hotels by aggregate distance to its selected attractions and restaurants.
+
+    Body (all optional): check_in_date, check_out_date, adults, currency, country, language,
+    budget_max, aggregate (sum|mean|max), limit, pois[] ({lat, lon, name}) to rank against
+    instead of the saved selections.
+    """
+    try:
+        from .hotel_agent import get_hotel_agent
+        from .geodistance import AGGREGATES, coordinates
+
+        stay, saved_pois = await sync_to_async(_trip_stay_and_pois)(trip_id, request.user)
+        if stay is None:
+            return JsonResponse({'success': False, 'error': 'Trip not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        data = request.data
+        pois = data.get('pois') if isinstance(data.get('pois'), list) else saved_pois
+        pois = [p for p in pois if isinstance(p, dict) and coordinates(p) is not None]
+        if not pois:
+            return JsonResponse({
+                'success': False,
+                'error': 'No selected attractions or restaurants with coordinates to rank against'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        aggregate = data.get('aggregate') or 'sum'
+        if aggregate not in AGGREGATES:
+            return JsonResponse({'success': False, 'error': f"aggregate must be one of {', '.join(AGGREGATES)}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+        try:
+            adults = int(data.get('adults') or stay['adults'] or 1)
+            limit = min(max(int(data.get('limit', 20)), 1), settings.HOTEL_QUERY_MAX_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'error': 'adults and limit must be integers'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            hotel_agent = get_hotel_agent()
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        result = await hotel_agent.rank_hotels_by_proximity(
+            destination=stay['destination'],
+            check_in_date=data.get('check_in_date') or stay['check_in_date'],
+            check_out_date=data.get('check_out_date') or stay['check_out_date'],
+            pois=pois,
+            adults=adults,
+            currency=data.get('currency', 'USD'),
+            country=data.get('country', 'us'),
+            language=data.get('language', 'en'),
+            budget_max=data.get('budget_max'),
+            aggregate=aggregate,
+            limit=limit,
+        )
+        if result.get('success'):
+            result['data']['pois'] = len(pois)
+        status_code = status.HTTP_200_OK if result.get('success') else status.HTTP_400_BAD_REQUEST
+        return JsonResponse(result, status=status_code)
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Failed to rank hotels: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @api_view(['GET'])
@@ -806,7 +1198,7 @@ def search_events(request):
                 params['countryCode'] = cc
 
         url = 'https://app.ticketmaster.com/discovery/v2/events.json'
-        r = requests.get(url, params=params, timeout=20)
+        r = http_get(url, params=params)
         try:
             r.raise_for_status()
         except requests.HTTPError as http_err:
@@ -878,13 +1270,25 @@ def _get_geoapify_key(request) -> str:
     return env_key or body_key or query_key or '0c2d35c01c5c4a17a1ec30454a231ef4'
 
 
-def _http_get_json(url: str, timeout: tuple[int, int] = (8, 30), max_retries: int = 2, backoff: float = 0.75):
+# Host -> provider name in settings.UPSTREAM_QUOTAS
+_UPSTREAM_PROVIDERS = {
+    'api.geoapify.com': 'geoapify',
+    'serpapi.com': 'serpapi',
+}
+
+
+def _http_get_json(url: str, timeout: tuple[float, float] | None = None, max_retries: int = 2, backoff: float = 0.75):
     """HTTP GET with retries/backoff that returns parsed JSON or raises.
-    timeout: (connect_timeout, read_timeout)
+    timeout: (connect_timeout, read_timeout); defaults to UPSTREAM_CONNECT_TIMEOUT/UPSTREAM_READ_TIMEOUT
+    Attempts reuse the host's pooled keep-alive connections (see travel.upstream).
+    Each attempt is charged to the provider's call budget and may raise QuotaExceeded.
     """
+    provider = _UPSTREAM_PROVIDERS.get(urlparse(url).hostname or '')
     for attempt in range(max_retries + 1):
+        if provider:
+            charge(provider)
         try:
-            r = requests.get(url, timeout=timeout)
+            r = http_get(url, timeout=timeout)
             r.raise_for_status()
             return r.json()
         except (requests.ReadTimeout, requests.Timeout) as e:
@@ -908,51 +1312,118 @@ def _http_get_json(url: str, timeout: tuple[int, int] = (8, 30), max_retries: in
             logging.error("[net] error final on %s: %s", url, e)
             raise
 
-@lru_cache(maxsize=128)
+def _cached_geo_lookup(kind: str, destination: str, fetch, default=None):
+    """Serve a Geoapify lookup for ``destination`` from the shared 'geocode' cache.
+
+    Found results live GEOCODE_CACHE_TTL seconds and empty ones GEOCODE_NEGATIVE_TTL.
+    Failures (timeouts, HTTP errors) return ``default`` without being cached, so the
+    next request tries again. Concurrent misses share one upstream call.
+    """
+    dest = ' '.join((destination or '').split())
+    if not dest:
+        return default
+    cache = get_cache('geocode', ttl=settings.GEOCODE_CACHE_TTL)
+    group = get_single_flight(f'geoapify-{kind}')
+    parts = (kind, dest.lower())
+    try:
+        value, _meta = cache.get_or_fetch(
+            cache.make_key(*parts),
+            lambda: group.do(group.make_key(*parts), lambda: fetch(dest)),
+            ttl_for=lambda value: None if value else settings.GEOCODE_NEGATIVE_TTL,
+        )
+        return value
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        logger.warning("[geocode] %s lookup failed for %r: %s", kind, dest, e)
+        return default
+
+
 def _geoapify_geocode(destination: str, api_key: str):
+    return _cached_geo_lookup('geocode', destination, lambda dest: _geoapify_geocode_fetch(dest, api_key))
+
+
+def _geoapify_geocode_fetch(destination: str, api_key: str):
+    """Uncached geocode: None when Geoapify finds nothing; raises on transport/HTTP errors."""
     def _do_request(params: dict):
         url = f'https://api.geoapify.com/v1/geocode/search?{urlencode(params)}'
         return _http_get_json(url, timeout=(8, 30), max_retries=2)
 
-    try:
-        dest = (destination or '').strip()
-        if not dest:
-            return None
-        # Attempt 1: full text
-        params = {'text': dest, 'apiKey': api_key, 'limit': 1, 'lang': 'en'}
-        data = _do_request(params)
+    dest = (destination or '').strip()
+    if not dest:
+        return None
+    # Attempt 1: full text
+    params = {'text': dest, 'apiKey': api_key, 'limit': 1, 'lang': 'en'}
+    data = _do_request(params)
+    features = data.get('features', [])
+    # Attempt 2: first token (likely city) with type hint
+    if not features:
+        try:
+            city_token = dest.split(',')[0].strip()
+        except Exception:
+            city_token = dest
+        params2 = {'text': city_token, 'type': 'city', 'apiKey': api_key, 'limit': 1, 'lang': 'en'}
+        data = _do_request(params2)
         features = data.get('features', [])
-        # Attempt 2: first token (likely city) with type hint
-        if not features:
-            try:
-                city_token = dest.split(',')[0].strip()
-            except Exception:
-                city_token = dest
-            params2 = {'text': city_token, 'type': 'city', 'apiKey': api_key, 'limit': 1, 'lang': 'en'}
-            data = _do_request(params2)
-            features = data.get('features', [])
-        if not features:
-            return None
-        feat = features[0]
-        geom = feat.get('geometry', {})
-        coords = geom.get('coordinates', [])
-        if not coords or len(coords) < 2:
-            return None
-        lon, lat = float(coords[0]), float(coords[1])
-        props = feat.get('properties', {})
-        return {
-            'lat': lat,
-            'lon': lon,
-            'city': props.get('city') or props.get('town') or props.get('village'),
-            'country': props.get('country_code'),
-            'formatted': props.get('formatted'),
-            'place_id': props.get('place_id'),
+    if not features:
+        return None
+    feat = features[0]
+    geom = feat.get('geometry', {})
+    coords = geom.get('coordinates', [])
+    if not coords or len(coords) < 2:
+        return None
+    lon, lat = float(coords[0]), float(coords[1])
+    props = feat.get('properties', {})
+    return {
+        'lat': lat,
+        'lon': lon,
+        'city': props.get('city') or props.get('town') or props.get('village'),
+        'country': props.get('country_code'),
+        'formatted': props.get('formatted'),
+        'place_id': props.get('place_id'),
+    }
+
+
+def _geoapify_tiled_places(lat: float, lon: float, categories: str, api_key: str, limit: int = 20, radius_m: int = 15000):
+    """Nearest ``limit`` places within ``radius_m`` assembled from the geohash tile cache.
+    None when tiling is disabled or the query needs too many uncached tiles.
+    """
+    tiles = get_poi_tiles()
+    if tiles is None:
+        return None
+
+    def fetch_tile(box, tile_categories, tile_limit):
+        lat_min, lon_min, lat_max, lon_max = box
+        params = {
+            'categories': ','.join(tile_categories),
+            'filter': f'rect:{lon_min},{lat_min},{lon_max},{lat_max}',
+            'bias': f'proximity:{(lon_min + lon_max) / 2},{(lat_min + lat_max) / 2}',
+            'limit': tile_limit,
+            'lang': 'en',
+            'apiKey': api_key,
         }
-    except Exception:
+        url = f'https://api.geoapify.com/v2/places?{urlencode(params)}'
+        return _http_get_json(url, timeout=(8, 35), max_retries=2)
+
+    try:
+        return tiles.query(float(lat), float(lon), categories, radius_m, limit, fetch_tile)
+    except TileFetchBudgetExceeded as e:
+        logger.info("[poi-tiles] %s around (%s, %s) for %s; querying Geoapify directly", e, lat, lon, categories)
+        return None
+    except requests.RequestException as e:
+        logger.warning("[poi-tiles] tile fetch failed for %s: %s; querying Geoapify directly", categories, e)
         return None
 
 
 def _geoapify_places(lat: float, lon: float, categories: str, api_key: str, limit: int = 20, radius_m: int = 15000, name: str | None = None, place_id: str | None = None):
+    """Geoapify places, served from the tile cache when possible.
+    A place filter is answered as the nearest places within radius_m of (lat, lon);
+    name searches always go to Geoapify.
+    """
+    if not name:
+        raw = _geoapify_tiled_places(lat, lon, categories, api_key, limit=limit, radius_m=radius_m)
+        if raw is not None:
+            return raw
     params = {
         'categories': categories,
         'filter': f'place:{place_id}' if place_id else f'circle:{lon},{lat},{radius_m}',
@@ -964,26 +1435,58 @@ def _geoapify_places(lat: float, lon: float, categories: str, api_key: str, limi
     if name:
         params['name'] = name
     url = f'https://api.geoapify.com/v2/places?{urlencode(params)}'
-    return _http_get_json(url, timeout=(8, 35), max_retries=2)
+    group = get_single_flight('geoapify-places')
+    return group.do(group.make_key(url), lambda: _http_get_json(url, timeout=(8, 35), max_retries=2))
 
 
-def _km_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    from math import radians, sin, cos, atan2, sqrt
-    R = 6371.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
+def _geoapify_places_by_category(geo: dict, buckets: dict, api_key: str) -> dict:
+    """Fetch several category buckets around ``geo`` in one wall-clock round trip.
 
+    ``buckets`` maps a name to ``{'categories', 'limit', 'radius_m'}``; returns
+    ``{name: features}``. Buckets are fetched in parallel, each through
+    _geoapify_places (tile cache first, place filter with a circle fallback). A bucket
+    that fails comes back empty.
+    """
+    user = current_user()
 
-@lru_cache(maxsize=256)
-def _geoapify_city_place_id(destination: str, api_key: str) -> str | None:
+    def fetch(name: str, spec: dict) -> list:
+        try:
+            with user_scope(user):
+                try:
+                    raw = _geoapify_places(geo['lat'], geo['lon'], spec['categories'], api_key, limit=spec['limit'], radius_m=spec['radius_m'], place_id=geo.get('place_id'))
+                except requests.HTTPError as http_err:
+                    logger.warning("[places] %s: HTTPError (place filter), falling back to circle: %s", name, http_err)
+                    raw = _geoapify_places(geo['lat'], geo['lon'], spec['categories'], api_key, limit=spec['limit'], radius_m=spec['radius_m'], place_id=None)
+            return raw.get('features', []) or []
+        except Exception as e:
+            logger.exception("[places] %s fetch failed: %s", name, e)
+            return []
+        finally:
+            # Worker threads hold their own connection (tile catalog reads/writes)
+            connection.close()
+
+    if not buckets:
+        return {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(buckets), thread_name_prefix='geoapify-places') as pool:
+        futures = {name: pool.submit(fetch, name, spec) for name, spec in buckets.items()}
+        out = {name: future.result() for name, future in futures.items()}
+    logger.info("[places] %s in %.0f ms", {name: len(features) for name, features in out.items()}, (time.perf_counter() - started) * 1000)
+    return out
+
+
+def _feature_distances_km(geo: dict, features: list) -> list:
+    """Distance in km (2 decimals) from the search centre to each feature, None without coordinates"""
+    return rounded_km(distances_from(geo['lat'], geo['lon'], [feature_point(f) for f in features]))
+
+
+def _geoapify_city_place_id(destination: str, api_key: str, default=None) -> str | None:
     """Get a city-level place_id for use with filter=place:... specifically.
     Uses Geoapify geocoding with type=city to avoid address-level ids.
+    Returns ``default`` when the lookup fails.
     """
-    try:
-        params = {'text': destination, 'type': 'city', 'limit': 1, 'apiKey': api_key}
+    def fetch(dest: str) -> str | None:
+        params = {'text': dest, 'type': 'city', 'limit': 1, 'apiKey': api_key}
         url = f'https://api.geoapify.com/v1/geocode/search?{urlencode(params)}'
         data = _http_get_json(url, timeout=(8, 25), max_retries=1)
         features = data.get('features', [])
@@ -991,8 +1494,8 @@ def _geoapify_city_place_id(destination: str, api_key: str) -> str | None:
             return None
         props = features[0].get('properties', {})
         return props.get('place_id')
-    except Exception:
-        return None
+
+    return _cached_geo_lookup('city-place-id', destination, fetch, default=default)
 
 
 def _extract_english_name(props: dict) -> str | None:
@@ -1020,12 +1523,13 @@ def _extract_english_name(props: dict) -> str | None:
     return None
 
 
-@lru_cache(maxsize=256)
-def _geoapify_boundary_city_place_ids(destination: str, api_key: str) -> list[str]:
-    """Use Boundaries API to fetch city-level place_ids that can be used in filter=place:... queries."""
-    try:
+def _geoapify_boundary_city_place_ids(destination: str, api_key: str, default=()) -> list[str]:
+    """Use Boundaries API to fetch city-level place_ids that can be used in filter=place:... queries.
+    Returns ``default`` (an empty list unless given) when the lookup fails.
+    """
+    def fetch(dest: str) -> list[str]:
         params = {
-            'name': destination,
+            'name': dest,
             'part': 'city',
             'limit': 5,
             'format': 'geojson',
@@ -1040,8 +1544,87 @@ def _geoapify_boundary_city_place_ids(destination: str, api_key: str) -> list[st
             if pid:
                 pids.append(pid)
         return pids
-    except Exception:
-        return []
+
+    return _cached_geo_lookup('boundary-place-ids', destination, fetch, default=[] if default == () else default)
+
+
+_LOOKUP_FAILED = object()
+
+
+def _resolve_trip_geo(trip, api_key: str):
+    """Geocode the trip destination (plus city/boundary place ids) and store it on the trip.
+    Returns the TripDestinationGeo, or None when the destination could not be geocoded.
+    A place-id lookup that failed (timeout, HTTP error) is stored as NULL, so _trip_geo
+    retries it instead of keeping the failure.
+    """
+    geo = _geoapify_geocode(trip.destination, api_key)
+    if not geo:
+        return None
+    city_place_id = _geoapify_city_place_id(trip.destination, api_key, default=_LOOKUP_FAILED)
+    boundary_place_ids = _geoapify_boundary_city_place_ids(trip.destination, api_key, default=_LOOKUP_FAILED)
+    values = {
+        'destination': trip.destination,
+        'lat': geo['lat'],
+        'lon': geo['lon'],
+        'city': geo.get('city') or '',
+        'country_code': geo.get('country') or '',
+        'formatted': (geo.get('formatted') or '')[:300],
+        'place_id': geo.get('place_id') or '',
+        'city_place_id': None if city_place_id is _LOOKUP_FAILED else (city_place_id or ''),
+        'boundary_place_ids': None if boundary_place_ids is _LOOKUP_FAILED else boundary_place_ids,
+    }
+    try:
+        stored, _ = TripDestinationGeo.objects.update_or_create(trip=trip, defaults=values)
+    except IntegrityError:
+        # Resolved concurrently by another request
+        stored = TripDestinationGeo.objects.filter(trip=trip).first()
+    return stored
+
+
+def _trip_geo(trip, api_key: str):
+    """Stored geo context of a trip; Geoapify is only called when it is missing, incomplete or the destination changed"""
+    stored = TripDestinationGeo.objects.filter(trip=trip).first()
+    if stored is not None and stored.is_current(trip):
+        if stored.is_resolved():
+            return stored
+        # A place-id lookup failed last time: try again, keeping the stored coordinates if geocoding fails now
+        return _resolve_trip_geo(trip, api_key) or stored
+    return _resolve_trip_geo(trip, api_key)
+
+
+def _resolve_trip_geo_in_background(trip_id, api_key: str) -> None:
+    """Resolve a new/changed trip destination after the transaction commits, off the request path"""
+    def run():
+        try:
+            trip = Trip.objects.filter(id=trip_id).first()
+            if trip is not None:
+                _trip_geo(trip, api_key)
+        except Exception as e:
+            logger.warning("[trip-geo] background resolve failed for trip_id=%s: %s", trip_id, e)
+        finally:
+            connection.close()
+
+    transaction.on_commit(lambda: threading.Thread(target=run, name=f"trip-geo-{trip_id}", daemon=True).start())
+
+
+def _request_trip(request):
+    """Trip named by an optional trip_id in the body, if it belongs to the user"""
+    trip_id = request.data.get('trip_id') if hasattr(request, 'data') else None
+    if not trip_id:
+        return None
+    try:
+        return Trip.objects.filter(id=trip_id, user=request.user).first()
+    except (ValueError, DjangoValidationError):
+        return None
+
+
+def _destination_geo(trip, destination: str, api_key: str):
+    """(geo, stored TripDestinationGeo or None): the trip's stored values when destination is the trip's own"""
+    if trip is not None and TripDestinationGeo.normalize(destination) == TripDestinationGeo.normalize(trip.destination):
+        stored = _trip_geo(trip, api_key)
+        if stored is not None:
+            return stored.as_geo(), stored
+    return _geoapify_geocode(destination, api_key), None
 
 
 def _best_time_for_category(category: str) -> str:
@@ -1070,20 +1653,22 @@ def _duration_estimate_for_category(category: str) -> str:
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@metered('places.search')
 def search_attractions(request):
     """Search attractions (tourism) using Geoapify Places API.
-    Body: destination (string), limit?, radius_meters?, name?
+    Body: destination (string, defaults to the trip's), trip_id?, limit?, radius_meters?, name?
     """
     try:
         api_key = _get_geoapify_key(request)
-        destination = (request.data.get('destination') or '').strip()
+        trip = _request_trip(request)
+        destination = (request.data.get('destination') or (trip.destination if trip else '')).strip()
         limit = int(request.data.get('limit', 24))
         radius_m = int(request.data.get('radius_meters', 20000))
         name_filter = request.data.get('name')
         if not destination:
             return Response({'success': False, 'error': 'destination is required'}, status=400)
 
-        geo = _geoapify_geocode(destination, api_key)
+        geo, stored_geo = _destination_geo(trip, destination, api_key)
         if not geo:
             return Response({'success': False, 'error': f"Failed to geocode destination: '{destination}'"}, status=400)
 
@@ -1102,7 +1687,8 @@ def search_attractions(request):
             )
         features = raw.get('features', [])
         items = []
-        for f in features:
+        distances = _feature_distances_km(geo, features)
+        for f, distance_km in zip(features, distances):
             props = f.get('properties', {})
             fid = props.get('place_id') or props.get('osm_id') or props.get('gid') or props.get('datasource', {}).get('raw', {}).get('id')
             name = props.get('name') or props.get('address_line1') or 'Unknown'
@@ -1110,12 +1696,6 @@ def search_attractions(request):
             primary_cat = cats[0] if cats else (props.get('category') or 'tourism.attraction')
             lat = props.get('lat') or (f.get('geometry', {}).get('coordinates', [None, None])[1])
             lon = props.get('lon') or (f.get('geometry', {}).get('coordinates', [None, None])[0])
-            distance_km = None
-            try:
-                if lat and lon:
-                    distance_km = _km_distance(geo['lat'], geo['lon'], float(lat), float(lon))
-            except Exception:
-                distance_km = None
             best_time = _best_time_for_category(primary_cat)
             duration = _duration_estimate_for_category(primary_cat)
             items.append({
@@ -1125,7 +1705,7 @@ def search_attractions(request):
                 'rating': None,
                 'price': 0,
                 'duration': duration,
-                'distance_km': round(distance_km, 2) if distance_km is not None else None,
+                'distance_km': distance_km,
                 'description': props.get('address_line2') or props.get('formatted') or '',
                 'bestTime': best_time,
                 'address': props.get('formatted'),
@@ -1136,26 +1716,30 @@ def search_attractions(request):
         return Response({'success': True, 'data': {'items': items, 'total': len(items), 'center': geo}})
     except requests.HTTPError as e:
         return Response({'success': False, 'error': f'Geoapify HTTP error: {str(e)}'}, status=502)
+    except QuotaExceeded:
+        raise
     except Exception as e:
         return Response({'success': False, 'error': f'Failed to search attractions: {str(e)}'}, status=500)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@metered('places.search')
 def search_food(request):
     """Search restaurants/food using Geoapify (catering.* categories).
-    Body: destination (string), limit?, radius_meters?, name?
+    Body: destination (string, defaults to the trip's), trip_id?, limit?, radius_meters?, name?
     """
     try:
         api_key = _get_geoapify_key(request)
-        destination = (request.data.get('destination') or '').strip()
+        trip = _request_trip(request)
+        destination = (request.data.get('destination') or (trip.destination if trip else '')).strip()
         limit = int(request.data.get('limit', 24))
         radius_m = int(request.data.get('radius_meters', 15000))
         name_filter = request.data.get('name')
         if not destination:
             return Response({'success': False, 'error': 'destination is required'}, status=400)
 
-        geo = _geoapify_geocode(destination, api_key)
+        geo, stored_geo = _destination_geo(trip, destination, api_key)
         if not geo:
             return Response({'success': False, 'error': f"Failed to geocode destination: '{destination}'"}, status=400)
 
@@ -1179,7 +1763,8 @@ def search_food(request):
             )
         features = raw.get('features', [])
         items = []
-        for f in features:
+        distances = _feature_distances_km(geo, features)
+        for f, distance_km in zip(features, distances):
             props = f.get('properties', {})
             fid = props.get('place_id') or props.get('osm_id') or props.get('gid')
             name = props.get('name') or props.get('address_line1') or 'Unknown'
@@ -1187,12 +1772,6 @@ def search_food(request):
             primary_cat = cats[0] if cats else (props.get('category') or 'catering.restaurant')
             lat = props.get('lat') or (f.get('geometry', {}).get('coordinates', [None, None])[1])
             lon = props.get('lon') or (f.get('geometry', {}).get('coordinates', [None, None])[0])
-            distance_km = None
-            try:
-                if lat and lon:
-                    distance_km = _km_distance(geo['lat'], geo['lon'], float(lat), float(lon))
-            except Exception:
-                distance_km = None
             price_level = props.get('housenumber')  # Not provided; placeholder kept None
             items.append({
                 'id': str(fid),
@@ -1200,7 +1779,7 @@ def search_food(request):
                 'cuisine': primary_cat,
                 'priceRange': None,
                 'rating': None,
-                'distance_km': round(distance_km, 2) if distance_km is not None else None,
+                'distance_km': distance_km,
                 'description': props.get('address_line2') or props.get('formatted') or '',
                 'specialDish': None,
                 'averageMeal': None,
@@ -1212,35 +1791,61 @@ def search_food(request):
         return Response({'success': True, 'data': {'items': items, 'total': len(items), 'center': geo}})
     except requests.HTTPError as e:
         return Response({'success': False, 'error': f'Geoapify HTTP error: {str(e)}'}, status=502)
+    except QuotaExceeded:
+        raise
     except Exception as e:
         return Response({'success': False, 'error': f'Failed to search food: {str(e)}'}, status=500)
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def search_transport(request):
+def _transport_context(request):
+    """Blocking part of search_transport: trip lookup, geocoding and place ids"""
+    api_key = _get_geoapify_key(request)
+    trip = _request_trip(request)
+    destination = (request.data.get('destination') or (trip.destination if trip else '')).strip()
+    if not destination:
+        return api_key, destination, None, None, []
+    geo, stored_geo = _destination_geo(trip, destination, api_key)
+    if not geo:
+        return api_key, destination, None, None, []
+    if stored_geo is not None:
+        return api_key, destination, geo, stored_geo.city_place_id or None, list(stored_geo.boundary_place_ids or [])
+    return (api_key, destination, geo, _geoapify_city_place_id(destination, api_key),
+            _geoapify_boundary_city_place_ids(destination, api_key))
+
+
+def _transport_spec_label(spec: dict) -> dict:
+    label = {'mode': spec['mode'], 'categories': spec['categories'], 'limit': int(spec['limit'])}
+    if spec['mode'] == 'place':
+        label['place_id'] = spec['place_id']
+    else:
+        label['radius'] = int(spec['radius'])
+    return label
+
+
+@async_api_view(['POST'])
+@metered('places.search')
+async def search_transport(request):
     """Search transport-related places (public_transport.*, bicycle, car rental) using Geoapify.
-    Body: destination (string), limit?, radius_meters?
+    Body: destination (string, defaults to the trip's), trip_id?, limit?, radius_meters?, place_id?
+
+    The fallback queries run hedged: TRANSPORT_HEDGE_WIDTH of them at a time, the first
+    non-empty one in priority order wins, and the whole search stops after
+    TRANSPORT_DEADLINE seconds. The response reports the winning query under ``attempt``.
     """
     try:
-        api_key = _get_geoapify_key(request)
-        destination = (request.data.get('destination') or '').strip()
         limit = int(request.data.get('limit', 20))
         # Use smaller default radius as per working sample
         radius_m = int(request.data.get('radius_meters', 5000))
+        api_key, destination, geo, city_pid, boundary_pids = await sync_to_async(_transport_context)(request)
         if not destination:
-            return Response({'success': False, 'error': 'destination is required'}, status=400)
-
-        geo = _geoapify_geocode(destination, api_key)
+            return JsonResponse({'success': False, 'error': 'destination is required'}, status=400)
         if not geo:
-            return Response({'success': False, 'error': f"Failed to geocode destination: '{destination}'"}, status=400)
+            return JsonResponse({'success': False, 'error': f"Failed to geocode destination: '{destination}'"}, status=400)
 
         # Try multiple attempts, preferring place filter first, then circle fallbacks
         # Allow client to pass a known-good city place_id
         client_pid = request.data.get('place_id') if hasattr(request, 'data') else None
         place_id_geo = geo.get('place_id')
-        city_pid = _geoapify_city_place_id(destination, api_key)
-        boundary_pids = _geoapify_boundary_city_place_ids(destination, api_key)
         place_ids_to_try = [pid for pid in [client_pid, place_id_geo, city_pid] if pid]
         # Known overrides for cities where Geoapify returns multiple PIDs; prefer stable one
         known_city_pid_overrides = {
@@ -1273,64 +1878,56 @@ def search_transport(request):
             { 'mode': 'circle', 'categories': 'public_transport', 'radius': radius_m, 'limit': max(30, limit), 'timeout': 12 },
             { 'mode': 'circle', 'categories': 'public_transport.station,public_transport.subway,public_transport.bus', 'radius': max(12000, radius_m * 2), 'limit': max(40, limit), 'timeout': 10 },
         ])
+        # Explicit city place_id as last resort
+        if city_pid:
+            attempt_specs.append({ 'mode': 'place', 'place_id': city_pid, 'categories': 'public_transport', 'limit': max(30, limit), 'timeout': 10 })
 
-        raw = None
+        attempts = []
+        specs = []
         for spec in attempt_specs:
-            try:
-                params_iter = {
-                    'categories': spec['categories'],
-                    'lang': 'en',
-                    'limit': int(spec['limit']),
-                    'apiKey': api_key,
-                }
-                if spec['mode'] == 'place' and spec.get('place_id'):
-                    params_iter['filter'] = f"place:{spec['place_id']}"
-                else:
-                    rad = int(spec.get('radius', radius_m))
-                    params_iter['filter'] = f'circle:{geo["lon"]},{geo["lat"]},{rad}'
-                    params_iter['bias'] = f'proximity:{geo["lon"]},{geo["lat"]}'
-                url_iter = f'https://api.geoapify.com/v2/places?{urlencode(params_iter)}'
-                print(f"[transport] attempt mode={spec['mode']} cats={spec['categories']} limit={params_iter['limit']} url={url_iter}")
-                r_iter = requests.get(url_iter, timeout=spec['timeout'])
-                r_iter.raise_for_status()
-                raw = r_iter.json()
-                feats = raw.get('features', [])
-                print(f"[transport] attempt result features={len(feats)}")
-                if feats:
-                    break
-            except (requests.ReadTimeout, requests.Timeout, requests.HTTPError) as e:
-                print(f"[transport] attempt failed: {e}")
-                continue
-        # If still empty, try explicit city place_id as last resort
-        feats = raw.get('features', []) if isinstance(raw, dict) else []
-        if not feats:
-            city_pid = _geoapify_city_place_id(destination, api_key)
-            if city_pid:
-                try:
-                    params_city = {
-                        'categories': 'public_transport',
-                        'filter': f'place:{city_pid}',
-                        'limit': max(30, limit),
-                        'apiKey': api_key,
-                    }
-                    url_city = f'https://api.geoapify.com/v2/places?{urlencode(params_city)}'
-                    print(f"[transport] city-place fallback url={url_city}")
-                    r_city = requests.get(url_city, timeout=10)
-                    r_city.raise_for_status()
-                    raw = r_city.json()
-                    feats = raw.get('features', [])
-                    print(f"[transport] city-place fallback features={len(feats)}")
-                except Exception as e:
-                    print(f"[transport] city-place fallback failed: {e}")
-                    feats = []
-        if raw is None or not feats:
-            print(f"[transport] final 0 items for destination='{destination}' lat={geo['lat']} lon={geo['lon']}")
-            return Response({'success': True, 'data': {'items': [], 'total': 0, 'center': geo}}, status=200)
+            params_iter = {
+                'categories': spec['categories'],
+                'lang': 'en',
+                'limit': int(spec['limit']),
+                'apiKey': api_key,
+            }
+            if spec['mode'] == 'place' and spec.get('place_id'):
+                params_iter['filter'] = f"place:{spec['place_id']}"
+            else:
+                spec['radius'] = rad = int(spec.get('radius', radius_m))
+                params_iter['filter'] = f'circle:{geo["lon"]},{geo["lat"]},{rad}'
+                params_iter['bias'] = f'proximity:{geo["lon"]},{geo["lat"]}'
+            url_iter = f'https://api.geoapify.com/v2/places?{urlencode(params_iter)}'
+            # The same place id can come from several sources; query it once
+            if all(url_iter != url for url, _timeout in attempts):
+                attempts.append((url_iter, spec['timeout']))
+                specs.append(spec)
+
+        # Nearest stops from the tile cache first; the hedged query ladder only on a miss
+        tiled = await sync_to_async(_geoapify_tiled_places)(geo['lat'], geo['lon'], 'public_transport', api_key, limit=max(30, limit), radius_m=radius_m)
+        if tiled is not None and tiled.get('features'):
+            outcome = {'index': None, 'data': tiled, 'stopped': 'tiles', 'tiles': tiled.get('tiles')}
+        else:
+            outcome = await hedged_get_json(
+                attempts,
+                accept=lambda data: isinstance(data, dict) and bool(data.get('features')),
+                width=settings.TRANSPORT_HEDGE_WIDTH,
+                deadline=settings.TRANSPORT_DEADLINE,
+                provider='geoapify',
+            )
+        raw = outcome.pop('data')
+        winner = outcome.pop('index')
+        attempt = {**outcome, 'candidates': len(attempts), 'index': winner,
+                   'spec': _transport_spec_label(specs[winner]) if winner is not None else None}
+        logger.info("[transport] destination=%r attempt=%s", destination, attempt)
+        if raw is None:
+            return JsonResponse({'success': True, 'data': {'items': [], 'total': 0, 'center': geo, 'attempt': attempt}}, status=200)
         features = raw.get('features', [])
         items = []
         seen_ids = set()
         seen_keys = set()
-        for f in features:
+        distances = _feature_distances_km(geo, features)
+        for f, distance_km in zip(features, distances):
             props = f.get('properties', {})
             fid = props.get('place_id') or props.get('osm_id') or props.get('gid')
             name_en = _extract_english_name(props)
@@ -1339,12 +1936,6 @@ def search_transport(request):
             primary_cat = cats[0] if cats else (props.get('category') or 'public_transport')
             lat = props.get('lat') or (f.get('geometry', {}).get('coordinates', [None, None])[1])
             lon = props.get('lon') or (f.get('geometry', {}).get('coordinates', [None, None])[0])
-            distance_km = None
-            try:
-                if lat and lon:
-                    distance_km = _km_distance(geo['lat'], geo['lon'], float(lat), float(lon))
-            except Exception:
-                distance_km = None
             # De-duplicate by place_id first, then by name+address+coords signature
             sig_id = str(fid) if fid is not None else None
             if sig_id and sig_id in seen_ids:
@@ -1370,23 +1961,78 @@ def search_transport(request):
                 'convenience': None,
                 'features': cats,
                 'address': props.get('formatted'),
-                'distance_km': round(distance_km, 2) if distance_km is not None else None,
+                'distance_km': distance_km,
                 'lat': lat,
                 'lon': lon,
                 'raw': props,
             })
-        print(f"[transport] final {len(items)} items for destination='{destination}'")
-        return Response({'success': True, 'data': {'items': items, 'total': len(items), 'center': geo}})
-    except requests.HTTPError as e:
-        return Response({'success': False, 'error': f'Geoapify HTTP error: {str(e)}'}, status=502)
+        logger.info("[transport] final %s items for destination=%r", len(items), destination)
+        return JsonResponse({'success': True, 'data': {'items': items, 'total': len(items), 'center': geo, 'attempt': attempt}})
+    except QuotaExceeded:
+        raise
     except Exception as e:
-        return Response({'success': False, 'error': f'Failed to search transport: {str(e)}'}, status=500)
+        return JsonResponse({'success': False, 'error': f'Failed to search transport: {str(e)}'}, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def nearby_places(request):
+    """Query the local places catalog; never calls Geoapify.
+    Query: lat, lon with radius_meters? (default 5000) or k (nearest k), or
+    bbox=lon_min,lat_min,lon_max,lat_max; categories? (comma-separated), limit? (default 50)
+    """
+    catalog = get_catalog()
+    if catalog is None:
+        return Response({'success': False, 'error': 'Places catalog is disabled'}, status=503)
+    params = request.query_params
+    categories = _as_list(params.get('categories'))
+    try:
+        limit = min(max(int(params.get('limit', 50)), 1), settings.PLACES_NEARBY_MAX_RESULTS)
+        bbox = [float(v) for v in _as_list(params.get('bbox'))]
+        lat = float(params['lat']) if params.get('lat') not in (None, '') else None
+        lon = float(params['lon']) if params.get('lon') not in (None, '') else None
+        radius_m = float(params.get('radius_meters', 5000))
+        k = int(params['k']) if params.get('k') not in (None, '') else None
+    except (TypeError, ValueError):
+        return Response({'success': False, 'error': 'lat, lon, radius_meters, k, limit and bbox must be numbers'}, status=400)
+    if bbox and len(bbox) != 4:
+        return Response({'success': False, 'error': 'bbox must be lon_min,lat_min,lon_max,lat_max'}, status=400)
+    if not bbox and (lat is None or lon is None):
+        return Response({'success': False, 'error': 'lat and lon (or bbox) are required'}, status=400)
+
+    index = catalog.index()
+    if bbox:
+        mode = 'bbox'
+        lon_min, lat_min, lon_max, lat_max = bbox
+        found = [(None, f) for f in index.bbox(lat_min, lon_min, lat_max, lon_max, categories, limit=limit)]
+    elif k is not None:
+        mode = 'nearest'
+        found = index.nearest(lat, lon, min(max(k, 1), limit), categories, max_km=radius_m / 1000 if 'radius_meters' in params else None)
+    else:
+        mode = 'radius'
+        found = index.radius(lat, lon, radius_m / 1000, categories, limit=limit)
+    items = []
+    for distance_km, feature in found:
+        props = feature.get('properties') or {}
+        cats = props.get('categories') or []
+        items.append({
+            'id': str(props.get('place_id') or props.get('osm_id') or ''),
+            'name': _extract_english_name(props) or props.get('name') or props.get('address_line1') or 'Unknown',
+            'type': cats[0] if cats else props.get('category'),
+            'categories': cats,
+            'address': props.get('formatted'),
+            'lat': props.get('lat'),
+            'lon': props.get('lon'),
+            'distance_km': round(distance_km, 2) if distance_km is not None else None,
+        })
+    return Response({'success': True, 'data': {'items': items, 'total': len(items), 'mode': mode, 'indexed': len(index)}})
 
 
 # ---------------------- Itinerary Generation ----------------------
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@metered('places.guide')
 def place_ai_guide(request):
     """Generate a detailed place guide using OpenAI only (no external tools)."""
     try:
@@ -1439,6 +2085,7 @@ def place_ai_guide(request):
             }
         }
 
+        charge('openai')
         completion = client.chat.completions.create(
             model=(settings.OPENAI_MODEL or "gpt-4o-mini"),
             temperature=0.2,
@@ -1454,6 +2101,8 @@ def place_ai_guide(request):
             data = {"raw": content}
 
         return Response({"success": True, "data": data}, status=200)
+    except QuotaExceeded:
+        raise
     except Exception as e:
         return Response({"success": False, "error": f"Failed to generate guide: {str(e)}"}, status=500)
 
@@ -1677,6 +2326,7 @@ logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@metered('itinerary.auto')
 def generate_full_itinerary(request, trip_id):
     """Multi-agent style orchestration to auto-generate a full itinerary.
     - Tries to fetch flights and hotels using existing agents; if none, fabricates plausible options
@@ -1705,40 +2355,67 @@ def generate_full_itinerary(request, trip_id):
         user_country = (body.get('country') or '').lower() or None
 
         # Geo context for destination
-        geo = _geoapify_geocode(trip.destination, _get_geoapify_key(request)) or {}
+        stored_geo = _trip_geo(trip, _get_geoapify_key(request))
+        geo = stored_geo.as_geo() if stored_geo else {}
         logger.info("[itinerary:auto] geo context: %s", {k: geo.get(k) for k in ['city','country','lat','lon','place_id']})
         dest_country = (geo.get('country') or '').lower() or None
 
-        # 1) Flights
-        selected_flight = None
-        try:
-            if get_flight_agent and settings.SERPAPI_KEY and settings.OPENAI_API_KEY:
+        # 1) + 2) Flights and hotels, searched concurrently on one event loop
+        have_agent_keys = bool(settings.SERPAPI_KEY and settings.OPENAI_API_KEY)
+        flight_call = None
+        hotel_call = None
+        if get_flight_agent and have_agent_keys:
+            try:
                 agent = get_flight_agent()
-                res = None
-                import asyncio
-                async def do():
-                    return await agent.search_and_recommend_flights(
-                        origin=origin or 'DEL',  # fallback hub for robustness
-                        destination=trip.destination,
-                        departure_date=str(start),
-                        return_date=str(end),
-                        adults=max(int(trip.travelers or 1), 1),
-                        cabin_class='economy',
-                        preferences=None,
-                        country=user_country or dest_country,
-                    )
-                loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
-                try:
-                    res = loop.run_until_complete(do())
-                finally:
-                    loop.close()
-                flights = (res or {}).get('data', {}).get('flights') or []
-                if flights:
-                    # Best value first
-                    selected_flight = flights[0]
-        except Exception as e:
-            logger.exception("[itinerary:auto] flight agent failed: %s", e)
-            selected_flight = None
+                flight_call = lambda: agent.search_and_recommend_flights(
+                    origin=origin or 'DEL',  # fallback hub for robustness
+                    destination=trip.destination,
+                    departure_date=str(start),
+                    return_date=str(end),
+                    adults=max(int(trip.travelers or 1), 1),
+                    cabin_class='economy',
+                    preferences=None,
+                    country=user_country or dest_country,
+                )
+            except Exception as e:
+                logger.exception("[itinerary:auto] flight agent failed: %s", e)
+        if get_hotel_agent and have_agent_keys:
+            try:
+                hotel_agent = get_hotel_agent()
+                hotel_call = lambda: hotel_agent.search_and_recommend_hotels(
+                    destination=trip.destination,
+                    check_in_date=str(start),
+                    check_out_date=str(end),
+                    adults=max(int(trip.travelers or 1), 1),
+                    currency='USD',
+                    country=dest_country or 'us',
+                    language='en',
+                    budget_max=None,
+                )
+            except Exception as e:
+                logger.exception("[itinerary:auto] hotel agent failed: %s", e)
+
+        async def search_flights_and_hotels():
+            async def none():
+                return None
+            return await asyncio.gather(
+                flight_call() if flight_call else none(),
+                hotel_call() if hotel_call else none(),
+                return_exceptions=True,
+            )
+
+        flight_res, hotel_res = (None, None)
+        if flight_call or hotel_call:
+            flight_res, hotel_res = async_to_sync(search_flights_and_hotels)()
+
+        selected_flight = None
+        if isinstance(flight_res, BaseException):
+            logger.error("[itinerary:auto] flight agent failed: %s", flight_res)
+        else:
+            flights = (flight_res or {}).get('data', {}).get('flights') or []
+            if flights:
+                # Best value first
+                selected_flight = flights[0]
         if not selected_flight:
             # Fabricate a plausible flight
             selected_flight = {
@@ -1754,35 +2431,13 @@ def generate_full_itinerary(request, trip_id):
                 'type': 'Round-trip',
             }
 
-        # 2) Hotels
         selected_hotel = None
-        try:
-            if get_hotel_agent and settings.SERPAPI_KEY and settings.OPENAI_API_KEY:
-                hotel_agent = get_hotel_agent()
-                res = None
-                import asyncio
-                async def do_h():
-                    return await hotel_agent.search_and_recommend_hotels(
-                        destination=trip.destination,
-                        check_in_date=str(start),
-                        check_out_date=str(end),
-                        adults=max(int(trip.travelers or 1), 1),
-                        currency='USD',
-                        country=dest_country or 'us',
-                        language='en',
-                        budget_max=None,
-                    )
-                loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
-                try:
-                    res = loop.run_until_complete(do_h())
-                finally:
-                    loop.close()
-                hotels = (res or {}).get('data', {}).get('hotels') or []
-                if hotels:
-                    selected_hotel = hotels[0]
-        except Exception as e:
-            logger.exception("[itinerary:auto] hotel agent failed: %s", e)
-            selected_hotel = None
+        if isinstance(hotel_res, BaseException):
+            logger.error("[itinerary:auto] hotel agent failed: %s", hotel_res)
+        else:
+            hotels = (hotel_res or {}).get('data', {}).get('hotels') or []
+            if hotels:
+                selected_hotel = hotels[0]
         if not selected_hotel:
             selected_hotel = {
                 'id': 'hotel_placeholder',
@@ -1796,22 +2451,17 @@ def generate_full_itinerary(request, trip_id):
                 'priceCategory': 'comfort',
             }
 
-        # 3) Places via Geoapify
-        def try_places(categories: str, limit: int = 24, radius_m: int = 15000):
-            api_key = _get_geoapify_key(request)
-            if not geo:
-                return []
-            try:
-                logger.info("[itinerary:auto] geoapify places categories=%s limit=%s radius=%s", categories, limit, radius_m)
-                raw = _geoapify_places(geo['lat'], geo['lon'], categories, api_key, limit=limit, radius_m=radius_m, name=None, place_id=geo.get('place_id'))
-            except requests.HTTPError as http_err:
-                logger.warning("[itinerary:auto] geoapify place: HTTPError (place filter), falling back to circle: %s", http_err)
-                raw = _geoapify_places(geo['lat'], geo['lon'], categories, api_key, limit=limit, radius_m=radius_m, name=None, place_id=None)
-            except Exception as e:
-                logger.exception("[itinerary:auto] geoapify place fetch failed: %s", e)
-                return []
+        # 3) Places via Geoapify: the three categories are fetched in parallel
+        place_buckets = {
+            'attractions': {'categories': 'tourism.attraction', 'limit': 24, 'radius_m': 15000},
+            'restaurants': {'categories': 'catering.restaurant,catering.cafe,catering.fast_food', 'limit': 20, 'radius_m': 15000},
+            'transports': {'categories': 'public_transport', 'limit': 15, 'radius_m': 8000},
+        }
+        place_features = _geoapify_places_by_category(geo, place_buckets, _get_geoapify_key(request)) if geo else {}
+
+        def place_items(bucket: str):
             items = []
-            for f in raw.get('features', []) or []:
+            for f in place_features.get(bucket) or []:
                 p = f.get('properties') or {}
                 try:
                     items.append({
@@ -1828,12 +2478,12 @@ def generate_full_itinerary(request, trip_id):
                 except Exception as map_err:
                     logger.warning("[itinerary:auto] geoapify place map error: %s", map_err)
                     continue
-            logger.info("[itinerary:auto] geoapify places ok categories=%s count=%s", categories, len(items))
+            logger.info("[itinerary:auto] geoapify places ok bucket=%s count=%s", bucket, len(items))
             return items
 
-        attractions = try_places('tourism.attraction', limit=24)
-        restaurants = try_places('catering.restaurant,catering.cafe,catering.fast_food', limit=20)
-        transports = try_places('public_transport', limit=15, radius_m=8000)
+        attractions = place_items('attractions')
+        restaurants = place_items('restaurants')
+        transports = place_items('transports')
 
         # 4) Events (best-effort)
         events_list = []
@@ -1978,6 +2628,7 @@ def generate_full_itinerary(request, trip_id):
                         ]
                     }
                 }
+                charge('openai')
                 comp = client.chat.completions.create(
                     model=(settings.OPENAI_MODEL or 'gpt-4o-mini'),
                     temperature=0.2,
@@ -2171,6 +2822,8 @@ def generate_full_itinerary(request, trip_id):
         ser = TripItinerarySerializer(itinerary)
         logger.info("[itinerary:auto] success trip_id=%s activities_days=%s", str(trip_id), len(day_plans))
         return Response({'success': True, 'data': ser.data})
+    except QuotaExceeded:
+        raise
     except Exception as e:
         logger.exception("[itinerary:auto] unhandled error for trip_id=%s: %s", str(trip_id), e)
         return Response({'success': False, 'error': f'Failed to generate full itinerary: {str(e)}'}, status=500)
@@ -2178,6 +2831,7 @@ def generate_full_itinerary(request, trip_id):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@metered('budget.estimate')
 def estimate_budget(request, trip_id):
     """Estimate/fill missing prices for selected stage items using OpenAI.
     Updates TripItems and TripPlanningStage.selected_items in place, then returns a summary.
@@ -2198,7 +2852,8 @@ def estimate_budget(request, trip_id):
             pass
 
         # Destination context (city/country) for better estimates
-        geo_ctx = _geoapify_geocode(trip.destination, _get_geoapify_key(request)) or {}
+        stored_geo = _trip_geo(trip, _get_geoapify_key(request))
+        geo_ctx = stored_geo.as_geo() if stored_geo else {}
         city = geo_ctx.get('city') or trip.destination
         country = geo_ctx.get('country') or ''
         logger.info("[budget:estimate] geo ctx city=%s country=%s", city, country)
@@ -2259,6 +2914,7 @@ def estimate_budget(request, trip_id):
             'country': str(country or ''),
             'items': candidates,
         }
+        charge('openai')
         comp = client.chat.completions.create(
             model=(settings.OPENAI_MODEL or 'gpt-4o-mini'),
             temperature=0.2,
@@ -2279,6 +2935,7 @@ def estimate_budget(request, trip_id):
         if not estimates and len(candidates) > 0:
             try:
                 retry_prompt = system_prompt + "\nAlways echo the provided id and name exactly. Do not return empty lists."
+                charge('openai')
                 comp2 = client.chat.completions.create(
                     model=(settings.OPENAI_MODEL or 'gpt-4o-mini'),
                     temperature=0.2,
@@ -2408,5 +3065,30 @@ def estimate_budget(request, trip_id):
 
         logger.info("[budget:estimate] done trip_id=%s estimates=%s updated=%s defaults_applied=%s", str(trip_id), len(estimates), updated, defaults_applied)
         return Response({'success': True, 'data': {'updated': updated, 'estimates_count': len(estimates), 'defaults_applied': defaults_applied}})
+    except QuotaExceeded:
+        raise
     except Exception as e:
         return Response({'success': False, 'error': f'Failed to estimate budget: {str(e)}'}, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def system_stats(request):
+    """Upstream cache, request-coalescing, call-budget and HTTP pool state of the worker serving the request"""
+    from .cache import cache_stats
+    from .coalesce import coalesce_stats
+    from .quota import get_quota
+    from .upstream import pool_stats
+
+    return Response({
+        'success': True,
+        'data': {
+            'pid': os.getpid(),
+            'caches': cache_stats(),
+            'coalescing': coalesce_stats(),
+            'quota': get_quota().stats(),
+            'http_pools': pool_stats(),
+            'poi_tiles': poi_tile_stats(),
+            'places_catalog': catalog_stats(),
+        }
+    })
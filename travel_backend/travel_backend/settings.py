@@ -222,3 +222,126 @@ else:
 OPENAI_API_KEY = config('OPENAI_API_KEY', default=None)
 OPENAI_MODEL = config('OPENAI_MODEL', default='gpt-4o-mini')
 SERPAPI_KEY = config('SERPAPI_KEY', default=None)
+
+
+# ---------------------- Upstream result caching ----------------------
+# 'shared' is visible to every gunicorn worker. Use a file directory (default) or switch
+# SHARED_CACHE_BACKEND to django.core.cache.backends.db.DatabaseCache with a table name as
+# SHARED_CACHE_LOCATION (then run `python manage.py createcachetable`).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': config('SHARED_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('SHARED_CACHE_LOCATION', default=str(BASE_DIR / '.cache')),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': config('SHARED_CACHE_MAX_ENTRIES', default=5000, cast=int)},
+    },
+}
+
+# Backend for search result caches: 'local' (per-process LRU) or a CACHES alias
+SEARCH_CACHE_BACKEND = config('SEARCH_CACHE_BACKEND', default='shared')
+SEARCH_CACHE_LOCAL_MAX_ENTRIES = config('SEARCH_CACHE_LOCAL_MAX_ENTRIES', default=1024, cast=int)
+
+# Flight results: fresh for FLIGHT_CACHE_TTL seconds, then served stale while refreshing
+# for another FLIGHT_CACHE_STALE_TTL seconds. FLIGHT_CACHE_TTL=0 disables the cache.
+FLIGHT_CACHE_TTL = config('FLIGHT_CACHE_TTL', default=900, cast=int)
+FLIGHT_CACHE_STALE_TTL = config('FLIGHT_CACHE_STALE_TTL', default=1800, cast=int)
+
+# Hotel property lists per (destination, dates, adults, currency, gl, hl): fresh for
+# HOTEL_CACHE_TTL seconds, then stale-while-revalidate for HOTEL_CACHE_STALE_TTL seconds.
+# budget_max is applied after the cache. HOTEL_CACHE_TTL=0 disables the cache.
+HOTEL_CACHE_TTL = config('HOTEL_CACHE_TTL', default=1800, cast=int)
+HOTEL_CACHE_STALE_TTL = config('HOTEL_CACHE_STALE_TTL', default=1800, cast=int)
+
+# Hotel searches with min_results follow result pages (one SerpAPI call each) up to
+# HOTEL_MAX_PAGES pages or HOTEL_PAGINATION_TIME_BUDGET seconds
+HOTEL_MAX_PAGES = config('HOTEL_MAX_PAGES', default=3, cast=int)
+HOTEL_PAGINATION_TIME_BUDGET = config('HOTEL_PAGINATION_TIME_BUDGET', default=8.0, cast=float)
+
+# Largest page_size accepted by /api/hotels/query/
+HOTEL_QUERY_MAX_PAGE_SIZE = config('HOTEL_QUERY_MAX_PAGE_SIZE', default=50, cast=int)
+
+# Geoapify geocode/place-id lookups: found results for GEOCODE_CACHE_TTL seconds, "not found"
+# for GEOCODE_NEGATIVE_TTL seconds (0: never cached); failed lookups are never cached
+GEOCODE_CACHE_TTL = config('GEOCODE_CACHE_TTL', default=7 * 86400, cast=int)
+GEOCODE_NEGATIVE_TTL = config('GEOCODE_NEGATIVE_TTL', default=300, cast=int)
+
+# /api/places/transport/ runs its fallback queries hedged: this many in flight at once
+# (1 restores the serial ladder), first non-empty in priority order wins, and the whole
+# search gives up after TRANSPORT_DEADLINE seconds
+TRANSPORT_HEDGE_WIDTH = config('TRANSPORT_HEDGE_WIDTH', default=3, cast=int)
+TRANSPORT_DEADLINE = config('TRANSPORT_DEADLINE', default=20.0, cast=float)
+
+# Geoapify places are cached per geohash tile and category (travel/poi_tiles.py) for
+# POI_TILE_TTL seconds (0 disables tiling). POI_TILE_PRECISION is the geohash length,
+# POI_TILE_FETCH_LIMIT the features requested per tile, and a query that needs more than
+# POI_TILE_MAX_FETCH uncached tiles goes straight to Geoapify instead. A tile that fills a
+# fetch is split into sub-cells, down to POI_TILE_MAX_PRECISION characters
+POI_TILE_TTL = config('POI_TILE_TTL', default=3 * 86400, cast=int)
+POI_TILE_PRECISION = config('POI_TILE_PRECISION', default=4, cast=int)
+POI_TILE_MAX_PRECISION = config('POI_TILE_MAX_PRECISION', default=7, cast=int)
+POI_TILE_FETCH_LIMIT = config('POI_TILE_FETCH_LIMIT', default=200, cast=int)
+POI_TILE_MAX_FETCH = config('POI_TILE_MAX_FETCH', default=9, cast=int)
+
+# Fetched tiles are also stored as Place rows (travel/places_catalog.py) and answer
+# queries for PLACES_CATALOG_MAX_AGE seconds (0 disables the catalog). /api/places/nearby/
+# queries a grid index of PLACES_GRID_CELL_DEG degree cells, checked for catalog changes
+# every PLACES_INDEX_REFRESH seconds and returning at most PLACES_NEARBY_MAX_RESULTS places
+PLACES_CATALOG_MAX_AGE = config('PLACES_CATALOG_MAX_AGE', default=14 * 86400, cast=int)
+PLACES_GRID_CELL_DEG = config('PLACES_GRID_CELL_DEG', default=0.05, cast=float)
+PLACES_INDEX_REFRESH = config('PLACES_INDEX_REFRESH', default=60.0, cast=float)
+PLACES_NEARBY_MAX_RESULTS = config('PLACES_NEARBY_MAX_RESULTS', default=200, cast=int)
+
+# Negative memo: (route, date, gl) combinations that returned zero flights are skipped for
+# FLIGHT_NEGATIVE_TTL seconds; the gl that produced results is tried first next time.
+FLIGHT_NEGATIVE_TTL = config('FLIGHT_NEGATIVE_TTL', default=600, cast=int)
+
+# Widest departure window (in days) accepted by /api/flights/calendar/; each day is one search
+FLIGHT_CALENDAR_MAX_DAYS = config('FLIGHT_CALENDAR_MAX_DAYS', default=31, cast=int)
+
+# Most legs accepted by /api/flights/batch/; each leg is a full staged search
+FLIGHT_BATCH_MAX_LEGS = config('FLIGHT_BATCH_MAX_LEGS', default=8, cast=int)
+
+# Identical concurrent SerpAPI/Geoapify calls share one request within a process. Set
+# COALESCE_LOCK_CACHE to a CACHES alias (e.g. 'shared') to also share them across workers:
+# other workers wait up to COALESCE_LOCK_TIMEOUT seconds for the lock holder's result.
+COALESCE_LOCK_CACHE = config('COALESCE_LOCK_CACHE', default='')
+COALESCE_LOCK_TIMEOUT = config('COALESCE_LOCK_TIMEOUT', default=30, cast=int)
+
+# Upstream call budget (travel/quota.py): calls per minute and burst size per provider,
+# split evenly over QUOTA_PROCESS_COUNT worker processes. One user may use at most
+# QUOTA_USER_SHARE of a provider's budget. Over-budget requests get 429 + Retry-After.
+QUOTA_ENABLED = config('QUOTA_ENABLED', default=True, cast=bool)
+QUOTA_PROCESS_COUNT = config('QUOTA_PROCESS_COUNT', default=1, cast=int)
+QUOTA_USER_SHARE = config('QUOTA_USER_SHARE', default=0.25, cast=float)
+UPSTREAM_QUOTAS = {
+    'serpapi': {
+        'per_minute': config('QUOTA_SERPAPI_PER_MINUTE', default=120, cast=int),
+        'burst': config('QUOTA_SERPAPI_BURST', default=240, cast=int),
+    },
+    'geoapify': {
+        'per_minute': config('QUOTA_GEOAPIFY_PER_MINUTE', default=300, cast=int),
+        'burst': config('QUOTA_GEOAPIFY_BURST', default=300, cast=int),
+    },
+    'openai': {
+        'per_minute': config('QUOTA_OPENAI_PER_MINUTE', default=60, cast=int),
+        'burst': config('QUOTA_OPENAI_BURST', default=60, cast=int),
+    },
+}
+
+# Synchronous upstream calls (Geoapify, Ticketmaster) reuse keep-alive connections from one
+# pool per host and process; size it to the number of threads that call a host at once
+UPSTREAM_POOL_MAXSIZE = config('UPSTREAM_POOL_MAXSIZE', default=10, cast=int)
+UPSTREAM_POOL_SIZES = {
+    'api.geoapify.com': config('UPSTREAM_POOL_GEOAPIFY', default=20, cast=int),
+}
+UPSTREAM_CONNECT_TIMEOUT = config('UPSTREAM_CONNECT_TIMEOUT', default=5.0, cast=float)
+UPSTREAM_READ_TIMEOUT = config('UPSTREAM_READ_TIMEOUT', default=30.0, cast=float)
+
+# Price watch (python manage.py refresh_prices [--loop]): re-prices saved flight/hotel
+# selections of trips starting within PRICE_WATCH_HORIZON_DAYS, every PRICE_WATCH_INTERVAL seconds
+PRICE_WATCH_HORIZON_DAYS = config('PRICE_WATCH_HORIZON_DAYS', default=90, cast=int)
+PRICE_WATCH_INTERVAL = config('PRICE_WATCH_INTERVAL', default=6 * 3600, cast=int)
+PRICE_WATCH_CONCURRENCY = config('PRICE_WATCH_CONCURRENCY', default=4, cast=int)